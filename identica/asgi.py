@@ -2,4 +2,6 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'identica.settings')
+# Под ASGI страницы каталога обслуживаются асинхронными представлениями
+os.environ.setdefault('DIRECTORY_VIEWS_ASYNC', '1')
 application = get_asgi_application()
\ No newline at end of file
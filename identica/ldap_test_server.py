@@ -1,6 +1,9 @@
 """
 Тестовый LDAP сервер для разработки на Windows
 """
+import threading
+import time
+
 # Тестовые данные LDAP для разработки
 LDAP_TEST_USERS = {
     'student1': {
@@ -39,4 +42,214 @@ LDAP_TEST_GROUPS = {
     'monitors': ['monitor1'],
     'staff': ['admin'],
     'admins': ['admin']
-}
\ No newline at end of file
+}
+
+# Встроенная замена LDAP сервера: те же пользователи и группы, но в виде
+# записей каталога. Используется клиентом profiles.ldap_client, если
+# LDAP_SERVER_URI не задан, а также в тестах и бенчмарках.
+
+BASE_DN = 'dc=identica,dc=local'
+USER_BASE_DN = f'ou=people,{BASE_DN}'
+GROUP_BASE_DN = f'ou=groups,{BASE_DN}'
+
+LDAP_TEST_SERVICE_DN = f'cn=identica,ou=services,{BASE_DN}'
+LDAP_TEST_SERVICE_PASSWORD = 'service123'
+
+SEED_TIMESTAMP = '20240901000000Z'
+
+
+def generalized_time(timestamp=None):
+    """Время в формате LDAP GeneralizedTime (UTC)"""
+    return time.strftime('%Y%m%d%H%M%SZ', time.gmtime(timestamp))
+
+
+class InProcessLDAPServer:
+    """Каталог в памяти процесса с имитацией задержки и недоступности"""
+
+    def __init__(self, users=None, latency=0.0):
+        self.latency = latency
+        self.available = True
+        self.connections_opened = 0
+        self.binds = 0
+        self.searches = 0
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._passwords = {LDAP_TEST_SERVICE_DN: LDAP_TEST_SERVICE_PASSWORD}
+        users = LDAP_TEST_USERS if users is None else users
+        for username, user_data in users.items():
+            self.add_user(username, user_data, modify_timestamp=SEED_TIMESTAMP)
+
+    def add_user(self, username, user_data, modify_timestamp=None):
+        """Добавляет или изменяет пользователя, обновляя modifyTimestamp"""
+        dn = f'uid={username},{USER_BASE_DN}'
+        stamp = modify_timestamp or generalized_time()
+        groups = user_data.get('groups', [])
+        attrs = {
+            'objectClass': ['inetOrgPerson'],
+            'uid': [username],
+            'mail': [user_data.get('email', '')],
+            'givenName': [user_data.get('first_name', '')],
+            'sn': [user_data.get('last_name', '')],
+            'memberOf': [f'cn={group},{GROUP_BASE_DN}' for group in groups],
+            'modifyTimestamp': [stamp],
+        }
+        for key in ('employeeNumber', 'departmentNumber', 'ou'):
+            if user_data.get(key):
+                attrs[key] = [str(user_data[key])]
+
+        with self._lock:
+            old = self._entries.get(dn)
+            for group_dn in (old or {}).get('memberOf', []):
+                members = self._entries.get(group_dn, {}).get('member', [])
+                if dn in members:
+                    members.remove(dn)
+            for group in groups:
+                group_dn = f'cn={group},{GROUP_BASE_DN}'
+                group_entry = self._entries.setdefault(group_dn, {
+                    'objectClass': ['groupOfNames'],
+                    'cn': [group],
+                    'member': [],
+                })
+                group_entry['member'].append(dn)
+                group_entry['modifyTimestamp'] = [stamp]
+            self._entries[dn] = attrs
+            if 'password' in user_data:
+                self._passwords[dn] = user_data['password']
+
+    def connect(self, connect_timeout=None, read_timeout=None):
+        if not self.available:
+            raise ConnectionRefusedError('LDAP сервер недоступен')
+        with self._lock:
+            self.connections_opened += 1
+        return InProcessLDAPConnection(self, read_timeout)
+
+    def snapshot(self):
+        with self._lock:
+            return sorted(self._entries.items())
+
+    def check_password(self, dn, password):
+        with self._lock:
+            self.binds += 1
+            return bool(password) and self._passwords.get(dn) == password
+
+
+class InProcessLDAPConnection:
+    """Соединение с InProcessLDAPServer с тем же интерфейсом, что и у реального клиента"""
+
+    def __init__(self, server, read_timeout=None):
+        self.server = server
+        self.read_timeout = read_timeout
+        self.bound_dn = None
+
+    def _round_trip(self):
+        if not self.server.available:
+            raise ConnectionResetError('LDAP сервер недоступен')
+        latency = self.server.latency
+        if latency:
+            if self.read_timeout and latency > self.read_timeout:
+                time.sleep(self.read_timeout)
+                raise TimeoutError('Превышено время ожидания ответа LDAP')
+            time.sleep(latency)
+
+    def bind(self, dn, password):
+        self._round_trip()
+        if self.server.check_password(dn, password):
+            self.bound_dn = dn
+            return True
+        self.bound_dn = None
+        return False
+
+    def search(self, base_dn, filterstr, attributes=None, page_size=None, cookie=None):
+        """Возвращает (записи, cookie следующей страницы)"""
+        self._round_trip()
+        if self.bound_dn is None:
+            raise PermissionError('Поиск без привязки запрещен')
+        self.server.searches += 1
+        matcher = parse_filter(filterstr)
+        suffix = ',' + base_dn.lower()
+        found = [
+            (dn, attrs) for dn, attrs in self.server.snapshot()
+            if dn.lower().endswith(suffix) and matcher(attrs)
+        ]
+        offset = int(cookie or 0)
+        if page_size:
+            page = found[offset:offset + page_size]
+            next_cookie = str(offset + page_size) if offset + page_size < len(found) else None
+        else:
+            page, next_cookie = found, None
+        if attributes:
+            wanted = {name.lower() for name in attributes}
+            page = [
+                (dn, {key: list(value) for key, value in attrs.items() if key.lower() in wanted})
+                for dn, attrs in page
+            ]
+        else:
+            page = [(dn, {key: list(value) for key, value in attrs.items()}) for dn, attrs in page]
+        return page, next_cookie
+
+    def close(self):
+        self.bound_dn = None
+
+
+def _unescape(value):
+    result, i = [], 0
+    while i < len(value):
+        if value[i] == '\\' and i + 3 <= len(value):
+            result.append(chr(int(value[i + 1:i + 3], 16)))
+            i += 3
+        else:
+            result.append(value[i])
+            i += 1
+    return ''.join(result)
+
+
+def parse_filter(filterstr):
+    """Разбирает LDAP фильтр (&, |, !, =, =*, >=, <=) в функцию-предикат"""
+    matcher, rest = _parse(filterstr.strip())
+    if rest:
+        raise ValueError(f'Лишние символы в фильтре: {rest}')
+    return matcher
+
+
+def _parse(text):
+    if not text.startswith('('):
+        raise ValueError(f'Некорректный фильтр: {text}')
+    op = text[1]
+    if op in '&|!':
+        children, rest = [], text[2:]
+        while rest.startswith('('):
+            child, rest = _parse(rest)
+            children.append(child)
+        if not rest.startswith(')'):
+            raise ValueError(f'Некорректный фильтр: {text}')
+        if op == '&':
+            return (lambda attrs: all(child(attrs) for child in children)), rest[1:]
+        if op == '|':
+            return (lambda attrs: any(child(attrs) for child in children)), rest[1:]
+        return (lambda attrs: not children[0](attrs)), rest[1:]
+
+    end = text.index(')')
+    item, rest = text[1:end], text[end + 1:]
+    for operator in ('>=', '<=', '='):
+        if operator in item:
+            name, value = item.split(operator, 1)
+            break
+    else:
+        raise ValueError(f'Некорректное условие: {item}')
+    name = name.lower()
+    value = _unescape(value)
+
+    def values_of(attrs):
+        for key, values in attrs.items():
+            if key.lower() == name:
+                return values
+        return []
+
+    if operator == '=' and value == '*':
+        return (lambda attrs: bool(values_of(attrs))), rest
+    if operator == '>=':
+        return (lambda attrs: any(v >= value for v in values_of(attrs))), rest
+    if operator == '<=':
+        return (lambda attrs: any(v <= value for v in values_of(attrs))), rest
+    lowered = value.lower()
+    return (lambda attrs: any(v.lower() == lowered for v in values_of(attrs))), rest
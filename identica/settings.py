@@ -1,4 +1,5 @@
 import os
+import tempfile
 from pathlib import Path
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -19,12 +20,15 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'profiles.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'profiles.db_router.ReplicaPinMiddleware',
     # 'whitenoise.middleware.WhiteNoiseMiddleware',  # ЗАКОММЕНТИРУЙТЕ эту строку пока
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'profiles.middleware.StudentProfileMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -50,12 +54,74 @@ TEMPLATES = [
     },
 ]
 
+# SQLite в боевом режиме: WAL (читатели не ждут писателя), ожидание
+# блокировки вместо "database is locked", транзакции сразу берут блокировку
+# записи (BEGIN IMMEDIATE), соединения живут между запросами
+SQLITE_PRAGMAS = (
+    'PRAGMA journal_mode=WAL;'
+    'PRAGMA synchronous=NORMAL;'
+    'PRAGMA cache_size=-65536;'  # 64 МБ
+    'PRAGMA temp_store=MEMORY;'
+    'PRAGMA mmap_size=268435456;'
+    'PRAGMA foreign_keys=ON;'
+)
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'CONN_MAX_AGE': None,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'timeout': 20,  # busy_timeout, секунд
+            'transaction_mode': 'IMMEDIATE',
+            'init_command': SQLITE_PRAGMAS,
+        },
+    }
+}
+
+# Короткие записи (подписки, вход) выполняются по очереди внутри процесса
+SQLITE_WRITE_QUEUE = True
+
+# Реплика для чтения (копия db.sqlite3, см. команду snapshot_replica).
+# Представления с replica_reads читают из нее модели profiles; после записи
+# клиент DATABASE_REPLICA_LAG секунд читает из основной базы
+DATABASE_REPLICA = os.environ.get('DATABASE_REPLICA') or None
+DATABASE_REPLICA_LAG = 60  # секунд, не меньше интервала снимков
+if DATABASE_REPLICA:
+    DATABASES['replica'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': DATABASE_REPLICA,
+        # Снимок заменяется файлом целиком - соединение открывается на каждый запрос
+        'CONN_MAX_AGE': 0,
+        'OPTIONS': {
+            'timeout': 20,
+            'init_command': 'PRAGMA query_only=ON;PRAGMA cache_size=-65536;PRAGMA mmap_size=268435456;',
+        },
+        'TEST': {'MIRROR': 'default'},
+    }
+DATABASE_ROUTERS = ['profiles.db_router.ReplicaRouter']
+
+# Общий для воркеров кэш: версии каталога и пользователей, фрагменты шаблонов.
+# На студента - две версии и два фрагмента, MAX_ENTRIES рассчитан на ~100 тыс.
+# студентов с запасом; при переполнении удаляется десятая часть файлов
+CACHES = {
+    'default': {
+        'BACKEND': 'profiles.file_cache.IntervalCullFileBasedCache',
+        'LOCATION': os.environ.get('CACHE_DIR') or os.path.join(tempfile.gettempdir(), 'identica-cache'),
+        'TIMEOUT': 3600,
+        'OPTIONS': {
+            'MAX_ENTRIES': 500000,
+            'CULL_FREQUENCY': 10,
+            'CULL_INTERVAL': 60,  # секунд между проверками размера каталога
+        },
     }
 }
+TEST_RUNNER = 'identica.test_runner.IsolatedCacheRunner'
+
+# Добавка к ETag страниц пользователя: смените при выкладке новых шаблонов,
+# чтобы браузеры не получали 304 на старую разметку
+PAGE_ETAG_SALT = os.environ.get('PAGE_ETAG_SALT', '')
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -97,15 +163,63 @@ LOGIN_URL = '/accounts/login/'
 ADMIN_SITE_HEADER = "Identica - Администрирование"
 ADMIN_SITE_TITLE = "Identica Admin"
 ADMIN_INDEX_TITLE = "Панель управления Identica"
+ADMIN_COUNT_CACHE_TTL = 60  # секунд: число строк и границы страниц в списках админки
 
-# Простые настройки аутентификации
+# Аутентификация: маршрутизатор сам выбирает каталог (CustomLDAPBackend)
+# или локальные пароли (ModelBackend) и обращается только к одному из них
 AUTHENTICATION_BACKENDS = [
-    "profiles.ldap_backend.CustomLDAPBackend",
-    "django.contrib.auth.backends.ModelBackend",
+    "profiles.ldap_backend.RealmRouterBackend",
 ]
 
 # Группы для разных ролей в приложении (используются в утилитах)
 LDAP_STUDENT_GROUP = "students"
 LDAP_MONITOR_GROUP = "monitors"
 LDAP_STAFF_GROUP = "staff"
-LDAP_ADMIN_GROUP = "admins"
\ No newline at end of file
+LDAP_ADMIN_GROUP = "admins"
+
+# Подключение к каталогу. Пустой LDAP_SERVER_URI - встроенный тестовый
+# каталог из identica/ldap_test_server.py; для настоящего сервера нужен ldap3
+LDAP_SERVER_URI = os.environ.get('LDAP_SERVER_URI', '')
+LDAP_BIND_DN = os.environ.get('LDAP_BIND_DN', 'cn=identica,ou=services,dc=identica,dc=local')
+LDAP_BIND_PASSWORD = os.environ.get('LDAP_BIND_PASSWORD', '')
+LDAP_USER_BASE_DN = 'ou=people,dc=identica,dc=local'
+LDAP_GROUP_BASE_DN = 'ou=groups,dc=identica,dc=local'
+LDAP_POOL_SIZE = 10
+LDAP_POOL_TIMEOUT = 1  # ожидание свободного соединения, секунд
+LDAP_CONNECT_TIMEOUT = 2  # секунд
+LDAP_READ_TIMEOUT = 5  # секунд
+LDAP_CIRCUIT_FAILURES = 5  # ошибок подряд до отключения каталога
+LDAP_CIRCUIT_RESET = 30  # секунд до пробного вызова
+LDAP_TEST_LATENCY = 0  # имитация задержки встроенного каталога, секунд
+
+# Асинхронные представления каталога (включается в identica/asgi.py)
+DIRECTORY_VIEWS_ASYNC = os.environ.get('DIRECTORY_VIEWS_ASYNC') == '1'
+
+# Кэш записей каталога (группы, имя, email) между запросами
+LDAP_CACHE_TTL = 300  # секунд
+LDAP_CACHE_MAXSIZE = 10000
+
+# Проверки доступа по группам из базы, а не из каталога. Группы и членство
+# переносит команда sync_directory_groups - ее нужно запускать периодически
+DIRECTORY_GROUPS_FROM_DB = os.environ.get('DIRECTORY_GROUPS_FROM_DB') == '1'
+DIRECTORY_SYNC_CHUNK_SIZE = 500  # строк в одной транзакции синхронизации
+
+# Метрики Prometheus (/metrics). При нескольких воркерах задайте общий
+# каталог METRICS_DIR - процессы будут сбрасывать туда свои счетчики
+METRICS_DIR = os.environ.get('METRICS_DIR') or None
+METRICS_FLUSH_INTERVAL = 5  # секунд
+# /metrics отдается сотрудникам и адресам из списка (сборщик метрик);
+# остальным - 403: в метриках время входа по бэкендам и сбои каталога.
+# За прокси на том же хосте включите LOGIN_RATELIMIT_TRUST_FORWARDED,
+# иначе адрес клиента - адрес прокси, и 127.0.0.1 пропустит всех
+METRICS_ALLOWED_IPS = [
+    ip.strip() for ip in os.environ.get('METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',') if ip.strip()
+]
+
+# Ограничение попыток входа: (попыток, окно в секундах) на имя и на IP.
+# Счетчики общие для всех воркеров - файл SQLite LOGIN_RATELIMIT_DB
+LOGIN_RATELIMIT_DB = os.environ.get('LOGIN_RATELIMIT_DB') or BASE_DIR / 'ratelimit.sqlite3'
+LOGIN_RATELIMIT_USERNAME = (5, 60)
+LOGIN_RATELIMIT_IP = (50, 60)
+LOGIN_RATELIMIT_PRUNE_INTERVAL = 60  # секунд между удалениями восстановившихся корзин
+LOGIN_RATELIMIT_TRUST_FORWARDED = False  # True только за обратным прокси
\ No newline at end of file
@@ -0,0 +1,27 @@
+import copy
+import tempfile
+
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class IsolatedCacheRunner(DiscoverRunner):
+    """
+    Тесты пишут в собственный временный каталог кэша, а не в кэш
+    dev-сервера: номера строк тестовой базы повторяются от запуска к
+    запуску, и версии и фрагменты прошлых запусков подменяли бы свежие
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._cache_dir = tempfile.TemporaryDirectory(prefix='identica-test-cache-')
+        caches = copy.deepcopy(settings.CACHES)
+        caches['default']['LOCATION'] = self._cache_dir.name
+        self._cache_override = override_settings(CACHES=caches)
+        self._cache_override.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._cache_override.disable()
+        self._cache_dir.cleanup()
+        super().teardown_test_environment(**kwargs)
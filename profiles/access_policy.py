@@ -0,0 +1,77 @@
+"""
+Скомпилированная политика доступа к сайтам.
+
+Правила собираются один раз: каждой группе назначается свой бит,
+требования сайта хранятся как целочисленная маска, а сами правила
+лежат в индексе "хост -> префиксы пути". Проверка доступа сводится
+к одному поиску в индексе и одной операции AND.
+"""
+from functools import lru_cache
+from urllib.parse import urlsplit
+
+
+def split_url(url):
+    """Разбирает URL на (хост, путь) без протокола, порта и www."""
+    url = url.strip()
+    if '://' not in url:
+        url = '//' + url
+    try:
+        parts = urlsplit(url)
+        host = (parts.hostname or '').lower()
+    except ValueError:
+        # Некорректный URL (http://[abc, неверный порт) - без хоста не подходит
+        # ни под одно правило, и доступ к нему закрыт
+        return '', ''
+    if host.startswith('www.'):
+        host = host[4:]
+    return host, parts.path.rstrip('/')
+
+
+class AccessPolicy:
+    """Индекс правил доступа с требованиями групп в виде битовых масок"""
+
+    def __init__(self, rules):
+        self._bits = {}
+        self._index = {}
+        for url, groups in rules:
+            host, path = split_url(url)
+            mask = 0
+            for group in groups:
+                if group not in self._bits:
+                    self._bits[group] = 1 << len(self._bits)
+                mask |= self._bits[group]
+            prefixes = self._index.setdefault(host, {})
+            prefixes[path] = prefixes.get(path, 0) | mask
+
+        # Длинные префиксы проверяются первыми
+        for host, prefixes in self._index.items():
+            self._index[host] = sorted(prefixes.items(), key=lambda item: len(item[0]), reverse=True)
+
+        self.required_mask = lru_cache(maxsize=4096)(self._required_mask)
+        self._groups_mask = lru_cache(maxsize=1024)(self._compute_groups_mask)
+
+    def _required_mask(self, url):
+        host, path = split_url(url)
+        for prefix, mask in self._index.get(host, ()):
+            if not prefix or path == prefix or path.startswith(prefix + '/'):
+                return mask
+        return 0
+
+    def _compute_groups_mask(self, groups):
+        mask = 0
+        for group in groups:
+            mask |= self._bits.get(group, 0)
+        return mask
+
+    def groups_mask(self, groups):
+        """Превращает список групп пользователя в битовую маску"""
+        return self._groups_mask(tuple(groups))
+
+    def required_groups(self, url):
+        """Возвращает имена групп, дающих доступ к сайту"""
+        mask = self.required_mask(url)
+        return [group for group, bit in self._bits.items() if mask & bit]
+
+    def allows(self, user_mask, url):
+        """Сайт без правил закрыт для всех"""
+        return bool(self.required_mask(url) & user_mask)
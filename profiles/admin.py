@@ -1,25 +1,68 @@
 from django.contrib import admin
+from django.db.models import Q
+from django.utils.decorators import method_decorator
+from .admin_paging import LargeTableAdminMixin
+from .db_router import replica_reads
+from .exports import export_response
 from .models import StudentProfile, WebsiteCategory, Website, Subscription
 
+
+class ReplicaChangelistMixin:
+    """Списки объектов в админке читаются из реплики"""
+
+    @method_decorator(replica_reads)
+    def changelist_view(self, request, extra_context=None):
+        return super().changelist_view(request, extra_context)
+
+
+def export_action(name, fmt, description):
+    """Действие админки: потоковая выгрузка выбранных объектов"""
+    @admin.action(description=description, permissions=['view'])
+    def action(modeladmin, request, queryset):
+        return export_response(name, fmt, queryset)
+    action.__name__ = f'export_{name}_{fmt}'
+    return action
+
+
 @admin.register(StudentProfile)
-class StudentProfileAdmin(admin.ModelAdmin):
+class StudentProfileAdmin(LargeTableAdminMixin, ReplicaChangelistMixin, admin.ModelAdmin):
     list_display = ['user', 'student_id', 'faculty', 'course', 'group', 'is_monitor']
+    list_select_related = ['user']
     list_filter = ['faculty', 'course', 'is_monitor']
     search_fields = ['user__username', 'student_id']
+    actions = [
+        export_action('students', 'csv', 'Выгрузить студентов (CSV)'),
+        export_action('students', 'jsonl', 'Выгрузить студентов (JSONL)'),
+        export_action('access', 'csv', 'Выгрузить решения о доступе (CSV)'),
+    ]
 
 @admin.register(WebsiteCategory)
-class WebsiteCategoryAdmin(admin.ModelAdmin):
+class WebsiteCategoryAdmin(ReplicaChangelistMixin, admin.ModelAdmin):
     list_display = ['name', 'description']
     search_fields = ['name']
 
 @admin.register(Website)
-class WebsiteAdmin(admin.ModelAdmin):
+class WebsiteAdmin(ReplicaChangelistMixin, admin.ModelAdmin):
     list_display = ['name', 'url', 'category', 'is_active']
     list_filter = ['category', 'is_active']
     search_fields = ['name', 'url']
 
 @admin.register(Subscription)
-class SubscriptionAdmin(admin.ModelAdmin):
+class SubscriptionAdmin(LargeTableAdminMixin, ReplicaChangelistMixin, admin.ModelAdmin):
     list_display = ['student', 'website', 'subscribed_at', 'is_active']
+    list_select_related = ['student__user', 'website']
     list_filter = ['is_active', 'website']
-    search_fields = ['student__user__username', 'website__name']
\ No newline at end of file
+    # Логин и билет - по префиксу с учетом регистра (по индексам);
+    # сайт - по части названия без учета регистра, см. extra_search_q
+    search_fields = ['student__user__username', 'student__student_id']
+    actions = [
+        export_action('subscriptions', 'csv', 'Выгрузить подписки (CSV)'),
+        export_action('subscriptions', 'jsonl', 'Выгрузить подписки (JSONL)'),
+    ]
+
+    def extra_search_q(self, term):
+        # Сайтов немного: подходящие находятся в Python (LIKE в SQLite не
+        # переводит кириллицу в нижний регистр), подписки - по индексу website_id
+        term = term.lower()
+        website_ids = [pk for pk, name in Website.objects.values_list('pk', 'name') if term in name.lower()]
+        return Q(website_id__in=website_ids) if website_ids else Q()
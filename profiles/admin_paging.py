@@ -0,0 +1,102 @@
+"""
+Списки больших таблиц в админке.
+
+- Число строк кэшируется на ADMIN_COUNT_CACHE_TTL секунд для каждого
+  сочетания фильтров и поиска, полный COUNT(*) без фильтров не выполняется.
+- Глубокие страницы при сортировке по id читаются по ключу: страница,
+  следующая за уже показанной, начинается с id после ее последней строки
+  (WHERE id < ... LIMIT), без OFFSET по полным строкам. Если предыдущая
+  страница неизвестна (переход по номеру), граница ищется смещением только
+  по индексу id, а строки читаются от нее.
+- Поиск - по префиксу логина и студенческого билета диапазоном
+  (>= префикс AND < следующий префикс), который использует индексы этих
+  столбцов, в отличие от LIKE '%...%'. Поиск учитывает регистр.
+  extra_search_q добавляет свои условия для слова поиска (например, id
+  подходящих строк маленькой связанной таблицы).
+
+Кэшированное число строк и границы страниц могут отставать от данных на
+время жизни кэша - для списков админки это допустимо.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+PK_ORDERINGS = {('-pk',): True, ('-id',): True, ('pk',): False, ('id',): False}
+
+
+def prefix_range_q(field, prefix):
+    """field начинается с prefix - условие, которое SQLite выполняет по индексу"""
+    upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+    return Q(**{f'{field}__gte': prefix, f'{field}__lt': upper})
+
+
+class LargeTablePaginator(Paginator):
+    """Пагинатор с кэшированным числом строк и чтением глубоких страниц по ключу"""
+    keyset_threshold = 1000  # строк; ближе к началу OFFSET дешевле поиска границы
+
+    @cached_property
+    def cache_prefix(self):
+        sql, params = self.object_list.query.sql_with_params()
+        digest = hashlib.sha256(repr((sql, params)).encode()).hexdigest()[:32]
+        return f'admin:list:{self.object_list.model._meta.label_lower}:{digest}'
+
+    @cached_property
+    def count(self):
+        key = f'{self.cache_prefix}:count'
+        count = cache.get(key)
+        if count is None:
+            count = self.object_list.count()
+            cache.set(key, count, getattr(settings, 'ADMIN_COUNT_CACHE_TTL', 60))
+        return count
+
+    def _descending(self):
+        """True/False - сортировка только по id (по убыванию/возрастанию), None - другая"""
+        return PK_ORDERINGS.get(tuple(self.object_list.query.order_by))
+
+    def page(self, number):
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        descending = self._descending()
+        if bottom < self.keyset_threshold or descending is None or self.orphans:
+            return super().page(number)
+
+        after = 'pk__lt' if descending else 'pk__gt'
+        previous_last = cache.get(f'{self.cache_prefix}:last:{number - 1}')
+        if previous_last is not None:
+            object_list = self.object_list.filter(**{after: previous_last})
+        else:
+            # Граница страницы - смещение по одному индексу id, без чтения строк
+            try:
+                first = self.object_list.values_list('pk', flat=True)[bottom]
+            except IndexError:
+                # Кэшированное число строк устарело - страницы уже нет
+                return super().page(number)
+            object_list = self.object_list.filter(**{'pk__lte' if descending else 'pk__gte': first})
+        object_list = object_list[:self.per_page]
+        if len(object_list):
+            cache.set(f'{self.cache_prefix}:last:{number}', object_list[len(object_list) - 1].pk,
+                      getattr(settings, 'ADMIN_COUNT_CACHE_TTL', 60))
+        return self._get_page(object_list, number, self)
+
+
+class LargeTableAdminMixin:
+    """Режим больших таблиц для ModelAdmin: search_fields ищутся по префиксу"""
+    paginator = LargeTablePaginator
+    show_full_result_count = False
+
+    def get_search_results(self, request, queryset, search_term):
+        fields = self.get_search_fields(request)
+        for term in search_term.split():
+            condition = Q()
+            for field in fields:
+                condition |= prefix_range_q(field, term)
+            queryset = queryset.filter(condition | self.extra_search_q(term))
+        return queryset, False
+
+    def extra_search_q(self, term):
+        """Дополнительное условие (через ИЛИ) для слова поиска"""
+        return Q()
@@ -1,9 +1,16 @@
+from django.contrib import messages
 from django.contrib.admin import AdminSite
+from django.contrib.admin.forms import AdminAuthenticationForm
+from django.contrib.auth.decorators import login_not_required
+from django.template.response import TemplateResponse
 from django.urls import reverse
+from django.utils.decorators import method_decorator
+from django.views.decorators.cache import never_cache
 from django.utils.html import format_html
 from django.contrib.auth.models import Group, User
 from django.contrib.auth.admin import UserAdmin, GroupAdmin
 from .models import StudentProfile, WebsiteCategory, Website, Subscription
+from .ratelimit import check_login_attempt
 
 class CustomAdminSite(AdminSite):
     site_header = "🌿 Identica - Администрирование"
@@ -29,6 +36,30 @@ class CustomAdminSite(AdminSite):
                 
         return reordered_app_list
 
+    @method_decorator(never_cache)
+    @login_not_required
+    def login(self, request, extra_context=None):
+        """
+        Вход в админку под тем же ограничителем попыток, что и /accounts/login/
+        """
+        if request.method == 'POST':
+            retry_after = check_login_attempt(request)
+            if retry_after:
+                request.current_app = self.name
+                context = {
+                    **self.each_context(request),
+                    'title': 'Вход',
+                    'app_path': request.get_full_path(),
+                    'form': (self.login_form or AdminAuthenticationForm)(request),
+                    'next': request.POST.get('next') or reverse('admin:index', current_app=self.name),
+                    **(extra_context or {}),
+                }
+                messages.warning(request, 'Слишком много попыток входа. Попробуйте позже.')
+                response = TemplateResponse(request, self.login_template or 'admin/login.html', context, status=429)
+                response['Retry-After'] = str(int(retry_after) + 1)
+                return response
+        return super().login(request, extra_context)
+
 # Создаем экземпляр кастомной админки
 custom_admin_site = CustomAdminSite(name='custom_admin')
 
@@ -3,4 +3,17 @@ from django.apps import AppConfig
 class ProfilesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'profiles'
-    verbose_name = 'Профили студентов'
\ No newline at end of file
+    verbose_name = 'Профили студентов'
+
+    def ready(self):
+        from django.contrib.auth.signals import user_logged_in
+        from django.db.backends.signals import connection_created
+        from . import catalogue  # noqa: F401 - сигналы версии каталога
+        from .metrics import install_sql_counter
+        from .models import queued_update_last_login
+
+        # Запись last_login при входе идет через очередь записей
+        user_logged_in.disconnect(dispatch_uid='update_last_login')
+        user_logged_in.connect(queued_update_last_login, dispatch_uid='update_last_login')
+        # Счетчик SQL для метрик запросов - на каждом соединении каждого потока
+        connection_created.connect(install_sql_counter, dispatch_uid='install_sql_counter')
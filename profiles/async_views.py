@@ -0,0 +1,106 @@
+"""
+Асинхронные варианты представлений, которые обращаются к каталогу.
+
+Под ASGI (DIRECTORY_VIEWS_ASYNC) ожидание каталога не держит поток
+воркера: запись пользователя читается через AsyncDirectoryClient
+одновременно с загрузкой профиля из базы, а шаблон рисуется в
+синхронном потоке Django, где доступны сессия и ORM.
+"""
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.decorators import login_required
+from django.shortcuts import redirect, render
+
+from .ldap_utils import (
+    ACCESS_POLICY, accessible_websites, aget_directory_entry,
+    get_website_required_groups, ldap_info,
+)
+from .middleware import get_student_profile
+from .views import POPULAR_SITES
+
+arender = sync_to_async(render)
+
+
+async def _load_directory_context(request, user=None):
+    """Запись каталога и профиль пользователя - параллельно"""
+    if user is None:
+        user = await request.auser()
+    entry, _ = await asyncio.gather(
+        aget_directory_entry(user.username),
+        # Профиль нужен base.html; загружаем заранее, пока ждем каталог
+        sync_to_async(get_student_profile)(request),
+    )
+    return user, entry
+
+
+@login_required
+async def website_access_check(request):
+    """Страница проверки доступа к сайтам"""
+    user, entry = await _load_directory_context(request)
+    groups = list(entry['groups']) if entry else []
+
+    site_url = request.GET.get('url', '')
+    specific_access = None
+    if site_url:
+        specific_access = ACCESS_POLICY.allows(ACCESS_POLICY.groups_mask(groups), site_url)
+
+    return await arender(request, 'profiles/website_access.html', {
+        'accessible_websites': accessible_websites(groups),
+        'specific_access': specific_access,
+        'checked_url': site_url,
+        'active_tab': 'access_check'
+    })
+
+
+@login_required
+async def ldap_test_tool(request):
+    """Инструмент для тестирования LDAP доступа"""
+    user, entry = await _load_directory_context(request)
+    # Все четыре сведения берутся из одной записи каталога
+    user_ldap_info = ldap_info(user.username, entry)
+    user_groups = user_ldap_info['groups']
+
+    test_url = request.GET.get('test_url', '')
+    test_result = None
+    if test_url:
+        test_result = {
+            'url': test_url,
+            'access_granted': ACCESS_POLICY.allows(ACCESS_POLICY.groups_mask(user_groups), test_url),
+            'required_groups': get_website_required_groups(test_url),
+        }
+
+    return await arender(request, 'profiles/ldap_test_tool.html', {
+        'user_ldap_info': user_ldap_info,
+        'user_groups': user_groups,
+        'accessible_websites': accessible_websites(user_groups),
+        'test_result': test_result,
+        'popular_sites': POPULAR_SITES,
+        'active_tab': 'ldap_test'
+    })
+
+
+# Тестовые страницы: адрес для проверки доступа, название и шаблон
+TEST_PAGES = {
+    'library': ('https://library.identica.local', 'Библиотека университета', 'profiles/test_pages/library.html'),
+    'research': ('https://research.identica.local', 'Научный портал', 'profiles/test_pages/research.html'),
+    'admin': ('https://admin.identica.local', 'Административная панель', 'profiles/test_pages/admin.html'),
+    'courses': ('https://courses.identica.local', 'Портал курсов', 'profiles/test_pages/courses.html'),
+}
+
+
+async def test_page(request, page):
+    """Тестовая страница сайта с проверкой доступа через каталог"""
+    user = await request.auser()
+    if not user.is_authenticated:
+        return redirect('login')
+
+    external_url, site_name, template = TEST_PAGES[page]
+    _, entry = await _load_directory_context(request, user)
+    groups = entry['groups'] if entry else ()
+    if not ACCESS_POLICY.allows(ACCESS_POLICY.groups_mask(groups), external_url):
+        return await arender(request, 'profiles/access_denied.html', {
+            'site_name': site_name,
+            'required_groups': get_website_required_groups(external_url),
+        })
+    return await arender(request, template)
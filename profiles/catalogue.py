@@ -0,0 +1,76 @@
+"""
+Каталог активных сайтов, сгруппированный по категориям.
+
+Каталог меняется несколько раз за семестр, а читается на каждой странице
+подписок. Версия каталога хранится в общем кэше (CACHES['default']) и
+меняется сигналами post_save/post_delete у Website и WebsiteCategory
+(см. versioning.bump_version_on_commit). Каждый процесс держит готовый
+снимок и перестраивает его лениво - один раз на версию, даже если
+запросов одновременно много.
+"""
+import threading
+
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Website, WebsiteCategory
+from .versioning import bump_version, bump_version_on_commit, get_version
+
+CATALOGUE_VERSION_KEY = 'catalogue:version'
+
+
+def catalogue_version():
+    return get_version(CATALOGUE_VERSION_KEY)
+
+
+def bump_catalogue_version():
+    bump_version(CATALOGUE_VERSION_KEY)
+
+
+class Catalogue:
+    """Неизменяемый снимок каталога одной версии"""
+
+    def __init__(self, version, websites):
+        self.version = version
+        self.websites = tuple(websites)
+        self.by_id = {website.id: website for website in self.websites}
+        self.ids = frozenset(self.by_id)
+        self.by_category = {}
+        for website in self.websites:
+            self.by_category.setdefault(website.category.name, []).append(website)
+        self.choices = [
+            (category, [(website.id, website.name) for website in websites])
+            for category, websites in self.by_category.items()
+        ]
+
+
+_snapshot = None
+_rebuild_lock = threading.Lock()
+
+
+def get_catalogue():
+    """Снимок текущей версии; перестраивается не чаще раза на версию"""
+    global _snapshot
+    version = catalogue_version()
+    snapshot = _snapshot
+    if snapshot is not None and snapshot.version == version:
+        return snapshot
+    with _rebuild_lock:
+        if _snapshot is None or _snapshot.version != version:
+            # Всегда из основной базы: реплика может отставать от версии
+            websites = Website.objects.using('default').filter(is_active=True).select_related('category')
+            _snapshot = Catalogue(version, websites)
+        return _snapshot
+
+
+def catalogue_choices():
+    """Варианты выбора сайтов для форм, сгруппированные по категориям"""
+    return get_catalogue().choices
+
+
+@receiver(post_save, sender=Website)
+@receiver(post_delete, sender=Website)
+@receiver(post_save, sender=WebsiteCategory)
+@receiver(post_delete, sender=WebsiteCategory)
+def invalidate_catalogue(sender, using=None, **kwargs):
+    bump_version_on_commit(CATALOGUE_VERSION_KEY, using)
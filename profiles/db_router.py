@@ -0,0 +1,108 @@
+"""
+Чтение из реплики.
+
+Представления, отмеченные replica_reads, читают модели profiles из базы
+REPLICA_DB_ALIAS, если она настроена (DATABASE_REPLICA). Все остальное -
+записи, сессии, пользователи, команды управления - идет в default.
+
+Чтение своих записей: как только запрос что-то записал, его дальнейшие
+чтения идут в default, а ответ ставит cookie, с которой следующие
+DATABASE_REPLICA_LAG секунд этот клиент тоже читает из default - пока
+реплика не догонит основную базу.
+"""
+import functools
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+REPLICA_DB_ALIAS = 'replica'
+PIN_COOKIE = 'identica_primary'
+REPLICA_APPS = {'profiles'}
+SAFE_METHODS = ('GET', 'HEAD')
+
+# Состояние текущего запроса: {'replica': bool, 'pinned': bool, 'wrote': bool}
+_request_state = ContextVar('replica_request_state', default=None)
+
+
+def replica_configured():
+    return REPLICA_DB_ALIAS in settings.DATABASES
+
+
+class ReplicaRouter:
+    """Отправляет чтения replica_reads-представлений в реплику"""
+
+    def db_for_read(self, model, **hints):
+        state = _request_state.get()
+        if (state is None or not state['replica'] or state['pinned'] or state['wrote']
+                or model._meta.app_label not in REPLICA_APPS or not replica_configured()):
+            return None
+        return REPLICA_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        state = _request_state.get()
+        if state is not None:
+            state['wrote'] = True
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплика - копия default, объекты из обеих баз совместимы
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != REPLICA_DB_ALIAS
+
+
+class ReplicaPinMiddleware:
+    """Отслеживает записи запроса и закрепляет клиента за default после них"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state = {'replica': False, 'pinned': PIN_COOKIE in request.COOKIES, 'wrote': False}
+        token = _request_state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_state.reset(token)
+        return self.pin(state, response)
+
+    async def __acall__(self, request):
+        state = {'replica': False, 'pinned': PIN_COOKIE in request.COOKIES, 'wrote': False}
+        token = _request_state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request_state.reset(token)
+        return self.pin(state, response)
+
+    def pin(self, state, response):
+        if state['wrote'] and replica_configured():
+            response.set_cookie(PIN_COOKIE, '1', max_age=settings.DATABASE_REPLICA_LAG,
+                                httponly=True, samesite='Lax')
+        return response
+
+
+def pin_to_primary():
+    """Остальные чтения текущего запроса идут в default"""
+    state = _request_state.get()
+    if state is not None:
+        state['pinned'] = True
+
+
+def replica_reads(view):
+    """Декоратор представления: GET и HEAD читают модели profiles из реплики"""
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        state = _request_state.get()
+        if state is not None and request.method in SAFE_METHODS:
+            state['replica'] = True
+        return view(request, *args, **kwargs)
+    return wrapper
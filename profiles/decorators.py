@@ -1,6 +1,18 @@
+import hashlib
+import time
+from functools import wraps
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.contrib.messages import get_messages
 from django.core.exceptions import PermissionDenied
-from django.shortcuts import get_object_or_404
-from .models import StudentProfile
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+
+from .catalogue import CATALOGUE_VERSION_KEY
+from .db_router import pin_to_primary
+from .middleware import get_student_profile
+from .versioning import get_versions, subscriptions_version_key, user_version_key, version_timestamp
 
 def role_required(allowed_roles):
     """
@@ -8,7 +20,7 @@ def role_required(allowed_roles):
     """
     def decorator(view_func):
         def wrapped_view(request, *args, **kwargs):
-            profile = get_object_or_404(StudentProfile, user=request.user)
+            profile = get_student_profile(request)
             if profile.role not in allowed_roles:
                 raise PermissionDenied("У вас недостаточно прав для доступа к этой странице.")
             return view_func(request, *args, **kwargs)
@@ -25,4 +37,71 @@ def curator_required(view_func):
 
 def teacher_required(view_func):
     """Только для преподавателей и выше"""
-    return role_required(['teacher', 'admin'])(view_func)
\ No newline at end of file
+    return role_required(['teacher', 'admin'])(view_func)
+
+def _page_versions(request):
+    """Метки версий, от которых зависит страница пользователя, или None"""
+    if request.method not in ('GET', 'HEAD') or not request.user.is_authenticated:
+        return None
+    # Непоказанные сообщения рисуются на странице - ее нельзя заменить на 304
+    if len(get_messages(request)):
+        return None
+    if not hasattr(request, '_page_versions'):
+        user_id = request.user.pk
+        request._page_versions = get_versions(
+            user_version_key(user_id), subscriptions_version_key(user_id), CATALOGUE_VERSION_KEY
+        )
+    return request._page_versions
+
+
+def _page_etag(request, *args, **kwargs):
+    versions = _page_versions(request)
+    if versions is None:
+        return None
+    # Сессия входит в метку: после входа меняются CSRF-токен и пользователь
+    stamp = '|'.join([
+        settings.PAGE_ETAG_SALT, request.path, str(request.user.pk),
+        request.session.session_key or '', *versions,
+    ])
+    return hashlib.sha256(stamp.encode()).hexdigest()[:32]
+
+
+def _page_last_modified(request, *args, **kwargs):
+    versions = _page_versions(request)
+    timestamps = [version_timestamp(version) for version in versions or ()]
+    if not timestamps or None in timestamps:
+        return None
+    return datetime.fromtimestamp(max(timestamps), tz=timezone.utc)
+
+
+def _changed_within_replica_lag(request):
+    versions = _page_versions(request)
+    if not versions:
+        return False
+    timestamps = [version_timestamp(version) for version in versions]
+    if None in timestamps:
+        return True
+    return time.time() - max(timestamps) < settings.DATABASE_REPLICA_LAG
+
+
+def user_page(view_func):
+    """
+    Условный GET для страниц пользователя: сильный ETag и Last-Modified по
+    версиям профиля, подписок и каталога. Повторный переход с If-None-Match
+    получает 304 после одного обращения к кэшу, до запросов представления.
+    """
+    conditional_view = condition(etag_func=_page_etag, last_modified_func=_page_last_modified)(view_func)
+
+    @wraps(view_func)
+    def wrapped_view(request, *args, **kwargs):
+        # ETag строится по версиям, а тело не должно быть старше их: пока
+        # реплика может не содержать последнее изменение, страница читается
+        # из основной базы, иначе браузер хранил бы старое тело под новым ETag
+        if _changed_within_replica_lag(request):
+            pin_to_primary()
+        response = conditional_view(request, *args, **kwargs)
+        if request.method in ('GET', 'HEAD'):
+            # Браузер хранит страницу, но каждый раз сверяет ETag
+            patch_cache_control(response, private=True, no_cache=True)
+        return response
+    return wrapped_view
@@ -0,0 +1,157 @@
+"""
+Потоковая выгрузка студентов, подписок и решений о доступе (CSV или JSONL).
+
+Строки читаются пачками по первичному ключу (id > последнего из прошлой
+пачки), каждая пачка - отдельный короткий запрос, без общей транзакции
+на всю выгрузку и без OFFSET. Строки сразу отдаются генератором, так что
+память не зависит от размера выгрузки. Если настроена реплика, выгрузка
+читает из нее и не мешает записям в основную базу.
+
+Решения о доступе считаются по группам в базе (их переносит
+sync_directory_groups): обращаться к каталогу за каждым студентом
+выгрузки было бы слишком долго.
+"""
+import csv
+import json
+
+from django.contrib.auth.models import User
+from django.http import StreamingHttpResponse
+
+from .db_router import REPLICA_DB_ALIAS, replica_configured
+from .ldap_utils import ACCESS_POLICY, TEST_WEBSITES
+from .models import StudentProfile, Subscription
+
+DEFAULT_CHUNK_SIZE = 2000
+FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+}
+
+
+def export_database():
+    return REPLICA_DB_ALIAS if replica_configured() else 'default'
+
+
+def iter_keyset(queryset, fields, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Кортежи values_list(*fields) пачками по pk; первое поле - pk"""
+    queryset = queryset.using(export_database()).order_by('pk').values_list(*fields)
+    last_pk = None
+    while True:
+        page = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+        rows = list(page[:chunk_size])
+        yield from rows
+        if len(rows) < chunk_size:
+            return
+        last_pk = rows[-1][0]
+
+
+def student_rows(queryset=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    queryset = StudentProfile.objects.all() if queryset is None else queryset
+    for row in iter_keyset(queryset, [
+        'pk', 'student_id', 'user__username', 'user__email', 'user__first_name',
+        'user__last_name', 'faculty', 'course', 'group', 'is_monitor',
+    ], chunk_size):
+        yield row[1:]
+
+
+def subscription_rows(queryset=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    queryset = Subscription.objects.all() if queryset is None else queryset
+    for row in iter_keyset(queryset, [
+        'pk', 'student__student_id', 'student__user__username', 'website__name',
+        'website__url', 'website__category__name', 'is_active', 'subscribed_at',
+    ], chunk_size):
+        yield row[1:-1] + (row[-1].isoformat(),)
+
+
+def chunked(rows, size):
+    """Списки по size элементов из итератора"""
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def access_rows(queryset=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Решение о доступе для каждого студента и сайта"""
+    queryset = StudentProfile.objects.all() if queryset is None else queryset
+    membership = User.groups.through.objects.using(export_database())
+    for chunk in chunked(iter_keyset(queryset, ['pk', 'user_id', 'user__username'], chunk_size), chunk_size):
+        groups = {}
+        for user_id, name in membership.filter(
+                user_id__in=[user_id for _, user_id, _ in chunk]).values_list('user_id', 'group__name'):
+            groups.setdefault(user_id, []).append(name)
+        for _, user_id, username in chunk:
+            mask = ACCESS_POLICY.groups_mask(groups.get(user_id, ()))
+            for site in TEST_WEBSITES:
+                yield (username, site['name'], site['external_url'],
+                       ACCESS_POLICY.allows(mask, site['external_url']), ' '.join(site['required_groups']))
+
+
+EXPORTS = {
+    'students': (
+        ['student_id', 'username', 'email', 'first_name', 'last_name', 'faculty', 'course', 'group', 'is_monitor'],
+        student_rows,
+    ),
+    'subscriptions': (
+        ['student_id', 'username', 'website', 'url', 'category', 'is_active', 'subscribed_at'],
+        subscription_rows,
+    ),
+    'access': (
+        ['username', 'website', 'url', 'access_granted', 'required_groups'],
+        access_rows,
+    ),
+}
+
+
+class _Echo:
+    """Файл для csv.writer, который возвращает строку вместо записи"""
+
+    def write(self, value):
+        return value
+
+
+def format_lines(columns, rows, fmt):
+    """Строки файла в формате fmt (csv или jsonl) из кортежей значений"""
+    if fmt == 'csv':
+        writer = csv.writer(_Echo())
+        yield writer.writerow(columns)
+        for row in rows:
+            yield writer.writerow(row)
+    else:
+        for row in rows:
+            yield json.dumps(dict(zip(columns, row)), ensure_ascii=False) + '\n'
+
+
+def stream_export(name, fmt, queryset=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Генератор строк выгрузки name в формате fmt (csv или jsonl)"""
+    columns, rows = EXPORTS[name]
+    return format_lines(columns, rows(queryset, chunk_size), fmt)
+
+
+def _buffered(lines, size=64 * 1024):
+    """Склеивает строки в блоки около size символов - меньше мелких записей в сокет"""
+    buffer, length = [], 0
+    for line in lines:
+        buffer.append(line)
+        length += len(line)
+        if length >= size:
+            yield ''.join(buffer)
+            buffer, length = [], 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+def streaming_file_response(lines, filename, fmt):
+    """Потоковый ответ-вложение из строк файла"""
+    response = StreamingHttpResponse(_buffered(lines), content_type=FORMATS[fmt])
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+def export_response(name, fmt, queryset=None):
+    """Потоковый ответ с файлом выгрузки"""
+    return streaming_file_response(stream_export(name, fmt, queryset), f'{name}.{fmt}', fmt)
@@ -0,0 +1,29 @@
+"""
+Файловый кэш для большого числа ключей.
+
+Стандартный FileBasedCache перед каждой записью обходит весь каталог
+кэша, чтобы сравнить число файлов с MAX_ENTRIES. При ключах версий и
+фрагментах шаблонов на каждого студента это сотни тысяч файлов на
+каждый set(). Здесь размер проверяется не чаще раза в CULL_INTERVAL
+секунд в каждом процессе; между проверками кэш может немного превысить
+MAX_ENTRIES, поэтому MAX_ENTRIES задается с запасом.
+"""
+import time
+
+from django.core.cache.backends.filebased import FileBasedCache
+
+
+class IntervalCullFileBasedCache(FileBasedCache):
+    """FileBasedCache, который проверяет размер каталога по интервалу"""
+
+    def __init__(self, dir, params):
+        super().__init__(dir, params)
+        self._cull_interval = params.get('OPTIONS', {}).get('CULL_INTERVAL', 60)
+        self._next_cull = 0.0
+
+    def _cull(self):
+        now = time.monotonic()
+        if now < self._next_cull:
+            return
+        self._next_cull = now + self._cull_interval
+        super()._cull()
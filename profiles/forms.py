@@ -1,5 +1,6 @@
 from django import forms
-from .models import StudentProfile, Website
+from .catalogue import catalogue_choices
+from .models import ReportSnapshot, StudentProfile
 
 class StudentProfileForm(forms.ModelForm):
     class Meta:
@@ -32,9 +33,38 @@ class StudentProfileForm(forms.ModelForm):
         self.fields['group'].required = True
 
 class SubscriptionForm(forms.Form):
-    websites = forms.ModelMultipleChoiceField(
-        queryset=Website.objects.filter(is_active=True),
+    # Варианты берутся из снимка каталога, без запроса к базе
+    websites = forms.TypedMultipleChoiceField(
+        choices=catalogue_choices,
+        coerce=int,
         widget=forms.SelectMultiple(attrs={'class': 'form-control', 'size': '10'}),
         required=False,
         label="Выберите сайты для подписки"
-    )
\ No newline at end of file
+    )
+
+
+class ReportForm(forms.Form):
+    report_type = forms.ChoiceField(
+        choices=ReportSnapshot.REPORT_TYPES,
+        label='Тип отчета',
+        widget=forms.Select(attrs={'class': 'form-control'})
+    )
+    
+    start_date = forms.DateField(
+        label='Начальная дата',
+        required=False,
+        widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control'})
+    )
+    
+    end_date = forms.DateField(
+        label='Конечная дата', 
+        required=False,
+        widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control'})
+    )
+    
+    def clean(self):
+        cleaned_data = super().clean()
+        start_date, end_date = cleaned_data.get('start_date'), cleaned_data.get('end_date')
+        if start_date and end_date and start_date > end_date:
+            raise forms.ValidationError('Начальная дата позже конечной')
+        return cleaned_data
@@ -0,0 +1,117 @@
+"""
+Синхронизация групп каталога с auth.Group.
+
+Задача читает группы каталога с участниками одним постраничным поиском,
+сравнивает их с группами и членством в базе как множества и записывает
+только разницу: недостающие группы и строки членства - bulk_create,
+лишние строки - удаление по id. Записи идут пачками, каждая пачка в своей
+транзакции через очередь записей, так что запросы на вход не ждут всю
+синхронизацию.
+
+Синхронизируются только группы, которые есть в каталоге: локальные группы
+Django и их участников задача не трогает. Пользователи, которых еще нет в
+базе, пропускаются - они появятся при входе или при синхронизации
+пользователей.
+"""
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import Group, User
+
+from .directory_cache import directory_cache
+from .ldap_utils import local_entry_key
+from .metrics import registry
+from .write_queue import serialized_write
+
+DEFAULT_CHUNK_SIZE = 500
+# Не больше переменных в одном IN (...), чем допускает SQLite
+LOOKUP_CHUNK_SIZE = 500
+
+Membership = User.groups.through
+
+
+def _chunks(items, size):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _user_ids(usernames):
+    ids = {}
+    for chunk in _chunks(sorted(usernames), LOOKUP_CHUNK_SIZE):
+        ids.update(User.objects.filter(username__in=chunk).values_list('username', 'id'))
+    return ids
+
+
+@serialized_write('group_sync_groups')
+def _create_groups(names):
+    Group.objects.bulk_create([Group(name=name) for name in names], ignore_conflicts=True)
+
+
+@serialized_write('group_sync_add')
+def _add_memberships(pairs):
+    Membership.objects.bulk_create(
+        [Membership(user_id=user_id, group_id=group_id) for user_id, group_id in pairs],
+        ignore_conflicts=True,
+    )
+
+
+@serialized_write('group_sync_remove')
+def _remove_memberships(row_ids):
+    Membership.objects.filter(id__in=row_ids).delete()
+
+
+def sync_groups(client, chunk_size=DEFAULT_CHUNK_SIZE, page_size=500):
+    """Приводит группы и членство в базе к каталогу; возвращает статистику"""
+    started = time.perf_counter()
+    directory_groups = client.get_group_members(page_size=page_size)
+
+    group_ids = dict(Group.objects.filter(name__in=directory_groups).values_list('name', 'id'))
+    missing_groups = sorted(set(directory_groups) - set(group_ids))
+    for chunk in _chunks(missing_groups, chunk_size):
+        _create_groups(chunk)
+    if missing_groups:
+        group_ids = dict(Group.objects.filter(name__in=directory_groups).values_list('name', 'id'))
+
+    members = set().union(*directory_groups.values())
+    user_ids = _user_ids(members)
+    wanted = {
+        (user_ids[username], group_ids[name])
+        for name, usernames in directory_groups.items()
+        for username in usernames if username in user_ids
+    }
+    current = {
+        (user_id, group_id): row_id
+        for row_id, user_id, group_id in Membership.objects.filter(
+            group_id__in=group_ids.values(),
+        ).values_list('id', 'user_id', 'group_id').iterator(chunk_size=2000)
+    }
+
+    to_add = sorted(wanted - current.keys())
+    to_remove = sorted(current.keys() - wanted)
+    for chunk in _chunks(to_add, chunk_size):
+        _add_memberships(chunk)
+    for chunk in _chunks(to_remove, chunk_size):
+        _remove_memberships([current[pair] for pair in chunk])
+
+    if getattr(settings, 'DIRECTORY_GROUPS_FROM_DB', False):
+        # Локальные записи доступа этого процесса; остальные устареют по TTL
+        changed = {user_id for user_id, _ in to_add} | {user_id for user_id, _ in to_remove}
+        for username, user_id in user_ids.items():
+            if user_id in changed:
+                directory_cache.invalidate(local_entry_key(username))
+
+    duration = time.perf_counter() - started
+    stats = {
+        'groups': len(directory_groups),
+        'groups_created': len(missing_groups),
+        'memberships_added': len(to_add),
+        'memberships_removed': len(to_remove),
+        'unknown_users': len(members - user_ids.keys()),
+        'seconds': round(duration, 3),
+    }
+    registry.observe('identica_directory_sync_duration_seconds', {'job': 'groups'}, duration)
+    for action in ('groups_created', 'memberships_added', 'memberships_removed'):
+        registry.inc('identica_directory_sync_rows_total', {'job': 'groups', 'action': action}, stats[action])
+    registry.flush()
+    return stats
@@ -1,56 +1,86 @@
+import logging
+import time
+
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.hashers import UNUSABLE_PASSWORD_PREFIX, make_password
 from django.contrib.auth.models import User
+from .ldap_client import DirectoryUnavailable, get_directory_client
+from .ldap_utils import directory_user_exists, refresh_directory_entry
+from .metrics import registry
+from .write_queue import serialized_write
+
+logger = logging.getLogger(__name__)
+
+
+def directory_user_fields(user_data):
+    """Атрибуты пользователя Django, которые задает каталог"""
+    return {
+        'email': user_data['email'],
+        'first_name': user_data['first_name'],
+        'last_name': user_data['last_name'],
+        'is_staff': 'staff' in user_data['groups'],
+        'is_superuser': 'admins' in user_data['groups'],
+        'is_active': 'identica-users' in user_data['groups'],
+    }
+
+
+@serialized_write('directory_user_sync')
+def save_directory_user(username, directory_fields):
+    """Создает пользователя из каталога или записывает изменившиеся поля"""
+    # Пароль хранит каталог, локальный пароль непригоден - это метка для RealmRouterBackend
+    user, created = User.objects.get_or_create(
+        username=username,
+        defaults=dict(directory_fields, password=make_password(None))
+    )
+    if not created:
+        # Записываем только изменившиеся поля, без каскада на профиль
+        changed_fields = [
+            field for field, value in directory_fields.items()
+            if getattr(user, field) != value
+        ]
+        if changed_fields:
+            for field in changed_fields:
+                setattr(user, field, directory_fields[field])
+            user.save(update_fields=changed_fields)
+    return user
+
 
 class CustomLDAPBackend:
     """
     Кастомный LDAP бэкенд для проверки доступа через группы
-    Использует тестовые данные для разработки
+    Без LDAP_SERVER_URI использует тестовый каталог для разработки
     """
     
     def authenticate(self, request, username=None, password=None, **kwargs):
-        """Тестовая аутентификация для разработки"""
-        # Импортируем тестовые данные
+        """Аутентификация через каталог (LDAP или встроенный тестовый)"""
         try:
-            from identica.ldap_test_server import LDAP_TEST_USERS
+            client = get_directory_client()
         except ImportError:
-            # Если файла нет, создаем базовых пользователей
+            # Если файла с тестовым каталогом нет, создаем базовых пользователей
             return self._create_fallback_user(username, password)
         
-        # Проверяем существование пользователя
-        if username not in LDAP_TEST_USERS:
+        try:
+            user_data = client.authenticate(username, password)
+        except DirectoryUnavailable as exc:
+            logger.warning('Каталог недоступен, вход %s отклонен: %s', username, exc)
             return None
         
-        user_data = LDAP_TEST_USERS[username]
-        
-        # Проверяем пароль
-        if user_data['password'] != password:
+        if user_data is None:
             return None
         
         # Проверяем доступ к приложению
         if 'identica-users' not in user_data['groups']:
             return None
         
-        # Создаем или получаем пользователя Django
-        user, created = User.objects.get_or_create(
-            username=username,
-            defaults={
-                'email': user_data['email'],
-                'first_name': user_data['first_name'], 
-                'last_name': user_data['last_name'],
-                'is_staff': 'staff' in user_data['groups'],
-                'is_superuser': 'admins' in user_data['groups'],
-                'is_active': True
-            }
-        )
+        # При входе каталог отдал свежие данные - обновляем кэш групп
+        refresh_directory_entry(username, user_data)
+        
+        directory_fields = directory_user_fields(user_data)
         
-        if not created:
-            # Обновляем данные существующего пользователя
-            user.email = user_data['email']
-            user.first_name = user_data['first_name']
-            user.last_name = user_data['last_name'] 
-            user.is_staff = 'staff' in user_data['groups']
-            user.is_superuser = 'admins' in user_data['groups']
-            user.is_active = True
-            user.save()
+        # Обычно пользователь уже есть и не изменился - обходимся чтением
+        user = User.objects.filter(username=username).first()
+        if user is None or any(getattr(user, field) != value for field, value in directory_fields.items()):
+            user = save_directory_user(username, directory_fields)
         
         return user
     
@@ -87,4 +117,56 @@ class CustomLDAPBackend:
         try:
             return User.objects.get(pk=user_id)
         except User.DoesNotExist:
-            return None
\ No newline at end of file
+            return None
+
+
+class RealmRouterBackend(ModelBackend):
+    """
+    Определяет, кому принадлежит логин, и проверяет пароль только там:
+    пользователи каталога - через CustomLDAPBackend, локальные учетные
+    записи с паролем - через ModelBackend. Для неизвестных логинов пароль
+    не хэшируется вовсе. Права (has_perm и т.п.) наследуются от ModelBackend.
+    """
+    DIRECTORY = 'directory'
+    LOCAL = 'local'
+    
+    def __init__(self):
+        self.directory_backend = CustomLDAPBackend()
+    
+    def get_realm(self, username):
+        try:
+            if directory_user_exists(username):
+                return self.DIRECTORY
+        except DirectoryUnavailable:
+            # Каталог не ответил: локальные учетные записи с паролем (в том числе
+            # аварийный суперпользователь) входят по нему, остальные - через
+            # CustomLDAPBackend. Ответ не кэшируется: когда каталог поднимется,
+            # он снова решает первым
+            return self.LOCAL if self.has_local_password(username) else self.DIRECTORY
+        return self.LOCAL if self.has_local_password(username) else None
+    
+    def has_local_password(self, username):
+        return User.objects.filter(username=username).exclude(
+            password__startswith=UNUSABLE_PASSWORD_PREFIX
+        ).exclude(password='').exists()
+    
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        if username is None:
+            username = kwargs.get(User.USERNAME_FIELD)
+        if not username or password is None:
+            return None
+        
+        started = time.perf_counter()
+        realm = self.get_realm(username)
+        if realm == self.DIRECTORY:
+            user = self.directory_backend.authenticate(request, username=username, password=password)
+        elif realm == self.LOCAL:
+            user = super().authenticate(request, username=username, password=password, **kwargs)
+        else:
+            user = None
+        
+        registry.observe('identica_auth_backend_duration_seconds', {
+            'backend': realm or 'unknown',
+            'result': 'success' if user else 'failure',
+        }, time.perf_counter() - started)
+        return user
@@ -0,0 +1,526 @@
+"""
+Клиент каталога (LDAP) с пулом соединений и автоматом отключения.
+
+Соединения в пуле привязаны сервисной учетной записью и переиспользуются
+для поиска. Проверка пароля выполняется привязкой под пользователем на
+соединении из пула, после чего соединение снова привязывается сервисной
+учетной записью. Если каталог начинает отвечать с ошибками или по
+таймауту, автомат размыкается и следующие вызовы сразу получают
+DirectoryUnavailable, не занимая рабочие потоки.
+
+Без LDAP_SERVER_URI клиент работает со встроенной заменой сервера из
+identica.ldap_test_server; для настоящего сервера нужен пакет ldap3.
+"""
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+logger = logging.getLogger(__name__)
+
+USER_ATTRIBUTES = ['uid', 'mail', 'givenName', 'sn', 'memberOf', 'modifyTimestamp',
+                   'employeeNumber', 'departmentNumber', 'ou']
+
+
+class DirectoryError(Exception):
+    """Базовая ошибка работы с каталогом"""
+
+
+class DirectoryUnavailable(DirectoryError):
+    """Каталог не отвечает, отвечает слишком медленно или автомат разомкнут"""
+
+
+def escape_filter_value(value):
+    """Экранирует значение для LDAP фильтра (RFC 4515)"""
+    return ''.join(
+        f'\\{ord(char):02x}' if char in '\\*()\0' else char
+        for char in str(value)
+    )
+
+
+def _first(attrs, name, default=''):
+    values = attrs.get(name) or []
+    return values[0] if values else default
+
+
+def _group_name(group_dn):
+    """cn=students,ou=groups,... -> students"""
+    first_rdn = group_dn.split(',', 1)[0]
+    return first_rdn.split('=', 1)[-1]
+
+
+def entry_to_user_data(dn, attrs):
+    """Переводит запись каталога в словарь того же вида, что LDAP_TEST_USERS"""
+    return {
+        'dn': dn,
+        'username': _first(attrs, 'uid'),
+        'groups': [_group_name(group_dn) for group_dn in attrs.get('memberOf', [])],
+        'email': _first(attrs, 'mail'),
+        'first_name': _first(attrs, 'givenName'),
+        'last_name': _first(attrs, 'sn'),
+        'modify_timestamp': _first(attrs, 'modifyTimestamp'),
+        'student_id': _first(attrs, 'employeeNumber'),
+        'faculty': _first(attrs, 'departmentNumber'),
+        'group': _first(attrs, 'ou'),
+    }
+
+
+class CircuitBreaker:
+    """
+    Автомат отключения: после failure_threshold ошибок подряд размыкается
+    на reset_timeout секунд, затем пропускает один пробный вызов
+    """
+
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half-open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30, timer=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._timer = timer
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_running = False
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state()
+
+    def _state(self):
+        if self._opened_at is None:
+            return self.CLOSED
+        if self._timer() - self._opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def before_call(self):
+        with self._lock:
+            state = self._state()
+            if state == self.OPEN or (state == self.HALF_OPEN and self._trial_running):
+                raise DirectoryUnavailable('Каталог временно отключен после серии ошибок')
+            if state == self.HALF_OPEN:
+                self._trial_running = True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def release_trial(self):
+        """Пробный вызов завершился без ответа каталога (например, ошибка настроек)"""
+        with self._lock:
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_running = False
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                self._opened_at = self._timer()
+
+
+class ConnectionPool:
+    """
+    Ограниченный пул соединений, привязанных сервисной учетной записью.
+    Освобожденное соединение передается первому ожидающему потоку напрямую,
+    чтобы вернувший его поток не мог перехватить его снова.
+    """
+
+    _CREATE = object()
+
+    def __init__(self, factory, size=10, acquire_timeout=1.0):
+        self.factory = factory
+        self.size = size
+        self.acquire_timeout = acquire_timeout
+        self._idle = []
+        self._waiters = deque()
+        self._lock = threading.Lock()
+        self.created = 0
+        self.reused = 0
+        self.waits = 0
+        self.discarded = 0
+
+    def _create(self):
+        try:
+            return self.factory()
+        except BaseException:
+            self._discard(None)
+            raise
+
+    def _acquire(self):
+        with self._lock:
+            if self._idle:
+                self.reused += 1
+                return self._idle.pop()
+            if self.created - self.discarded < self.size:
+                self.created += 1
+                waiter = None
+            else:
+                self.waits += 1
+                waiter = [threading.Event(), None]
+                self._waiters.append(waiter)
+        if waiter is None:
+            return self._create()
+
+        waiter[0].wait(self.acquire_timeout)
+        with self._lock:
+            connection = waiter[1]
+            if connection is None:
+                self._waiters.remove(waiter)
+                raise DirectoryUnavailable('Нет свободных соединений с каталогом')
+            if connection is self._CREATE:
+                self.created += 1
+            else:
+                self.reused += 1
+        return self._create() if connection is self._CREATE else connection
+
+    def _release(self, connection):
+        with self._lock:
+            if self._waiters:
+                waiter = self._waiters.popleft()
+                waiter[1] = connection
+                waiter[0].set()
+            else:
+                self._idle.append(connection)
+
+    @contextmanager
+    def connection(self):
+        connection = self._acquire()
+        try:
+            yield connection
+        except (OSError, DirectoryUnavailable):
+            # Соединение могло оборваться - в пул его не возвращаем
+            self._discard(connection)
+            raise
+        except BaseException:
+            self._release(connection)
+            raise
+        else:
+            self._release(connection)
+
+    def _discard(self, connection):
+        with self._lock:
+            self.discarded += 1
+            if self._waiters:
+                # Место в пуле освободилось - ожидающий поток откроет новое соединение
+                waiter = self._waiters.popleft()
+                waiter[1] = self._CREATE
+                waiter[0].set()
+        if connection is not None:
+            try:
+                connection.close()
+            except OSError:
+                pass
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            self._discard(connection)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': self.size,
+                'open': self.created - self.discarded,
+                'idle': len(self._idle),
+                'created': self.created,
+                'reused': self.reused,
+                'waits': self.waits,
+                'discarded': self.discarded,
+            }
+
+
+class DirectoryClient:
+    """Операции с каталогом поверх пула соединений"""
+
+    def __init__(self, connect, service_dn, service_password,
+                 user_base_dn, group_base_dn, pool_size=10,
+                 pool_timeout=1.0, breaker=None):
+        self.service_dn = service_dn
+        self.service_password = service_password
+        self.user_base_dn = user_base_dn
+        self.group_base_dn = group_base_dn
+        self._connect = connect
+        self.breaker = breaker or CircuitBreaker()
+        self.pool = ConnectionPool(self._open_service_connection, pool_size, pool_timeout)
+
+    def _open_service_connection(self):
+        connection = self._connect()
+        if not connection.bind(self.service_dn, self.service_password):
+            connection.close()
+            raise ImproperlyConfigured('Неверные учетные данные сервисной записи LDAP')
+        return connection
+
+    @contextmanager
+    def _guarded(self):
+        """Выдает соединение из пула, учитывая результат в автомате отключения"""
+        self.breaker.before_call()
+        try:
+            with self.pool.connection() as connection:
+                yield connection
+        except (OSError, DirectoryUnavailable) as exc:
+            self.breaker.record_failure()
+            logger.warning('Ошибка обращения к каталогу: %s', exc)
+            if isinstance(exc, DirectoryUnavailable):
+                raise
+            raise DirectoryUnavailable(str(exc)) from exc
+        except BaseException:
+            self.breaker.release_trial()
+            raise
+        else:
+            self.breaker.record_success()
+
+    def _find_user(self, connection, username):
+        entries, _ = connection.search(
+            self.user_base_dn,
+            f'(&(objectClass=inetOrgPerson)(uid={escape_filter_value(username)}))',
+            USER_ATTRIBUTES,
+        )
+        return entries[0] if entries else None
+
+    def get_user(self, username):
+        """Возвращает данные пользователя или None, если его нет в каталоге"""
+        with self._guarded() as connection:
+            found = self._find_user(connection, username)
+        return entry_to_user_data(*found) if found else None
+
+    def authenticate(self, username, password):
+        """Проверяет пароль привязкой под пользователем; None - неверные данные"""
+        if not username or not password:
+            return None
+        with self._guarded() as connection:
+            found = self._find_user(connection, username)
+            if found is None:
+                return None
+            dn, attrs = found
+            try:
+                valid = connection.bind(dn, password)
+            finally:
+                # Возвращаем соединению сервисную привязку перед возвратом в пул
+                if not connection.bind(self.service_dn, self.service_password):
+                    raise DirectoryUnavailable('Не удалось восстановить сервисную привязку')
+        return entry_to_user_data(dn, attrs) if valid else None
+
+    def iter_user_pages(self, since=None, page_size=500):
+        """
+        Пользователи, измененные не раньше since (GeneralizedTime), по страницам.
+        Страница - список данных пользователей; следующая запрашивается, только
+        когда вызывающий обработал предыдущую. Соединение занято до конца обхода
+        """
+        filterstr = '(objectClass=inetOrgPerson)'
+        if since:
+            filterstr = f'(&{filterstr}(modifyTimestamp>={escape_filter_value(since)}))'
+        cookie = None
+        with self._guarded() as connection:
+            while True:
+                entries, cookie = connection.search(
+                    self.user_base_dn, filterstr, USER_ATTRIBUTES,
+                    page_size=page_size, cookie=cookie,
+                )
+                yield [entry_to_user_data(dn, attrs) for dn, attrs in entries]
+                if not cookie:
+                    return
+
+    def get_group_members(self, page_size=500):
+        """Группы каталога: {имя группы: множество uid участников}, постранично"""
+        groups = {}
+        cookie = None
+        with self._guarded() as connection:
+            while True:
+                entries, cookie = connection.search(
+                    self.group_base_dn, '(objectClass=groupOfNames)',
+                    ['cn', 'member'], page_size=page_size, cookie=cookie,
+                )
+                for dn, attrs in entries:
+                    name = _first(attrs, 'cn') or _group_name(dn)
+                    groups[name] = {_group_name(member) for member in attrs.get('member', [])}
+                if not cookie:
+                    return groups
+
+    def close(self):
+        self.pool.close()
+
+
+class AsyncDirectoryClient:
+    """
+    Асинхронный фасад клиента каталога для ASGI-представлений.
+
+    Блокирующие вызовы идут в собственный пул из max_threads потоков (больше
+    соединений пул клиента все равно не выдаст), так что ожидающие
+    пользователи - это корутины, а не занятые потоки воркера. Одновременные
+    запросы одного пользователя объединяются в одно обращение к каталогу.
+    """
+
+    def __init__(self, client, max_threads=10):
+        self.client = client
+        self._executor = ThreadPoolExecutor(max_workers=max_threads, thread_name_prefix='directory')
+        self._inflight = {}
+
+    async def _single_flight(self, key, func, *args):
+        loop = asyncio.get_running_loop()
+        flight_key = (id(loop), key)
+        future = self._inflight.get(flight_key)
+        if future is None:
+            future = loop.run_in_executor(self._executor, func, *args)
+            self._inflight[flight_key] = future
+            future.add_done_callback(lambda _: self._inflight.pop(flight_key, None))
+        return await asyncio.shield(future)
+
+    async def get_user(self, username):
+        return await self._single_flight(('get_user', username), self.client.get_user, username)
+
+    async def authenticate(self, username, password):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self.client.authenticate, username, password)
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+
+class Ldap3Connection:
+    """Адаптер ldap3.Connection к интерфейсу соединения клиента каталога"""
+
+    PAGED_RESULTS_OID = '1.2.840.113556.1.4.319'
+
+    def __init__(self, uri, connect_timeout, read_timeout):
+        try:
+            import ldap3
+            from ldap3.core.exceptions import LDAPCommunicationError
+        except ImportError:
+            raise ImproperlyConfigured('Для LDAP_SERVER_URI необходимо установить пакет ldap3')
+        self._communication_error = LDAPCommunicationError
+        server = ldap3.Server(uri, connect_timeout=connect_timeout, get_info=ldap3.NONE)
+        self._connection = ldap3.Connection(
+            server, receive_timeout=read_timeout, raise_exceptions=False, auto_bind=False,
+        )
+        self._call(self._connection.open)
+
+    def _call(self, func, *args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        except self._communication_error as exc:
+            raise ConnectionError(str(exc)) from exc
+
+    def bind(self, dn, password):
+        if not password:
+            return False
+        return bool(self._call(self._connection.rebind, user=dn, password=password))
+
+    def search(self, base_dn, filterstr, attributes=None, page_size=None, cookie=None):
+        self._call(
+            self._connection.search, base_dn, filterstr,
+            attributes=attributes or ['*'], paged_size=page_size, paged_cookie=cookie,
+        )
+        entries = [
+            (item['dn'], {key: value if isinstance(value, list) else [value]
+                          for key, value in item['attributes'].items()})
+            for item in self._connection.response or []
+            if item.get('type') == 'searchResEntry'
+        ]
+        controls = self._connection.result.get('controls') or {}
+        next_cookie = controls.get(self.PAGED_RESULTS_OID, {}).get('value', {}).get('cookie')
+        return entries, next_cookie or None
+
+    def close(self):
+        self._call(self._connection.unbind)
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def build_directory_client():
+    """Создает клиента каталога по настройкам проекта"""
+    uri = getattr(settings, 'LDAP_SERVER_URI', '')
+    connect_timeout = getattr(settings, 'LDAP_CONNECT_TIMEOUT', 2)
+    read_timeout = getattr(settings, 'LDAP_READ_TIMEOUT', 5)
+
+    if uri:
+        def connect():
+            return Ldap3Connection(uri, connect_timeout, read_timeout)
+        service_dn = settings.LDAP_BIND_DN
+        service_password = settings.LDAP_BIND_PASSWORD
+        user_base_dn = settings.LDAP_USER_BASE_DN
+        group_base_dn = settings.LDAP_GROUP_BASE_DN
+    else:
+        from identica import ldap_test_server
+        server = get_test_server()
+
+        def connect():
+            return server.connect(connect_timeout, read_timeout)
+        service_dn = ldap_test_server.LDAP_TEST_SERVICE_DN
+        service_password = ldap_test_server.LDAP_TEST_SERVICE_PASSWORD
+        user_base_dn = ldap_test_server.USER_BASE_DN
+        group_base_dn = ldap_test_server.GROUP_BASE_DN
+
+    return DirectoryClient(
+        connect,
+        service_dn,
+        service_password,
+        user_base_dn,
+        group_base_dn,
+        pool_size=getattr(settings, 'LDAP_POOL_SIZE', 10),
+        pool_timeout=getattr(settings, 'LDAP_POOL_TIMEOUT', 1),
+        breaker=CircuitBreaker(
+            getattr(settings, 'LDAP_CIRCUIT_FAILURES', 5),
+            getattr(settings, 'LDAP_CIRCUIT_RESET', 30),
+        ),
+    )
+
+
+_test_server = None
+
+
+def get_test_server():
+    """Встроенный каталог процесса (один на процесс)"""
+    global _test_server
+    if _test_server is None:
+        from identica.ldap_test_server import InProcessLDAPServer
+        _test_server = InProcessLDAPServer(latency=getattr(settings, 'LDAP_TEST_LATENCY', 0))
+    return _test_server
+
+
+def get_directory_client():
+    """Общий для процесса клиент каталога"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = build_directory_client()
+    return _client
+
+
+_async_client = None
+
+
+def get_async_directory_client():
+    """Общий для процесса асинхронный фасад клиента каталога"""
+    global _async_client
+    if _async_client is None:
+        client = get_directory_client()
+        with _client_lock:
+            if _async_client is None:
+                _async_client = AsyncDirectoryClient(client, getattr(settings, 'LDAP_POOL_SIZE', 10))
+    return _async_client
+
+
+def reset_directory_client():
+    """Закрывает текущего клиента (используется в тестах и после смены настроек)"""
+    global _client, _async_client, _test_server
+    with _client_lock:
+        if _async_client is not None:
+            _async_client.close()
+        if _client is not None:
+            _client.close()
+        _client = None
+        _async_client = None
+        _test_server = None
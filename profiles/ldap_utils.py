@@ -1,48 +1,85 @@
+from asgiref.sync import sync_to_async
 from django.conf import settings
+from django.contrib.auth.models import User
+from .access_policy import AccessPolicy
+from .directory_cache import directory_cache
+from .ldap_client import DirectoryUnavailable, get_async_directory_client, get_directory_client
+from .metrics import timed
 
+# Наши тестовые сайты и группы, которым к ним разрешен доступ
+TEST_WEBSITES = [
+    {
+        'name': 'Библиотека университета',
+        'url': '/test/library/',
+        'external_url': 'https://library.identica.local',
+        'required_groups': ['students', 'staff', 'admins'],
+        'description': 'Доступ к электронной библиотеке'
+    },
+    {
+        'name': 'Научный портал',
+        'url': '/test/research/',
+        'external_url': 'https://research.identica.local',
+        'required_groups': ['staff', 'admins', 'monitors'],
+        'description': 'Научные публикации и исследования'
+    },
+    {
+        'name': 'Админ панель',
+        'url': '/test/admin/',
+        'external_url': 'https://admin.identica.local',
+        'required_groups': ['staff', 'admins'],
+        'description': 'Администрирование системы'
+    },
+    {
+        'name': 'Курсы и обучение',
+        'url': '/test/courses/',
+        'external_url': 'https://courses.identica.local',
+        'required_groups': ['students', 'staff', 'admins', 'monitors'],
+        'description': 'Онлайн курсы и материалы'
+    },
+]
+
+# Политика компилируется один раз при импорте модуля
+ACCESS_POLICY = AccessPolicy(
+    (site['external_url'], site['required_groups']) for site in TEST_WEBSITES
+)
+
+@timed('check_website_access')
 def check_website_access(username, website_url):
     """
     Проверяет, есть ли у пользователя доступ к указанному сайту
     На основе тестовых групп
     """
-    # Получаем группы пользователя
-    user_groups = get_user_groups(username)
-    
-    # Простые правила доступа для тестирования
-    access_rules = {
-        'https://library.university.local': ['students', 'staff', 'admins'],
-        'https://research.university.local': ['staff', 'admins', 'monitors'], 
-        'https://admin.university.local': ['staff', 'admins'],
-        'https://courses.university.local': ['students', 'staff', 'admins', 'monitors'],
-        'http://library.university.local': ['students', 'staff', 'admins'],
-        'http://research.university.local': ['staff', 'admins', 'monitors'],
-        'http://admin.university.local': ['staff', 'admins'],
-        'http://courses.university.local': ['students', 'staff', 'admins', 'monitors'],
-        'library.university.local': ['students', 'staff', 'admins'],
-        'research.university.local': ['staff', 'admins', 'monitors'],
-        'admin.university.local': ['staff', 'admins'],
-        'courses.university.local': ['students', 'staff', 'admins', 'monitors'],
-        'yandex.ru': ['students', 'staff', 'admins', 'monitors'],  # Все имеют доступ
-        'google.com': ['students', 'staff', 'admins', 'monitors'], # Все имеют доступ
-        'github.com': ['staff', 'admins'],  # Только персонал
-    }
-    
-    # Нормализуем URL (убираем протокол для сравнения)
-    normalized_url = website_url.replace('https://', '').replace('http://', '').replace('www.', '')
-    
-    # Проверяем доступ к сайту
-    required_groups = access_rules.get(website_url, []) or access_rules.get(normalized_url, [])
-    if not required_groups:  # Если сайта нет в правилах - доступ запрещен
-        return False
-    
-    # Проверяем, есть ли у пользователя хотя бы одна из требуемых групп
-    return any(group in user_groups for group in required_groups)
+    user_mask = ACCESS_POLICY.groups_mask(get_user_groups(username))
+    return ACCESS_POLICY.allows(user_mask, website_url)
 
-def get_user_groups(username):
-    """Получает группы пользователя"""
+def get_website_required_groups(website_url):
+    """Возвращает группы, которым разрешен доступ к сайту"""
+    return ACCESS_POLICY.required_groups(website_url)
+
+@timed('get_user_accessible_websites')
+def get_user_accessible_websites(username):
+    """Возвращает список сайтов, к которым у пользователя есть доступ"""
+    return accessible_websites(get_user_groups(username))
+
+def accessible_websites(groups):
+    """Тестовые сайты с отметкой доступа для набора групп"""
+    user_mask = ACCESS_POLICY.groups_mask(groups)
+    return [
+        {
+            'name': site['name'],
+            'url': site['url'],  # Внутренний URL
+            'external_url': site['external_url'],  # Для проверки LDAP
+            'description': site['description'],
+            'access_granted': ACCESS_POLICY.allows(user_mask, site['external_url']),
+        }
+        for site in TEST_WEBSITES
+    ]
+
+@timed('directory_lookup')
+def _load_directory_entry(username):
+    """Читает запись пользователя из каталога (None - пользователя нет)"""
     try:
-        from identica.ldap_test_server import LDAP_TEST_USERS
-        return LDAP_TEST_USERS.get(username, {}).get('groups', [])
+        client = get_directory_client()
     except ImportError:
         # Возвращаем группы по умолчанию для тестирования
         default_groups = {
@@ -51,176 +88,117 @@ def get_user_groups(username):
             'monitor1': ['students', 'identica-users', 'monitors'],
             'admin': ['staff', 'identica-users', 'admins'],
         }
-        return default_groups.get(username, ['identica-users'])
-
-def get_user_accessible_websites(username):
-    """Возвращает список сайтов, к которым у пользователя есть доступ"""
-    user_groups = get_user_groups(username)
-    
-    # Все доступные сайты для тестирования
-    all_websites = {
-        'Библиотека университета': {
-            'url': 'https://library.university.local',
-            'required_groups': ['students', 'staff', 'admins'],
-            'description': 'Доступ к электронной библиотеке'
-        },
-        'Научный портал': {
-            'url': 'https://research.university.local', 
-            'required_groups': ['staff', 'admins', 'monitors'],
-            'description': 'Научные публикации и исследования'
-        },
-        'Админ панель': {
-            'url': 'https://admin.university.local',
-            'required_groups': ['staff', 'admins'],
-            'description': 'Администрирование системы'
-        },
-        'Курсы и обучение': {
-            'url': 'https://courses.university.local',
-            'required_groups': ['students', 'staff', 'admins', 'monitors'],
-            'description': 'Онлайн курсы и материалы'
-        },
-        'Яндекс': {
-            'url': 'https://yandex.ru',
-            'required_groups': ['students', 'staff', 'admins', 'monitors'],
-            'description': 'Поисковая система'
-        },
-        'Google': {
-            'url': 'https://google.com',
-            'required_groups': ['students', 'staff', 'admins', 'monitors'],
-            'description': 'Поисковая система'
-        },
-        'GitHub': {
-            'url': 'https://github.com',
-            'required_groups': ['staff', 'admins'],
-            'description': 'Платформа для разработчиков'
-        },
-    }
-    
-    accessible_websites = []
-    for name, site_info in all_websites.items():
-        if any(group in user_groups for group in site_info['required_groups']):
-            accessible_websites.append({
-                'name': name,
-                'url': site_info['url'],
-                'description': site_info['description'],
-                'access_granted': True
-            })
-        else:
-            accessible_websites.append({
-                'name': name,
-                'url': site_info['url'], 
-                'description': site_info['description'],
-                'access_granted': False
-            })
-    
-    return accessible_websites
-
-def get_user_ldap_info(username):
-    """Возвращает информацию о пользователе из LDAP"""
-    try:
-        from identica.ldap_test_server import LDAP_TEST_USERS
-        user_data = LDAP_TEST_USERS.get(username, {})
-        return {
-            'username': username,
-            'groups': user_data.get('groups', []),
-            'email': user_data.get('email', ''),
-            'first_name': user_data.get('first_name', ''),
-            'last_name': user_data.get('last_name', ''),
-        }
-    except ImportError:
         return {
-            'username': username,
-            'groups': ['identica-users'],
+            'groups': default_groups.get(username, ['identica-users']),
             'email': f'{username}@university.local',
             'first_name': 'Тестовый',
             'last_name': 'Пользователь',
         }
+    
+    user_data = client.get_user(username)
+    if user_data is None:
+        return None
+    return make_directory_entry(user_data)
 
-def check_website_access(username, website_url):
+def make_directory_entry(user_data):
+    """Оставляет в записи каталога только то, что можно кэшировать (без пароля)"""
+    return {
+        'groups': tuple(user_data.get('groups', ())),
+        'email': user_data.get('email', ''),
+        'first_name': user_data.get('first_name', ''),
+        'last_name': user_data.get('last_name', ''),
+    }
+
+def local_entry_key(username):
+    return ('local', username)
+
+def _load_local_entry(key):
+    """Запись пользователя из базы: группы, перенесенные синхронизацией групп"""
+    user = User.objects.filter(username=key[1]).prefetch_related('groups').first()
+    if user is None:
+        return None
+    return make_directory_entry({
+        'groups': sorted(group.name for group in user.groups.all()),
+        'email': user.email,
+        'first_name': user.first_name,
+        'last_name': user.last_name,
+    })
+
+def groups_from_database():
+    """Проверки доступа отвечают по базе (DIRECTORY_GROUPS_FROM_DB), без каталога"""
+    return getattr(settings, 'DIRECTORY_GROUPS_FROM_DB', False)
+
+def get_directory_entry(username):
+    """Возвращает запись пользователя из каталога через кэш"""
+    if groups_from_database():
+        return directory_cache.get_or_load(local_entry_key(username), _load_local_entry)
+    try:
+        return directory_cache.get_or_load(username, _load_directory_entry)
+    except DirectoryUnavailable:
+        # Каталог недоступен - отказываем в доступе, но отказ не кэшируем
+        return None
+
+def directory_user_exists(username):
     """
-    Проверяет, есть ли у пользователя доступ к указанному сайту
-    На основе тестовых групп
+    Есть ли пользователь в каталоге (ответ кэшируется, в том числе отрицательный).
+    Если каталог недоступен, выбрасывает DirectoryUnavailable
     """
-    # Получаем группы пользователя
-    user_groups = get_user_groups(username)
-    
-    # Правила доступа к НАШИМ тестовым страницам
-    access_rules = {
-        # Наши внутренние тестовые страницы
-        'https://library.identica.local': ['students', 'staff', 'admins'],
-        'https://research.identica.local': ['staff', 'admins', 'monitors'], 
-        'https://admin.identica.local': ['staff', 'admins'],
-        'https://courses.identica.local': ['students', 'staff', 'admins', 'monitors'],
-        'http://library.identica.local': ['students', 'staff', 'admins'],
-        'http://research.identica.local': ['staff', 'admins', 'monitors'],
-        'http://admin.identica.local': ['staff', 'admins'],
-        'http://courses.identica.local': ['students', 'staff', 'admins', 'monitors'],
-        'library.identica.local': ['students', 'staff', 'admins'],
-        'research.identica.local': ['staff', 'admins', 'monitors'],
-        'admin.identica.local': ['staff', 'admins'],
-        'courses.identica.local': ['students', 'staff', 'admins', 'monitors'],
-    }
-    
-    # Нормализуем URL
-    normalized_url = website_url.replace('https://', '').replace('http://', '').replace('www.', '')
-    
-    # Проверяем доступ к сайту
-    required_groups = access_rules.get(website_url, []) or access_rules.get(normalized_url, [])
-    if not required_groups:  # Если сайта нет в правилах - доступ запрещен
-        return False
-    
-    # Проверяем, есть ли у пользователя хотя бы одна из требуемых групп
-    return any(group in user_groups for group in required_groups)
+    return directory_cache.get_or_load(username, _load_directory_entry) is not None
 
-def get_user_accessible_websites(username):
-    """Возвращает список сайтов, к которым у пользователя есть доступ"""
-    user_groups = get_user_groups(username)
-    
-    # Наши тестовые сайты
-    all_websites = {
-        'Библиотека университета': {
-            'url': '/test/library/',
-            'external_url': 'https://library.identica.local',
-            'required_groups': ['students', 'staff', 'admins'],
-            'description': 'Доступ к электронной библиотеке'
-        },
-        'Научный портал': {
-            'url': '/test/research/',
-            'external_url': 'https://research.identica.local', 
-            'required_groups': ['staff', 'admins', 'monitors'],
-            'description': 'Научные публикации и исследования'
-        },
-        'Админ панель': {
-            'url': '/test/admin/',
-            'external_url': 'https://admin.identica.local',
-            'required_groups': ['staff', 'admins'],
-            'description': 'Администрирование системы'
-        },
-        'Курсы и обучение': {
-            'url': '/test/courses/',
-            'external_url': 'https://courses.identica.local',
-            'required_groups': ['students', 'staff', 'admins', 'monitors'],
-            'description': 'Онлайн курсы и материалы'
-        },
+def refresh_directory_entry(username, user_data):
+    """Обновляет кэш свежими данными, полученными при входе пользователя"""
+    directory_cache.invalidate(username)
+    directory_cache.set(username, make_directory_entry(user_data))
+
+def get_user_groups(username):
+    """Получает группы пользователя"""
+    entry = get_directory_entry(username)
+    return list(entry['groups']) if entry else []
+
+def get_user_ldap_info(username):
+    """Возвращает информацию о пользователе из LDAP"""
+    return ldap_info(username, get_directory_entry(username))
+
+def ldap_info(username, entry):
+    """Сведения о пользователе из записи каталога (None - записи нет)"""
+    entry = entry or {}
+    return {
+        'username': username,
+        'groups': list(entry.get('groups', [])),
+        'email': entry.get('email', ''),
+        'first_name': entry.get('first_name', ''),
+        'last_name': entry.get('last_name', ''),
     }
-    
-    accessible_websites = []
-    for name, site_info in all_websites.items():
-        if any(group in user_groups for group in site_info['required_groups']):
-            accessible_websites.append({
-                'name': name,
-                'url': site_info['url'],  # Внутренний URL
-                'external_url': site_info['external_url'],  # Для проверки LDAP
-                'description': site_info['description'],
-                'access_granted': True
-            })
-        else:
-            accessible_websites.append({
-                'name': name,
-                'url': site_info['url'],
-                'external_url': site_info['external_url'],
-                'description': site_info['description'],
-                'access_granted': False
-            })
-    
-    return accessible_websites
\ No newline at end of file
+
+# Асинхронные варианты для ASGI-представлений: обращение к каталогу идет
+# через AsyncDirectoryClient и не занимает поток на время ожидания
+
+_MISSING = object()
+
+@timed('directory_lookup_async')
+async def aget_directory_entry(username):
+    """Асинхронный get_directory_entry: тот же кэш, каталог без блокировки"""
+    if groups_from_database():
+        return await sync_to_async(get_directory_entry)(username)
+    entry = directory_cache.get(username, _MISSING)
+    if entry is not _MISSING:
+        return entry
+    try:
+        user_data = await get_async_directory_client().get_user(username)
+    except ImportError:
+        # Тестового каталога нет - группы по умолчанию, без ввода-вывода
+        entry = _load_directory_entry(username)
+    except DirectoryUnavailable:
+        return None
+    else:
+        entry = make_directory_entry(user_data) if user_data is not None else None
+    directory_cache.set(username, entry)
+    return entry
+
+async def aget_user_groups(username):
+    entry = await aget_directory_entry(username)
+    return list(entry['groups']) if entry else []
+
+async def acheck_website_access(username, website_url):
+    user_mask = ACCESS_POLICY.groups_mask(await aget_user_groups(username))
+    return ACCESS_POLICY.allows(user_mask, website_url)
@@ -0,0 +1,135 @@
+import asyncio
+import json
+import logging
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from identica import ldap_test_server
+from identica.ldap_test_server import InProcessLDAPServer
+from profiles.ldap_client import AsyncDirectoryClient, CircuitBreaker, DirectoryClient
+
+
+def summarize(timings):
+    if not timings:
+        return {'requests': 0}
+    quantiles = statistics.quantiles(timings, n=100) if len(timings) > 1 else timings * 99
+    return {
+        'requests': len(timings),
+        'p50_ms': round(quantiles[49] * 1000, 2),
+        'p99_ms': round(quantiles[98] * 1000, 2),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает синхронный пул воркеров и асинхронную обработку при медленном '
+        'каталоге. Часть запросов ждет каталог (как страницы проверки доступа), '
+        'остальные его не трогают; показывает, сколько ждут "быстрые" запросы, '
+        'пока потоки заняты ожиданием каталога.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200, help='Одновременных пользователей')
+        parser.add_argument('--requests', type=int, default=5, help='Запросов на пользователя')
+        parser.add_argument('--workers', type=int, default=8, help='Потоков синхронного воркера')
+        parser.add_argument('--pool-size', type=int, default=10, help='Соединений с каталогом')
+        parser.add_argument('--latency', type=float, default=0.05, help='Задержка каталога, сек')
+        parser.add_argument('--directory-share', type=float, default=0.5,
+                            help='Доля запросов, которым нужен каталог')
+        parser.add_argument('--json', action='store_true', help='Вывести результат в JSON')
+
+    def build_client(self, options):
+        server = InProcessLDAPServer(latency=options['latency'])
+        for number in range(options['users']):
+            server.add_user(f'bench{number:05d}', {
+                'password': 'bench', 'groups': ['students', 'identica-users'],
+                'email': f'bench{number}@university.local', 'first_name': 'Нагрузка', 'last_name': 'Тест',
+            })
+        client = DirectoryClient(
+            lambda: server.connect(read_timeout=max(5.0, options['latency'] * 10)),
+            ldap_test_server.LDAP_TEST_SERVICE_DN,
+            ldap_test_server.LDAP_TEST_SERVICE_PASSWORD,
+            ldap_test_server.USER_BASE_DN,
+            ldap_test_server.GROUP_BASE_DN,
+            pool_size=options['pool_size'],
+            pool_timeout=60,
+            breaker=CircuitBreaker(failure_threshold=10 ** 9),
+        )
+        return client
+
+    def workload(self, options):
+        """(пользователь, нужен ли каталог) - одинаковый для обоих режимов"""
+        share = options['directory_share']
+        jobs = []
+        for round_number in range(options['requests']):
+            for number in range(options['users']):
+                needs_directory = (number * 7919 + round_number) % 1000 < share * 1000
+                jobs.append((f'bench{number:05d}', needs_directory))
+        return jobs
+
+    def run_sync(self, options, jobs):
+        client = self.build_client(options)
+        timings = {'directory': [], 'other': []}
+        lock = threading.Lock()
+
+        def handle(username, needs_directory, queued):
+            if needs_directory:
+                client.get_user(username)
+            with lock:
+                timings['directory' if needs_directory else 'other'].append(time.perf_counter() - queued)
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            for username, needs_directory in jobs:
+                executor.submit(handle, username, needs_directory, time.perf_counter())
+        elapsed = time.perf_counter() - started
+        client.close()
+        return elapsed, timings, options['workers']
+
+    def run_async(self, options, jobs):
+        client = AsyncDirectoryClient(self.build_client(options), max_threads=options['pool_size'])
+        timings = {'directory': [], 'other': []}
+
+        async def handle(username, needs_directory, queued):
+            if needs_directory:
+                await client.get_user(username)
+            else:
+                await asyncio.sleep(0)
+            timings['directory' if needs_directory else 'other'].append(time.perf_counter() - queued)
+
+        async def main():
+            queued = time.perf_counter()
+            await asyncio.gather(*[handle(username, needs_directory, queued) for username, needs_directory in jobs])
+
+        started = time.perf_counter()
+        asyncio.run(main())
+        elapsed = time.perf_counter() - started
+        client.client.close()
+        client.close()
+        # Event loop + потоки пула каталога
+        return elapsed, timings, 1 + options['pool_size']
+
+    def handle(self, *args, **options):
+        logging.getLogger('profiles.ldap_client').setLevel(logging.ERROR)
+        jobs = self.workload(options)
+        result = {}
+        for mode, runner in [('sync', self.run_sync), ('async', self.run_async)]:
+            elapsed, timings, threads = runner(options, jobs)
+            total = sum(len(values) for values in timings.values())
+            result[mode] = {
+                'threads': threads,
+                'seconds': round(elapsed, 3),
+                'throughput_rps': round(total / elapsed, 1) if elapsed else None,
+                'directory_requests': summarize(timings['directory']),
+                'other_requests': summarize(timings['other']),
+            }
+
+        if options['json']:
+            self.stdout.write(json.dumps(result, ensure_ascii=False, sort_keys=True))
+            return
+        for mode, summary in result.items():
+            self.stdout.write(f'{mode}: ' + json.dumps(summary, ensure_ascii=False))
@@ -0,0 +1,91 @@
+import json
+import logging
+import random
+import statistics
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+
+from identica import ldap_test_server
+from identica.ldap_test_server import InProcessLDAPServer, LDAP_TEST_USERS
+from profiles.ldap_client import CircuitBreaker, DirectoryClient, DirectoryUnavailable
+
+
+class Command(BaseCommand):
+    help = 'Нагрузочный тест клиента каталога на встроенном LDAP сервере'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=20, help='Число параллельных потоков')
+        parser.add_argument('--requests', type=int, default=50, help='Запросов на поток')
+        parser.add_argument('--pool-size', type=int, default=10, help='Размер пула соединений')
+        parser.add_argument('--pool-timeout', type=float, default=1.0, help='Ожидание соединения, сек')
+        parser.add_argument('--latency', type=float, default=0.005, help='Задержка каталога, сек')
+        parser.add_argument('--read-timeout', type=float, default=2.0, help='Таймаут ответа, сек')
+        parser.add_argument('--operation', choices=['authenticate', 'search'], default='authenticate')
+        parser.add_argument('--json', action='store_true', help='Вывести результат в JSON')
+
+    def handle(self, *args, **options):
+        # Ошибки считаются в отчете, предупреждения клиента только мешают выводу
+        logging.getLogger('profiles.ldap_client').setLevel(logging.ERROR)
+        server = InProcessLDAPServer(latency=options['latency'])
+        client = DirectoryClient(
+            lambda: server.connect(read_timeout=options['read_timeout']),
+            ldap_test_server.LDAP_TEST_SERVICE_DN,
+            ldap_test_server.LDAP_TEST_SERVICE_PASSWORD,
+            ldap_test_server.USER_BASE_DN,
+            ldap_test_server.GROUP_BASE_DN,
+            pool_size=options['pool_size'],
+            pool_timeout=options['pool_timeout'],
+            breaker=CircuitBreaker(failure_threshold=10 ** 9),
+        )
+        users = list(LDAP_TEST_USERS.items())
+        timings, errors = [], []
+        lock = threading.Lock()
+
+        def worker():
+            local_timings, local_errors = [], 0
+            for _ in range(options['requests']):
+                username, user_data = random.choice(users)
+                started = time.perf_counter()
+                try:
+                    if options['operation'] == 'authenticate':
+                        client.authenticate(username, user_data['password'])
+                    else:
+                        client.get_user(username)
+                except DirectoryUnavailable:
+                    local_errors += 1
+                local_timings.append(time.perf_counter() - started)
+            with lock:
+                timings.extend(local_timings)
+                errors.append(local_errors)
+
+        threads = [threading.Thread(target=worker) for _ in range(options['threads'])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        quantiles = statistics.quantiles(timings, n=100) if len(timings) > 1 else timings * 99
+        result = {
+            'operation': options['operation'],
+            'threads': options['threads'],
+            'requests': len(timings),
+            'errors': sum(errors),
+            'seconds': round(elapsed, 3),
+            'throughput_rps': round(len(timings) / elapsed, 1) if elapsed else None,
+            'p50_ms': round(quantiles[49] * 1000, 2),
+            'p95_ms': round(quantiles[94] * 1000, 2),
+            'p99_ms': round(quantiles[98] * 1000, 2),
+            'pool': client.pool.stats(),
+            'server_connections': server.connections_opened,
+        }
+        client.close()
+
+        if options['json']:
+            self.stdout.write(json.dumps(result, ensure_ascii=False))
+            return
+        for key, value in result.items():
+            self.stdout.write(f'{key}: {value}')
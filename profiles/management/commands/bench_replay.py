@@ -0,0 +1,137 @@
+import json
+import time
+from collections import defaultdict
+from contextlib import ExitStack
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+
+def percentile(sorted_values, percent):
+    """Перцентиль методом ближайшего ранга"""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, round(percent / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[rank]
+
+
+class Command(BaseCommand):
+    help = (
+        'Проигрывает журнал запросов (JSONL) через URLconf проекта и выводит '
+        'перцентили задержки, пропускную способность и статистику SQL по каждому '
+        'endpoint. Формат строки журнала: {"method": "GET", "path": "/dashboard/", '
+        '"user": "student1", "data": {...}}; поле user необязательно.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('log', nargs='?', default='requests.jsonl', help='Файл журнала запросов')
+        parser.add_argument('--repeat', type=int, default=1, help='Сколько раз проиграть журнал')
+        parser.add_argument('--warmup', type=int, default=0, help='Прогревочных проходов (не учитываются)')
+        parser.add_argument('--output', help='Записать результат в JSON файл вместо stdout')
+
+    def load_records(self, path):
+        records, skipped = [], 0
+        try:
+            with open(path, encoding='utf-8') as log:
+                for line in log:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        skipped += 1
+                        continue
+                    if not isinstance(record, dict) or not str(record.get('path', '')).startswith('/'):
+                        skipped += 1
+                        continue
+                    records.append(record)
+        except OSError as exc:
+            raise CommandError(f'Не удалось прочитать {path}: {exc}')
+        return records, skipped
+
+    def handle(self, *args, **options):
+        records, skipped = self.load_records(options['log'])
+        if not records:
+            raise CommandError(f'В {options["log"]} нет HTTP-запросов (пропущено строк: {skipped})')
+
+        clients = {}
+
+        def client_for(username):
+            if username not in clients:
+                client = Client(SERVER_NAME='localhost')
+                if username:
+                    user = User.objects.filter(username=username).first()
+                    if user is None:
+                        raise CommandError(f'Пользователь {username} из журнала не найден')
+                    client.force_login(user)
+                clients[username] = client
+            return clients[username]
+
+        def replay(record):
+            client = client_for(record.get('user') or record.get('username'))
+            method = record.get('method', 'GET').lower()
+            return getattr(client, method)(record['path'], record.get('data') or {})
+
+        for _ in range(options['warmup']):
+            for record in records:
+                replay(record)
+
+        samples = defaultdict(lambda: {'latency': [], 'queries': 0, 'sql_time': 0.0, 'statuses': defaultdict(int)})
+        started = time.perf_counter()
+        for _ in range(options['repeat']):
+            for record in records:
+                with ExitStack() as stack:
+                    captured = [stack.enter_context(CaptureQueriesContext(connection))
+                                for connection in connections.all()]
+                    request_started = time.perf_counter()
+                    response = replay(record)
+                    latency = time.perf_counter() - request_started
+
+                match = getattr(response, 'resolver_match', None)
+                endpoint = f'{record.get("method", "GET").upper()} {match.view_name if match else record["path"]}'
+                sample = samples[endpoint]
+                sample['latency'].append(latency)
+                sample['statuses'][str(response.status_code)] += 1
+                for context in captured:
+                    sample['queries'] += len(context)
+                    sample['sql_time'] += sum(float(query['time']) for query in context.captured_queries)
+        elapsed = time.perf_counter() - started
+
+        endpoints = {}
+        for endpoint, sample in sorted(samples.items()):
+            latencies = sorted(sample['latency'])
+            count = len(latencies)
+            endpoints[endpoint] = {
+                'requests': count,
+                'statuses': dict(sample['statuses']),
+                'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+                'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+                'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+                'mean_ms': round(sum(latencies) / count * 1000, 3),
+                'throughput_rps': round(count / sum(latencies), 1) if sum(latencies) else None,
+                'sql_queries_per_request': round(sample['queries'] / count, 2),
+                'sql_ms_per_request': round(sample['sql_time'] / count * 1000, 3),
+            }
+
+        total = sum(len(sample['latency']) for sample in samples.values())
+        result = {
+            'log': options['log'],
+            'repeat': options['repeat'],
+            'skipped_lines': skipped,
+            'requests': total,
+            'seconds': round(elapsed, 3),
+            'throughput_rps': round(total / elapsed, 1) if elapsed else None,
+            'endpoints': endpoints,
+        }
+
+        output = json.dumps(result, ensure_ascii=False, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as report:
+                report.write(output + '\n')
+            self.stdout.write(self.style.SUCCESS(f'Результат записан в {options["output"]}'))
+        else:
+            self.stdout.write(output)
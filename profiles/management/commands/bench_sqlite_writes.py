@@ -0,0 +1,155 @@
+import json
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from profiles.write_queue import WriteQueue
+
+SCHEMA = '''
+CREATE TABLE subscription (
+    id INTEGER PRIMARY KEY,
+    student_id INTEGER NOT NULL,
+    website_id INTEGER NOT NULL,
+    is_active BOOL NOT NULL,
+    UNIQUE (student_id, website_id)
+);
+CREATE TABLE auth_user (id INTEGER PRIMARY KEY, last_login TEXT);
+'''
+
+# Режимы: журнал, начало транзакции, очередь записей
+MODES = {
+    'default': {'pragmas': '', 'timeout': 5.0, 'begin': 'BEGIN', 'queue': False},
+    'tuned': {'pragmas': None, 'timeout': None, 'begin': 'BEGIN IMMEDIATE', 'queue': False},
+    'tuned+queue': {'pragmas': None, 'timeout': None, 'begin': 'BEGIN IMMEDIATE', 'queue': True},
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает пропускную способность записи в SQLite при параллельных '
+        'синхронизациях подписок и обновлениях last_login: настройки SQLite '
+        'по умолчанию против боевого профиля (WAL, busy_timeout, BEGIN IMMEDIATE) '
+        'с очередью записей и без нее. Работает на временной базе.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16, help='Параллельных потоков')
+        parser.add_argument('--operations', type=int, default=200, help='Записей на поток')
+        parser.add_argument('--students', type=int, default=500, help='Студентов в базе')
+        parser.add_argument('--websites', type=int, default=50, help='Сайтов в базе')
+        parser.add_argument('--mode', choices=sorted(MODES), action='append', help='Режим (по умолчанию все)')
+        parser.add_argument('--json', action='store_true', help='Вывести результат в JSON')
+
+    def handle(self, *args, **options):
+        results = {}
+        for mode in options['mode'] or list(MODES):
+            with tempfile.TemporaryDirectory() as directory:
+                results[mode] = self.run_mode(os.path.join(directory, 'bench.sqlite3'), MODES[mode], options)
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, ensure_ascii=False, sort_keys=True))
+            return
+        for mode, result in results.items():
+            self.stdout.write(f'{mode}: ' + ', '.join(f'{key}={value}' for key, value in result.items()))
+
+    def connect(self, path, mode):
+        options = settings.DATABASES['default'].get('OPTIONS', {})
+        timeout = mode['timeout'] if mode['timeout'] is not None else options.get('timeout', 5)
+        connection = sqlite3.connect(path, timeout=timeout, isolation_level=None, check_same_thread=False)
+        pragmas = mode['pragmas'] if mode['pragmas'] is not None else settings.SQLITE_PRAGMAS
+        for pragma in pragmas.split(';'):
+            if pragma.strip():
+                connection.execute(pragma)
+        return connection
+
+    def run_mode(self, path, mode, options):
+        setup = self.connect(path, mode)
+        setup.executescript(SCHEMA)
+        setup.executemany('INSERT INTO auth_user (id) VALUES (?)', [(i,) for i in range(options['students'])])
+        setup.close()
+
+        queue = WriteQueue()
+        websites = list(range(options['websites']))
+        timings, errors = [], []
+        lock = threading.Lock()
+
+        def sync_subscriptions(connection, rng):
+            # Тот же набор запросов, что у StudentProfile.sync_subscriptions
+            student = rng.randrange(options['students'])
+            selected = set(rng.sample(websites, rng.randint(0, 8)))
+            connection.execute(mode['begin'])
+            try:
+                existing = dict(connection.execute(
+                    'SELECT website_id, is_active FROM subscription WHERE student_id = ?', (student,)
+                ).fetchall())
+                deactivate = [(student, w) for w, active in existing.items() if active and w not in selected]
+                activate = [(student, w) for w in selected & existing.keys() if not existing[w]]
+                create = [(student, w) for w in selected - existing.keys()]
+                connection.executemany(
+                    'UPDATE subscription SET is_active = 0 WHERE student_id = ? AND website_id = ?', deactivate)
+                connection.executemany(
+                    'UPDATE subscription SET is_active = 1 WHERE student_id = ? AND website_id = ?', activate)
+                connection.executemany(
+                    'INSERT INTO subscription (student_id, website_id, is_active) VALUES (?, ?, 1)', create)
+                connection.execute('COMMIT')
+            except BaseException:
+                connection.execute('ROLLBACK')
+                raise
+
+        def update_last_login(connection, rng):
+            connection.execute(mode['begin'])
+            try:
+                connection.execute(
+                    "UPDATE auth_user SET last_login = datetime('now') WHERE id = ?",
+                    (rng.randrange(options['students']),),
+                )
+                connection.execute('COMMIT')
+            except BaseException:
+                connection.execute('ROLLBACK')
+                raise
+
+        def worker(seed):
+            rng = random.Random(seed)
+            connection = self.connect(path, mode)
+            local_timings, local_errors = [], 0
+            for _ in range(options['operations']):
+                operation = sync_subscriptions if rng.random() < 0.7 else update_last_login
+                started = time.perf_counter()
+                try:
+                    if mode['queue']:
+                        queue.run(operation, connection, rng)
+                    else:
+                        operation(connection, rng)
+                except sqlite3.OperationalError:
+                    local_errors += 1
+                local_timings.append(time.perf_counter() - started)
+            connection.close()
+            with lock:
+                timings.extend(local_timings)
+                errors.append(local_errors)
+
+        threads = [threading.Thread(target=worker, args=(seed,)) for seed in range(options['threads'])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        quantiles = statistics.quantiles(timings, n=100) if len(timings) > 1 else timings * 99
+        succeeded = len(timings) - sum(errors)
+        return {
+            'operations': len(timings),
+            'locked_errors': sum(errors),
+            'seconds': round(elapsed, 3),
+            'writes_per_second': round(succeeded / elapsed, 1) if elapsed else None,
+            'p50_ms': round(quantiles[49] * 1000, 2),
+            'p99_ms': round(quantiles[98] * 1000, 2),
+        }
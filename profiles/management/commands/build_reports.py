@@ -0,0 +1,35 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from profiles.reports import DEFAULT_CHUNK_SIZE, REPORTS, build_report
+
+
+class Command(BaseCommand):
+    help = (
+        'Собирает снимки отчетов для страницы отчетов. По умолчанию обновляет '
+        'только открытые дни (с прошлого обновления по сегодня); --full '
+        'пересобирает отчет целиком новой версией.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('reports', nargs='*',
+                            help=f"Отчеты для сборки: {', '.join(sorted(REPORTS))} (по умолчанию - все)")
+        parser.add_argument('--full', action='store_true', help='Полная пересборка')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                            help='Строк отчета в одной транзакции при полной сборке')
+        parser.add_argument('--json', action='store_true', help='Вывести итог в JSON')
+
+    def handle(self, *args, **options):
+        unknown = set(options['reports']) - set(REPORTS)
+        if unknown:
+            raise CommandError(f"Неизвестные отчеты: {', '.join(sorted(unknown))}")
+        for report_type in options['reports'] or sorted(REPORTS):
+            stats = build_report(report_type, full=options['full'], chunk_size=options['chunk_size'])
+            if options['json']:
+                self.stdout.write(json.dumps(stats, ensure_ascii=False, sort_keys=True))
+            else:
+                self.stdout.write(
+                    f"{stats['report']}: {stats['mode']}, версия {stats['version']}, "
+                    f"записано строк {stats['rows_written']}, всего {stats['rows']}; {stats['seconds']} с"
+                )
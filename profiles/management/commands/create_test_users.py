@@ -1,11 +1,36 @@
-from django.core.management.base import BaseCommand
+import time
+from multiprocessing import Pool
+
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth.hashers import make_password
 from django.contrib.auth.models import User
-from profiles.models import StudentProfile
+from django.db import transaction
+from profiles.models import StudentProfile, Subscription, Website
+from profiles.seeding import generate_students_chunk
 
 class Command(BaseCommand):
     help = 'Создает тестовых пользователей для LDAP тестирования'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=0,
+                            help='Сгенерировать N синтетических студентов (режим нагрузочных данных)')
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Число процессов для генерации данных')
+        parser.add_argument('--batch-size', type=int, default=2000,
+                            help='Размер пачки для bulk_create')
+        parser.add_argument('--max-subscriptions', type=int, default=5,
+                            help='Максимум подписок на одного студента')
+        parser.add_argument('--prefix', default='loadtest',
+                            help='Префикс логинов синтетических студентов')
+        parser.add_argument('--password', default='password123',
+                            help='Пароль синтетических студентов')
+        parser.add_argument('--seed', type=int, default=42,
+                            help='Зерно генератора случайных чисел')
+
     def handle(self, *args, **options):
+        if options['count']:
+            return self.handle_scale(options)
+        
         # Тестовые пользователи
         test_users = [
             {
@@ -136,4 +161,79 @@ class Command(BaseCommand):
 
         self.stdout.write(
             self.style.SUCCESS(f'Обработано {len(test_users)} тестовых пользователей')
-        )
\ No newline at end of file
+        )
+
+    def handle_scale(self, options):
+        """
+        Массовая генерация: один хэш пароля на всех, пачки bulk_create
+        без сигналов post_save, генерация данных в нескольких процессах
+        """
+        count, batch_size = options['count'], options['batch_size']
+        if count < 0 or batch_size <= 0 or options['workers'] <= 0:
+            raise CommandError('--count, --batch-size и --workers должны быть положительными')
+        
+        faculties = [code for code, _ in StudentProfile.FACULTY_CHOICES]
+        website_ids = list(Website.objects.filter(is_active=True).values_list('id', flat=True))
+        if not website_ids:
+            self.stdout.write(self.style.WARNING(
+                'Нет активных сайтов - подписки созданы не будут (см. create_test_websites)'
+            ))
+        password = make_password(options['password'])
+        
+        chunks = [
+            (start, min(batch_size, count - start), options['prefix'], faculties,
+             website_ids, options['max_subscriptions'], options['seed'])
+            for start in range(0, count, batch_size)
+        ]
+        
+        started = time.monotonic()
+        created = 0
+        if options['workers'] > 1:
+            with Pool(options['workers']) as pool:
+                for students in pool.imap(generate_students_chunk, chunks):
+                    created += self.write_chunk(students, password, batch_size)
+                    self.report_progress(created, count, started)
+        else:
+            for chunk in chunks:
+                created += self.write_chunk(generate_students_chunk(chunk), password, batch_size)
+                self.report_progress(created, count, started)
+        
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано {created} студентов из {count} за {elapsed:.1f} с '
+            f'({created / elapsed if elapsed else 0:.0f} в секунду)'
+        ))
+
+    def write_chunk(self, students, password, batch_size):
+        """Записывает пачку: пользователи, профили, подписки - три массовые вставки"""
+        with transaction.atomic():
+            usernames = [user_data['username'] for user_data, _, _ in students]
+            existing = set(User.objects.filter(username__in=usernames).values_list('username', flat=True))
+            User.objects.bulk_create([
+                User(password=password, is_active=True, **user_data)
+                for user_data, _, _ in students
+                if user_data['username'] not in existing
+            ], batch_size=batch_size)
+            
+            user_ids = dict(User.objects.filter(username__in=usernames).values_list('username', 'id'))
+            StudentProfile.objects.bulk_create([
+                StudentProfile(user_id=user_ids[user_data['username']], **profile_data)
+                for user_data, profile_data, _ in students
+                if user_data['username'] not in existing
+            ], batch_size=batch_size)
+            
+            new_user_ids = [user_ids[name] for name in usernames if name not in existing]
+            profile_ids = dict(
+                StudentProfile.objects.filter(user_id__in=new_user_ids).values_list('user_id', 'id')
+            )
+            Subscription.objects.bulk_create([
+                Subscription(student_id=profile_ids[user_ids[user_data['username']]], website_id=website_id)
+                for user_data, _, website_ids in students
+                if user_data['username'] not in existing
+                for website_id in website_ids
+            ], batch_size=batch_size)
+        return len(new_user_ids)
+
+    def report_progress(self, created, count, started):
+        elapsed = time.monotonic() - started
+        self.stdout.write(f'  {created}/{count} ({created / elapsed if elapsed else 0:.0f} в секунду)')
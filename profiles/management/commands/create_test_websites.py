@@ -1,9 +1,19 @@
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from profiles.catalogue import bump_catalogue_version
 from profiles.models import Website, WebsiteCategory
+from profiles.seeding import generate_websites
 
 class Command(BaseCommand):
     help = 'Создает тестовые сайты для системы подписок'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=0,
+                            help='Сгенерировать N синтетических сайтов (режим нагрузочных данных)')
+        parser.add_argument('--batch-size', type=int, default=2000,
+                            help='Размер пачки для bulk_create')
+        parser.add_argument('--seed', type=int, default=42,
+                            help='Зерно генератора случайных чисел')
+
     def handle(self, *args, **options):
         # Создаем категории
         categories = {
@@ -23,6 +33,9 @@ class Command(BaseCommand):
             if created:
                 self.stdout.write(f'Создана категория: {name}')
 
+        if options['count']:
+            return self.handle_scale(options, [category.id for category in created_categories.values()])
+
         # Создаем тестовые сайты
         test_websites = [
             {
@@ -142,4 +155,26 @@ class Command(BaseCommand):
 
         self.stdout.write(
             self.style.SUCCESS(f'Успешно создано {created_count} тестовых сайтов!')
-        )
\ No newline at end of file
+        )
+
+    def handle_scale(self, options, category_ids):
+        """Массовое создание сайтов пачками bulk_create, продолжая нумерацию"""
+        count, batch_size = options['count'], options['batch_size']
+        if count < 0 or batch_size <= 0:
+            raise CommandError('--count и --batch-size должны быть положительными')
+        
+        offset = Website.objects.filter(name__startswith='Сервис ').count()
+        created_count = 0
+        for start in range(offset, offset + count, batch_size):
+            size = min(batch_size, offset + count - start)
+            Website.objects.bulk_create(
+                [Website(**site_data) for site_data in generate_websites(start, size, category_ids, options['seed'])],
+                batch_size=batch_size,
+            )
+            created_count += size
+        # bulk_create не шлет сигналы - обновляем версию каталога сами
+        bump_catalogue_version()
+        
+        self.stdout.write(
+            self.style.SUCCESS(f'Успешно создано {created_count} синтетических сайтов!')
+        )
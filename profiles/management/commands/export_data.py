@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from profiles.exports import DEFAULT_CHUNK_SIZE, EXPORTS, FORMATS, stream_export
+
+
+class Command(BaseCommand):
+    help = (
+        'Выгружает студентов, подписки (с сайтом и категорией) или решения о '
+        'доступе в CSV или JSONL. Строки читаются пачками по первичному ключу '
+        'и пишутся сразу, память не зависит от объема выгрузки.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('export', choices=sorted(EXPORTS), help='Что выгружать')
+        parser.add_argument('--format', choices=sorted(FORMATS), default='csv', help='Формат файла')
+        parser.add_argument('--output', help='Файл выгрузки (по умолчанию - стандартный вывод)')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                            help='Строк в одном запросе к базе')
+
+    def handle(self, *args, **options):
+        lines = stream_export(options['export'], options['format'], chunk_size=options['chunk_size'])
+        if not options['output']:
+            for line in lines:
+                self.stdout.write(line, ending='')
+            return
+        rows = 0
+        with open(options['output'], 'w', encoding='utf-8', newline='') as handle:
+            for line in lines:
+                handle.write(line)
+                rows += 1
+        if options['format'] == 'csv':
+            rows -= 1
+        self.stderr.write(f"Выгружено строк: {rows} в {options['output']}")
@@ -0,0 +1,71 @@
+import json
+import os
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from profiles.roster_import import DEFAULT_CHUNK_SIZE, import_roster, read_rows
+
+
+class Command(BaseCommand):
+    help = (
+        'Импортирует список студентов из CSV или JSONL (по строке на студента). '
+        'Колонки: student_id, username, email, first_name, last_name, faculty, '
+        'course, group, phone. Файл читается потоком, профили записываются '
+        'пачками по student_id; отклоненные строки перечисляются с причинами.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл списка или "-" для стандартного ввода')
+        parser.add_argument('--format', choices=['csv', 'jsonl'],
+                            help='Формат файла (по умолчанию - по расширению)')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                            help='Строк в одной транзакции')
+        parser.add_argument('--rejects', help='Записать отклоненные строки в файл (JSONL)')
+        parser.add_argument('--show-rejects', type=int, default=20,
+                            help='Сколько отклоненных строк вывести на экран')
+        parser.add_argument('--json', action='store_true', help='Вывести итог в JSON')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format']
+        if fmt is None:
+            if path == '-':
+                raise CommandError('Для стандартного ввода укажите --format')
+            fmt = 'jsonl' if os.path.splitext(path)[1].lower() in ('.jsonl', '.ndjson') else 'csv'
+
+        rejects_file = open(options['rejects'], 'w', encoding='utf-8') if options['rejects'] else None
+        shown = []
+
+        def on_reject(line_number, reason):
+            if len(shown) < options['show_rejects']:
+                shown.append((line_number, reason))
+            if rejects_file is not None:
+                rejects_file.write(json.dumps({'line': line_number, 'reason': reason}, ensure_ascii=False) + '\n')
+
+        try:
+            if path == '-':
+                stats = import_roster(read_rows(sys.stdin, fmt), options['chunk_size'], on_reject)
+            else:
+                try:
+                    stream = open(path, encoding='utf-8-sig', newline='')
+                except OSError as exc:
+                    raise CommandError(f'Не удалось открыть {path}: {exc}')
+                with stream:
+                    stats = import_roster(read_rows(stream, fmt), options['chunk_size'], on_reject)
+        finally:
+            if rejects_file is not None:
+                rejects_file.close()
+
+        if options['json']:
+            self.stdout.write(json.dumps(stats, ensure_ascii=False, sort_keys=True))
+        else:
+            self.stdout.write(
+                f"Строк: {stats['rows']}, отклонено {stats['rejected']}, повторов билетов {stats['duplicates']}; "
+                f"создано пользователей {stats['users_created']}, обновлено {stats['users_updated']}, "
+                f"профилей {stats['profiles_written']}; {stats['seconds']} с, {stats['rows_per_second']} строк/с"
+            )
+        for line_number, reason in shown:
+            self.stderr.write(f'Строка {line_number}: {reason}')
+        if stats['rejected'] > len(shown):
+            self.stderr.write(f"... и еще {stats['rejected'] - len(shown)} отклоненных строк")
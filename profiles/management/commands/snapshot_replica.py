@@ -0,0 +1,50 @@
+import os
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        'Снимает копию основной базы SQLite в файл реплики (DATABASE_REPLICA) '
+        'через online backup API. Файл заменяется атомарно, так что читатели '
+        'видят либо старый, либо новый снимок целиком.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target', help='Файл реплики (по умолчанию DATABASE_REPLICA)')
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Повторять каждые N секунд (0 - один снимок)')
+
+    def handle(self, *args, **options):
+        source = settings.DATABASES['default']
+        if source['ENGINE'] != 'django.db.backends.sqlite3':
+            raise CommandError('Снимки поддерживаются только для SQLite')
+        target = options['target'] or settings.DATABASE_REPLICA
+        if not target:
+            raise CommandError('Не задан файл реплики: DATABASE_REPLICA или --target')
+        if os.path.abspath(target) == os.path.abspath(source['NAME']):
+            raise CommandError('Файл реплики совпадает с основной базой')
+
+        while True:
+            started = time.perf_counter()
+            self.snapshot(str(source['NAME']), str(target))
+            self.stdout.write(f'Снимок {target} готов за {time.perf_counter() - started:.3f} с')
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
+
+    def snapshot(self, source_path, target_path):
+        temporary = f'{target_path}.tmp'
+        source = sqlite3.connect(source_path, timeout=20)
+        target = sqlite3.connect(temporary)
+        try:
+            source.backup(target)
+            # Реплика только читается - журнал WAL ей не нужен
+            target.execute('PRAGMA journal_mode=DELETE')
+        finally:
+            target.close()
+            source.close()
+        os.replace(temporary, target_path)
@@ -0,0 +1,46 @@
+import json
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from profiles.group_sync import sync_groups
+from profiles.ldap_client import DirectoryUnavailable, get_directory_client
+
+
+class Command(BaseCommand):
+    help = (
+        'Переносит группы каталога и членство в них в auth.Group. Записывает '
+        'только разницу с базой, пачками по отдельным транзакциям. После первой '
+        'синхронизации проверки доступа могут отвечать по базе (DIRECTORY_GROUPS_FROM_DB).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=settings.DIRECTORY_SYNC_CHUNK_SIZE,
+                            help='Строк в одной транзакции')
+        parser.add_argument('--page-size', type=int, default=500, help='Записей на страницу поиска')
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Повторять каждые N секунд (0 - один проход)')
+        parser.add_argument('--json', action='store_true', help='Вывести результат в JSON')
+
+    def handle(self, *args, **options):
+        client = get_directory_client()
+        while True:
+            try:
+                stats = sync_groups(client, chunk_size=options['chunk_size'], page_size=options['page_size'])
+            except DirectoryUnavailable as exc:
+                if not options['interval']:
+                    raise CommandError(f'Каталог недоступен: {exc}')
+                self.stderr.write(f'Каталог недоступен: {exc}')
+            else:
+                if options['json']:
+                    self.stdout.write(json.dumps(stats, ensure_ascii=False, sort_keys=True))
+                else:
+                    self.stdout.write(
+                        f"Групп: {stats['groups']} (новых {stats['groups_created']}), "
+                        f"членство +{stats['memberships_added']} -{stats['memberships_removed']}, "
+                        f"нет в базе: {stats['unknown_users']}, {stats['seconds']} с"
+                    )
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,47 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from profiles.ldap_client import DirectoryUnavailable, get_directory_client
+from profiles.user_sync import sync_users
+
+
+class Command(BaseCommand):
+    help = (
+        'Переносит пользователей каталога в User и StudentProfile. Запрашивает '
+        'только записи, измененные после прошлого прохода (modifyTimestamp), и '
+        'обрабатывает постраничный ответ потоком, по транзакции на страницу.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page-size', type=int, default=500, help='Записей на страницу поиска')
+        parser.add_argument('--full', action='store_true', help='Пройти весь каталог, а не только изменения')
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Повторять каждые N секунд (0 - один проход)')
+        parser.add_argument('--json', action='store_true', help='Вывести результат в JSON')
+
+    def handle(self, *args, **options):
+        client = get_directory_client()
+        full = options['full']
+        while True:
+            try:
+                stats = sync_users(client, page_size=options['page_size'], full=full)
+            except DirectoryUnavailable as exc:
+                if not options['interval']:
+                    raise CommandError(f'Каталог недоступен: {exc}')
+                self.stderr.write(f'Каталог недоступен: {exc}')
+            else:
+                full = False
+                if options['json']:
+                    self.stdout.write(json.dumps(stats, ensure_ascii=False, sort_keys=True))
+                else:
+                    self.stdout.write(
+                        f"Записей: {stats['entries']} ({stats['pages']} стр.) с {stats['since'] or 'начала'}, "
+                        f"создано {stats['users_created']}, обновлено {stats['users_updated']}, "
+                        f"профилей {stats['profiles_written']}, пропущено {stats['skipped']}, "
+                        f"конфликтов билетов {stats['conflicts']}, {stats['seconds']} с"
+                    )
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
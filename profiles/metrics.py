@@ -0,0 +1,288 @@
+"""
+Метрики запросов в текстовом формате Prometheus.
+
+MetricsMiddleware для каждого имени URL считает задержку (гистограмма),
+число и суммарное время SQL-запросов и размер ответов. Обращения к
+каталогу и проверки доступа из ldap_utils замеряются декоратором timed.
+
+Каждый процесс копит метрики в памяти. Если задан METRICS_DIR, процесс
+не реже раза в METRICS_FLUSH_INTERVAL секунд сбрасывает свой снимок в
+METRICS_DIR/metrics-<pid>.json, а /metrics суммирует снимки всех
+процессов, так что счетчики работают при нескольких воркерах.
+"""
+import functools
+import glob
+import inspect
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+METRIC_HELP = {
+    'identica_http_requests_total': ('counter', 'Обработанные запросы'),
+    'identica_http_request_duration_seconds': ('histogram', 'Время обработки запроса'),
+    'identica_http_sql_queries_total': ('counter', 'SQL-запросы, выполненные при обработке запросов'),
+    'identica_http_sql_duration_seconds_total': ('counter', 'Суммарное время SQL-запросов'),
+    'identica_http_response_bytes_total': ('counter', 'Суммарный размер ответов'),
+    'identica_directory_call_duration_seconds': ('histogram', 'Время обращений к каталогу и проверок доступа'),
+    'identica_auth_backend_duration_seconds': ('histogram', 'Время проверки входа по бэкендам'),
+    'identica_login_ratelimited_total': ('counter', 'Попытки входа, отклоненные ограничителем'),
+    'identica_write_queue_wait_seconds': ('histogram', 'Ожидание в очереди записей SQLite'),
+    'identica_directory_sync_duration_seconds': ('histogram', 'Время синхронизации с каталогом'),
+    'identica_directory_sync_rows_total': ('counter', 'Строки, измененные синхронизацией с каталогом'),
+    'identica_report_build_duration_seconds': ('histogram', 'Время сборки снимков отчетов'),
+}
+
+
+def _labels_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+class MetricsRegistry:
+    """Счетчики и гистограммы процесса"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._counters = defaultdict(float)
+            self._histograms = {}
+            self._last_flush = 0.0
+
+    def inc(self, name, labels, value=1):
+        with self._lock:
+            self._counters[(name, _labels_key(labels))] += value
+
+    def observe(self, name, labels, value, buckets=LATENCY_BUCKETS):
+        key = (name, _labels_key(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = {
+                    'buckets': list(buckets), 'counts': [0] * len(buckets), 'sum': 0.0, 'count': 0,
+                }
+            for index, bound in enumerate(histogram['buckets']):
+                if value <= bound:
+                    histogram['counts'][index] += 1
+            histogram['sum'] += value
+            histogram['count'] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'counters': [[name, list(map(list, labels)), value]
+                             for (name, labels), value in self._counters.items()],
+                'histograms': [[name, list(map(list, labels)), dict(histogram, counts=list(histogram['counts']))]
+                               for (name, labels), histogram in self._histograms.items()],
+            }
+
+    def flush(self, force=False):
+        """Сбрасывает снимок процесса в METRICS_DIR (не чаще METRICS_FLUSH_INTERVAL)"""
+        directory = getattr(settings, 'METRICS_DIR', None)
+        if not directory:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_flush < getattr(settings, 'METRICS_FLUSH_INTERVAL', 5):
+            return
+        self._last_flush = now
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f'metrics-{os.getpid()}.json')
+        with open(path + '.tmp', 'w', encoding='utf-8') as handle:
+            json.dump(self.snapshot(), handle)
+        os.replace(path + '.tmp', path)
+
+
+registry = MetricsRegistry()
+
+
+def collect_snapshots():
+    """Снимки всех процессов (или только текущего, если METRICS_DIR не задан)"""
+    directory = getattr(settings, 'METRICS_DIR', None)
+    if not directory:
+        return [registry.snapshot()]
+    registry.flush(force=True)
+    snapshots = []
+    for path in sorted(glob.glob(os.path.join(directory, 'metrics-*.json'))):
+        try:
+            with open(path, encoding='utf-8') as handle:
+                snapshots.append(json.load(handle))
+        except (OSError, ValueError):
+            continue
+    return snapshots
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+
+def _format_number(value):
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def render_metrics(snapshots=None):
+    """Суммирует снимки и выводит их в формате Prometheus exposition 0.0.4"""
+    counters = defaultdict(float)
+    histograms = {}
+    for snapshot in snapshots if snapshots is not None else collect_snapshots():
+        for name, labels, value in snapshot['counters']:
+            counters[(name, tuple(map(tuple, labels)))] += value
+        for name, labels, histogram in snapshot['histograms']:
+            key = (name, tuple(map(tuple, labels)))
+            merged = histograms.setdefault(key, {
+                'buckets': histogram['buckets'], 'counts': [0] * len(histogram['buckets']), 'sum': 0.0, 'count': 0,
+            })
+            merged['counts'] = [a + b for a, b in zip(merged['counts'], histogram['counts'])]
+            merged['sum'] += histogram['sum']
+            merged['count'] += histogram['count']
+
+    by_name = defaultdict(list)
+    for (name, labels), value in counters.items():
+        by_name[name].append((labels, value))
+    for (name, labels), histogram in histograms.items():
+        by_name[name].append((labels, histogram))
+
+    lines = []
+    for name in sorted(by_name):
+        kind, help_text = METRIC_HELP.get(name, ('untyped', name))
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        for labels, value in sorted(by_name[name], key=lambda item: item[0]):
+            if isinstance(value, dict):
+                for bound, count in zip(value['buckets'] + [float('inf')], value['counts'] + [value['count']]):
+                    bucket_labels = labels + (('le', _format_number(bound)),)
+                    lines.append(f'{name}_bucket{_format_labels(bucket_labels)} {count}')
+                lines.append(f'{name}_sum{_format_labels(labels)} {_format_number(value["sum"])}')
+                lines.append(f'{name}_count{_format_labels(labels)} {value["count"]}')
+            else:
+                lines.append(f'{name}{_format_labels(labels)} {_format_number(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+def timed(call_name):
+    """Декоратор: замеряет время вызова в identica_directory_call_duration_seconds"""
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    registry.observe('identica_directory_call_duration_seconds', {'call': call_name},
+                                     time.perf_counter() - started)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                registry.observe('identica_directory_call_duration_seconds', {'call': call_name},
+                                 time.perf_counter() - started)
+        return wrapper
+    return decorator
+
+
+class SQLCounter:
+    """Число и суммарное время SQL-запросов одного HTTP-запроса"""
+
+    def __init__(self):
+        self.queries = 0
+        self.duration = 0.0
+
+
+# Счетчик текущего запроса. Контекст переходит в поток sync_to_async, так что
+# под ASGI учитываются и запросы синхронных представлений из потока-исполнителя
+_request_sql = ContextVar('identica_request_sql', default=None)
+
+
+def count_sql(execute, sql, params, many, context):
+    """execute_wrapper каждого соединения: пишет в счетчик текущего запроса"""
+    counter = _request_sql.get()
+    if counter is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        counter.queries += 1
+        counter.duration += time.perf_counter() - started
+
+
+def install_sql_counter(sender, connection, **kwargs):
+    """
+    Обработчик connection_created. Соединения у каждого потока свои, поэтому
+    обертка ставится при открытии соединения в том потоке, где идут запросы
+    """
+    if count_sql not in connection.execute_wrappers:
+        # В начало списка: execute_wrapper() снимает с конца свою обертку
+        connection.execute_wrappers.insert(0, count_sql)
+
+
+class MetricsMiddleware:
+    """Собирает метрики по каждому имени URL"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        sql = SQLCounter()
+        token = _request_sql.set(sql)
+        try:
+            started = time.perf_counter()
+            response = self.get_response(request)
+            duration = time.perf_counter() - started
+        finally:
+            _request_sql.reset(token)
+        self.record(request, response, sql, duration)
+        return response
+
+    async def __acall__(self, request):
+        sql = SQLCounter()
+        token = _request_sql.set(sql)
+        try:
+            started = time.perf_counter()
+            response = await self.get_response(request)
+            duration = time.perf_counter() - started
+        finally:
+            _request_sql.reset(token)
+        self.record(request, response, sql, duration)
+        return response
+
+    def record(self, request, response, sql, duration):
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else '<unresolved>'
+        labels = {'view': view, 'method': request.method}
+        registry.inc('identica_http_requests_total', dict(labels, status=str(response.status_code)))
+        registry.observe('identica_http_request_duration_seconds', labels, duration)
+        registry.inc('identica_http_sql_queries_total', labels, sql.queries)
+        registry.inc('identica_http_sql_duration_seconds_total', labels, sql.duration)
+        if not response.streaming:
+            registry.inc('identica_http_response_bytes_total', labels, len(response.content))
+        registry.flush()
@@ -0,0 +1,39 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.contrib.auth.models import User
+from django.utils.functional import SimpleLazyObject
+
+from .models import StudentProfile
+
+
+def get_student_profile(request):
+    """
+    Профиль текущего пользователя вместе с пользователем - одним запросом
+    и не более одного раза за запрос. Отсутствующий профиль создается атомарно.
+    """
+    if not hasattr(request, '_cached_student_profile'):
+        profile = None
+        if request.user.is_authenticated:
+            profiles = StudentProfile.objects.select_related('user')
+            # Сначала чтение: get_or_create всегда идет в основную базу
+            profile = profiles.filter(user=request.user).first()
+            if profile is None:
+                profile, created = profiles.get_or_create(user=request.user)
+            # user.studentprofile в шаблонах берет профиль отсюда же
+            User.studentprofile.related.set_cached_value(request.user, profile)
+        request._cached_student_profile = profile
+    return request._cached_student_profile
+
+
+class StudentProfileMiddleware:
+    """Добавляет ленивый атрибут request.student_profile"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        request.student_profile = SimpleLazyObject(lambda: get_student_profile(request))
+        return self.get_response(request)
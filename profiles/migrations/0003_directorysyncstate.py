@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-17 18:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('profiles', '0002_delete_analyticsdata_remove_report_created_by_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DirectorySyncState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True, verbose_name='Задача')),
+                ('high_water_mark', models.CharField(blank=True, max_length=20, verbose_name='Последний modifyTimestamp')),
+                ('last_run', models.DateTimeField(blank=True, null=True, verbose_name='Последний проход')),
+                ('last_entries', models.PositiveIntegerField(default=0, verbose_name='Записей в последнем проходе')),
+            ],
+            options={
+                'verbose_name': 'Синхронизация с каталогом',
+                'verbose_name_plural': 'Синхронизации с каталогом',
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-17 18:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('profiles', '0003_directorysyncstate'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='studentprofile',
+            index=models.Index(condition=models.Q(('group__isnull', False)), fields=['group'], name='studentprofile_group_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='studentprofile',
+            index=models.Index(fields=['faculty', 'course'], name='studentprofile_fac_course_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='subscription',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['student', 'website'], name='subscr_active_student_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='subscription',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['website'], name='subscr_active_website_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='website',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['category'], name='website_active_category_idx'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-17 18:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('profiles', '0004_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReportSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('report_type', models.CharField(choices=[('subscriptions', 'Отчет по подпискам'), ('students', 'Отчет по студентам'), ('activity', 'Отчет по активности'), ('roles', 'Отчет по распределению ролей')], max_length=20, unique=True, verbose_name='Тип отчета')),
+                ('version', models.PositiveIntegerField(default=0, verbose_name='Версия')),
+                ('built_at', models.DateTimeField(blank=True, null=True, verbose_name='Полная сборка')),
+                ('refreshed_at', models.DateTimeField(blank=True, null=True, verbose_name='Последнее обновление')),
+                ('open_from', models.DateField(blank=True, null=True, verbose_name='Пересчитывается с')),
+                ('row_count', models.PositiveIntegerField(default=0, verbose_name='Строк')),
+            ],
+            options={
+                'verbose_name': 'Снимок отчета',
+                'verbose_name_plural': 'Снимки отчетов',
+            },
+        ),
+        migrations.CreateModel(
+            name='ReportRow',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveIntegerField(verbose_name='Версия')),
+                ('bucket', models.DateField(verbose_name='День')),
+                ('data', models.JSONField(verbose_name='Значения')),
+                ('snapshot', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rows', to='profiles.reportsnapshot', verbose_name='Снимок')),
+            ],
+            options={
+                'verbose_name': 'Строка отчета',
+                'verbose_name_plural': 'Строки отчетов',
+                'indexes': [models.Index(fields=['snapshot', 'version', 'bucket'], name='reportrow_snapshot_bucket_idx')],
+            },
+        ),
+    ]
@@ -1,8 +1,23 @@
-from django.db import models
-from django.contrib.auth.models import User
-from django.db.models.signals import post_save
+import threading
+from functools import partial
+
+from django.db import DEFAULT_DB_ALIAS, models, transaction
+from django.db.models import BooleanField, Case, Count, Q, Value, When
+from django.contrib.auth.models import User, update_last_login
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 
+from .versioning import bump_version, bump_version_on_commit, subscriptions_version_key, user_version_key
+from .write_queue import serialized_write
+
+# Профиль заполнен, если указаны билет, факультет, курс и группа
+PROFILE_COMPLETE_Q = (
+    Q(student_id__isnull=False) & ~Q(student_id='') &
+    Q(faculty__isnull=False) & ~Q(faculty='') &
+    Q(course__isnull=False) &
+    Q(group__isnull=False) & ~Q(group='')
+)
+
 class StudentProfile(models.Model):
     FACULTY_CHOICES = [
         ('computer_science', 'Компьютерные науки'),
@@ -26,9 +41,106 @@ class StudentProfile(models.Model):
     def __str__(self):
         return f"{self.user.get_full_name()} - {self.student_id}"
     
+    def get_group_students(self):
+        """
+        Студенты группы одним запросом: пользователь, число активных
+        подписок (subscriptions_count) и заполненность профиля (profile_complete)
+        """
+        return StudentProfile.objects.filter(group=self.group).select_related('user').annotate(
+            subscriptions_count=Count('subscription', filter=Q(subscription__is_active=True)),
+            profile_complete=Case(
+                When(PROFILE_COMPLETE_Q, then=Value(True)),
+                default=Value(False),
+                output_field=BooleanField(),
+            ),
+        ).order_by('user__last_name', 'user__first_name', 'id')
+    
+    def get_group_summary(self):
+        """Статистика группы одним агрегирующим запросом (кэшируется в экземпляре)"""
+        if not hasattr(self, '_group_summary'):
+            self._group_summary = StudentProfile.objects.filter(group=self.group).aggregate(
+                students=Count('id', distinct=True),
+                filled=Count('id', filter=PROFILE_COMPLETE_Q, distinct=True),
+                active_students=Count('id', filter=Q(subscription__is_active=True), distinct=True),
+                active_subscriptions=Count('subscription', filter=Q(subscription__is_active=True)),
+            )
+        return self._group_summary
+    
+    def get_students_in_group(self):
+        return self.get_group_summary()['students']
+    
+    def get_filled_profiles(self):
+        return self.get_group_summary()['filled']
+    
+    def get_completion_percentage(self):
+        summary = self.get_group_summary()
+        if not summary['students']:
+            return 0
+        return round(summary['filled'] * 100 / summary['students'])
+    
+    def get_group_activity(self):
+        """Сколько студентов группы пользуются хотя бы одной подпиской"""
+        summary = self.get_group_summary()
+        percentage = round(summary['active_students'] * 100 / summary['students']) if summary['students'] else 0
+        return {
+            'active_students': summary['active_students'],
+            'active_subscriptions': summary['active_subscriptions'],
+            'percentage': percentage,
+        }
+    
+    @serialized_write('subscription_sync')
+    def sync_subscriptions(self, website_ids):
+        """
+        Приводит активные подписки к набору website_ids.
+        Новые подписки, повторные активации и отключения выполняются
+        тремя массовыми запросами независимо от числа сайтов,
+        в одной транзакции через очередь записей.
+        """
+        selected = set(website_ids)
+        existing = dict(
+            Subscription.objects.filter(student=self).values_list('website_id', 'is_active')
+        )
+        to_create = selected - existing.keys()
+        to_activate = {
+            website_id for website_id in selected & existing.keys()
+            if not existing[website_id]
+        }
+        to_deactivate = {
+            website_id for website_id, is_active in existing.items()
+            if is_active and website_id not in selected
+        }
+        
+        if to_deactivate:
+            Subscription.objects.filter(
+                student=self, website_id__in=to_deactivate
+            ).update(is_active=False)
+        if to_activate:
+            Subscription.objects.filter(
+                student=self, website_id__in=to_activate
+            ).update(is_active=True)
+        if to_create:
+            Subscription.objects.bulk_create([
+                Subscription(student=self, website_id=website_id, is_active=True)
+                for website_id in to_create
+            ])
+        if to_create or to_activate or to_deactivate:
+            bump_version_on_commit(subscriptions_version_key(self.user_id))
+        
+        return {
+            'created': len(to_create),
+            'activated': len(to_activate),
+            'deactivated': len(to_deactivate),
+        }
+    
     class Meta:
         verbose_name = 'Профиль студента'
         verbose_name_plural = 'Профили студентов'
+        indexes = [
+            # Список и сводка группы; у незаполненных профилей группы нет - их в индексе нет
+            models.Index(fields=['group'], condition=Q(group__isnull=False), name='studentprofile_group_idx'),
+            # Фильтры админки и отчеты по факультетам и курсам
+            models.Index(fields=['faculty', 'course'], name='studentprofile_fac_course_idx'),
+        ]
 
 class WebsiteCategory(models.Model):
     name = models.CharField(max_length=50, verbose_name='Название')
@@ -54,6 +166,12 @@ class Website(models.Model):
     class Meta:
         verbose_name = 'Веб-сайт'
         verbose_name_plural = 'Веб-сайты'
+        indexes = [
+            # Снимок каталога: активные сайты по категориям. Django пишет условие
+            # is_active=True в SQLite как голый столбец, и составной индекс
+            # (is_active, category) планировщик не использует - нужен частичный
+            models.Index(fields=['category'], condition=Q(is_active=True), name='website_active_category_idx'),
+        ]
 
 class Subscription(models.Model):
     student = models.ForeignKey(StudentProfile, on_delete=models.CASCADE, verbose_name='Студент')
@@ -65,16 +183,136 @@ class Subscription(models.Model):
         unique_together = ('student', 'website')
         verbose_name = 'Подписка'
         verbose_name_plural = 'Подписки'
+        indexes = [
+            # Активные подписки студента (профиль, главная, выбор сайтов): только
+            # активные строки, website_id в индексе - таблицу читать не нужно
+            models.Index(fields=['student', 'website'], condition=Q(is_active=True),
+                         name='subscr_active_student_idx'),
+            # Активные подписчики сайта и подсчеты по сайтам
+            models.Index(fields=['website'], condition=Q(is_active=True), name='subscr_active_website_idx'),
+        ]
     
     def __str__(self):
         return f"{self.student} - {self.website}"
 
+class DirectorySyncState(models.Model):
+    """Отметка синхронизации с каталогом: с какого modifyTimestamp начинать следующий проход"""
+    name = models.CharField(max_length=50, unique=True, verbose_name='Задача')
+    high_water_mark = models.CharField(max_length=20, blank=True, verbose_name='Последний modifyTimestamp')
+    last_run = models.DateTimeField(null=True, blank=True, verbose_name='Последний проход')
+    last_entries = models.PositiveIntegerField(default=0, verbose_name='Записей в последнем проходе')
+    
+    def __str__(self):
+        return f"{self.name}: {self.high_water_mark or '-'}"
+    
+    class Meta:
+        verbose_name = 'Синхронизация с каталогом'
+        verbose_name_plural = 'Синхронизации с каталогом'
+
+class ReportSnapshot(models.Model):
+    """
+    Готовый отчет. Строки текущей версии - ReportRow с version = self.version;
+    полная пересборка пишет строки новой версии и переключает ее одной записью
+    """
+    REPORT_TYPES = [
+        ('subscriptions', 'Отчет по подпискам'),
+        ('students', 'Отчет по студентам'),
+        ('activity', 'Отчет по активности'),
+        ('roles', 'Отчет по распределению ролей'),
+    ]
+    
+    report_type = models.CharField(max_length=20, choices=REPORT_TYPES, unique=True, verbose_name='Тип отчета')
+    version = models.PositiveIntegerField(default=0, verbose_name='Версия')
+    built_at = models.DateTimeField(null=True, blank=True, verbose_name='Полная сборка')
+    refreshed_at = models.DateTimeField(null=True, blank=True, verbose_name='Последнее обновление')
+    # Дни раньше этой даты закрыты; этот и следующие пересчитываются при обновлении
+    open_from = models.DateField(null=True, blank=True, verbose_name='Пересчитывается с')
+    row_count = models.PositiveIntegerField(default=0, verbose_name='Строк')
+    
+    def __str__(self):
+        return f"{self.get_report_type_display()} v{self.version}"
+    
+    class Meta:
+        verbose_name = 'Снимок отчета'
+        verbose_name_plural = 'Снимки отчетов'
+
+class ReportRow(models.Model):
+    snapshot = models.ForeignKey(ReportSnapshot, on_delete=models.CASCADE, related_name='rows', verbose_name='Снимок')
+    version = models.PositiveIntegerField(verbose_name='Версия')
+    bucket = models.DateField(verbose_name='День')
+    data = models.JSONField(verbose_name='Значения')
+    
+    class Meta:
+        verbose_name = 'Строка отчета'
+        verbose_name_plural = 'Строки отчетов'
+        indexes = [
+            models.Index(fields=['snapshot', 'version', 'bucket'], name='reportrow_snapshot_bucket_idx'),
+        ]
+
 @receiver(post_save, sender=User)
 def create_student_profile(sender, instance, created, **kwargs):
     if created:
         StudentProfile.objects.create(user=instance)
 
 @receiver(post_save, sender=User)
-def save_student_profile(sender, instance, **kwargs):
+def save_student_profile(sender, instance, update_fields=None, **kwargs):
+    # Частичное сохранение пользователя (last_login, синхронизация с каталогом)
+    # не затрагивает профиль - пересохранять его незачем
+    if update_fields is not None:
+        return
     if hasattr(instance, 'studentprofile'):
-        instance.studentprofile.save()
\ No newline at end of file
+        instance.studentprofile.save()
+
+
+# Профили подписок, удаленных запросом по набору строк: {база: (проверка при фиксации, {id профиля})}
+_pending_students = threading.local()
+
+
+def _bump_pending_subscriptions(using):
+    """Версии подписок собранных профилей - одним запросом при фиксации"""
+    _, student_ids = _pending_students.__dict__.pop(using, (None, None))
+    if student_ids:
+        for user_id in StudentProfile.objects.using(using).filter(
+                pk__in=student_ids).values_list('user_id', flat=True):
+            bump_version(subscriptions_version_key(user_id))
+
+
+@receiver(post_save, sender=Subscription)
+@receiver(post_delete, sender=Subscription)
+def invalidate_student_subscriptions(sender, instance, using=None, origin=None, **kwargs):
+    # Массовые изменения в sync_subscriptions меняют версию сами
+    origin_model = origin.model if isinstance(origin, models.QuerySet) else type(origin)
+    if origin is not None and origin_model is not Subscription:
+        # Каскад от сайта, категории, профиля или пользователя: их удаление меняет
+        # версию каталога или пользователя, и страницы сбрасываются по ней
+        return
+    if isinstance(origin, models.QuerySet) and not Subscription.student.is_cached(instance):
+        # Удаление набора подписок: профили не читаются для каждой строки,
+        # а собираются и читаются одним запросом при фиксации
+        using = using or DEFAULT_DB_ALIAS
+        pending = _pending_students.__dict__.get(using)
+        queued = transaction.get_connection(using).run_on_commit
+        if pending is None or not any(func is pending[0] for _, func, _ in queued):
+            # Одна проверка при фиксации на весь набор. После отката транзакции
+            # проверки в очереди уже нет - собираем заново
+            callback = partial(_bump_pending_subscriptions, using)
+            _pending_students.__dict__[using] = (callback, {instance.student_id})
+            transaction.on_commit(callback, using=using)
+        else:
+            pending[1].add(instance.student_id)
+        return
+    bump_version_on_commit(subscriptions_version_key(instance.student.user_id), using)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=StudentProfile)
+@receiver(post_delete, sender=StudentProfile)
+def invalidate_user_pages(sender, instance, using=None, **kwargs):
+    user_id = instance.pk if sender is User else instance.user_id
+    bump_version_on_commit(user_version_key(user_id), using)
+
+
+@serialized_write('last_login')
+def queued_update_last_login(sender, user, **kwargs):
+    """update_last_login из django.contrib.auth через очередь записей"""
+    update_last_login(sender, user, **kwargs)
@@ -0,0 +1,123 @@
+"""
+Ограничение частоты попыток входа.
+
+Корзины токенов по имени пользователя и по IP клиента хранятся в отдельном
+файле SQLite (LOGIN_RATELIMIT_DB), поэтому лимит общий для всех воркеров.
+Каждая попытка забирает токен из обеих корзин, токены восстанавливаются
+равномерно: полная корзина на LOGIN_RATELIMIT_* = (попыток, окно в секундах).
+Проверка - один BEGIN IMMEDIATE и поиск по первичному ключу; записи, которые
+успели восстановиться полностью, считаются пустыми и периодически удаляются.
+"""
+import sqlite3
+import threading
+import time
+
+from django.conf import settings
+
+from .metrics import registry
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS login_buckets (
+    key TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated REAL NOT NULL,
+    expires REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS login_buckets_expires ON login_buckets (expires);
+'''
+
+
+class LoginRateLimiter:
+    """Общие для процессов корзины токенов для попыток входа"""
+
+    def __init__(self, timer=time.time):
+        self.timer = timer
+        self._local = threading.local()
+        self._last_prune = 0.0
+
+    def _connection(self):
+        path = str(settings.LOGIN_RATELIMIT_DB)
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.path != path:
+            connection = sqlite3.connect(path, timeout=5, isolation_level=None, check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.executescript(SCHEMA)
+            self._local.connection, self._local.path = connection, path
+        return connection
+
+    def buckets(self, username, ip):
+        """Ключи корзин и их лимиты (capacity, window)"""
+        buckets = []
+        if username:
+            buckets.append((f'user:{username.strip().lower()}', settings.LOGIN_RATELIMIT_USERNAME))
+        if ip:
+            buckets.append((f'ip:{ip}', settings.LOGIN_RATELIMIT_IP))
+        return buckets
+
+    def hit(self, username, ip):
+        """
+        Засчитывает попытку входа. Возвращает 0, если попытка разрешена,
+        иначе число секунд до появления токена; отклоненная попытка токены не тратит.
+        """
+        buckets = self.buckets(username, ip)
+        if not buckets:
+            return 0
+        now = self.timer()
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            state, retry_after, limited_scope = [], 0, None
+            for key, (capacity, window) in buckets:
+                rate = capacity / window
+                row = connection.execute(
+                    'SELECT tokens, updated, expires FROM login_buckets WHERE key = ?', (key,)
+                ).fetchone()
+                if row is None or row[2] <= now:
+                    tokens = float(capacity)
+                else:
+                    tokens = min(capacity, row[0] + (now - row[1]) * rate)
+                if tokens < 1:
+                    wait = (1 - tokens) / rate
+                    if wait > retry_after:
+                        retry_after, limited_scope = wait, key.split(':', 1)[0]
+                state.append((key, tokens - 1, capacity, rate))
+            if not retry_after:
+                connection.executemany(
+                    'INSERT INTO login_buckets (key, tokens, updated, expires) VALUES (?, ?, ?, ?) '
+                    'ON CONFLICT(key) DO UPDATE SET tokens = excluded.tokens, '
+                    'updated = excluded.updated, expires = excluded.expires',
+                    [(key, tokens, now, now + (capacity - tokens) / rate) for key, tokens, capacity, rate in state],
+                )
+            if now - self._last_prune > settings.LOGIN_RATELIMIT_PRUNE_INTERVAL:
+                self._last_prune = now
+                connection.execute('DELETE FROM login_buckets WHERE expires <= ?', (now,))
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+
+        if retry_after:
+            registry.inc('identica_login_ratelimited_total', {'scope': limited_scope})
+        return retry_after
+
+    def reset(self):
+        connection = self._connection()
+        connection.execute('DELETE FROM login_buckets')
+
+
+login_limiter = LoginRateLimiter()
+
+
+def client_ip(request):
+    """IP клиента; X-Forwarded-For учитывается только за доверенным прокси"""
+    if getattr(settings, 'LOGIN_RATELIMIT_TRUST_FORWARDED', False):
+        forwarded = request.META.get('HTTP_X_FORWARDED_FOR', '')
+        if forwarded:
+            return forwarded.split(',')[0].strip()
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def check_login_attempt(request):
+    """Засчитывает POST входа; 0 - попытка разрешена, иначе секунды до следующей"""
+    return login_limiter.hit(request.POST.get('username', ''), client_ip(request))
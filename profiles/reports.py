@@ -0,0 +1,221 @@
+"""
+Отчеты для администраторов: готовые снимки вместо расчета по запросу.
+
+Каждый отчет - один SQL-запрос с GROUP BY по дню и измерениям отчета;
+результат сохраняется строками ReportRow снимка ReportSnapshot, а
+страница отчета только читает готовые строки постранично.
+
+Полная сборка пишет строки новой версии пачками в отдельных транзакциях
+и переключает версию снимка одной записью - читатели видят либо старый,
+либо новый отчет целиком. Обновление пересчитывает только открытые дни:
+начиная с open_from (день прошлого обновления) по сегодня - и заменяет их
+строки одной транзакцией. Закрытые дни не пересчитываются: изменения
+задним числом (отключенные подписки, исправленные профили) попадают в
+отчет при полной сборке, ее запускают в конце семестра.
+
+Агрегаты читаются из реплики, если она настроена.
+"""
+import datetime
+import time
+
+from django.contrib.auth.models import User
+from django.db.models import Case, CharField, Count, Q, Value, When
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .exports import chunked, export_database
+from .metrics import registry
+from .models import PROFILE_COMPLETE_Q, ReportRow, ReportSnapshot, StudentProfile, Subscription
+from .write_queue import serialized_write
+
+DEFAULT_CHUNK_SIZE = 1000
+FACULTY_LABELS = dict(StudentProfile.FACULTY_CHOICES)
+ROLE_LABELS = {
+    'admin': 'Администраторы',
+    'staff': 'Сотрудники',
+    'monitor': 'Старосты',
+    'student': 'Студенты',
+}
+
+
+def _since(queryset, field, since):
+    """Строки не раньше начала дня since (в текущем часовом поясе)"""
+    if since is None:
+        return queryset
+    start = timezone.make_aware(datetime.datetime.combine(since, datetime.time.min))
+    return queryset.filter(**{f'{field}__gte': start})
+
+
+def subscriptions_report(using, since=None):
+    queryset = _since(Subscription.objects.using(using), 'subscribed_at', since)
+    for row in queryset.annotate(bucket=TruncDate('subscribed_at')).values(
+        'bucket', 'website__category__name', 'website__name',
+    ).annotate(
+        subscriptions=Count('id'),
+        active=Count('id', filter=Q(is_active=True)),
+    ).order_by('bucket', 'website__category__name', 'website__name'):
+        yield row['bucket'], {
+            'category': row['website__category__name'],
+            'website': row['website__name'],
+            'subscriptions': row['subscriptions'],
+            'active': row['active'],
+        }
+
+
+def students_report(using, since=None):
+    queryset = _since(StudentProfile.objects.using(using), 'user__date_joined', since)
+    for row in queryset.annotate(bucket=TruncDate('user__date_joined')).values(
+        'bucket', 'faculty', 'course',
+    ).annotate(
+        students=Count('id', distinct=True),
+        complete=Count('id', filter=PROFILE_COMPLETE_Q, distinct=True),
+        subscribed=Count('id', filter=Q(subscription__is_active=True), distinct=True),
+    ).order_by('bucket', 'faculty', 'course'):
+        yield row['bucket'], {
+            'faculty': FACULTY_LABELS.get(row['faculty'], row['faculty'] or ''),
+            'course': row['course'],
+            'students': row['students'],
+            'complete': row['complete'],
+            'subscribed': row['subscribed'],
+        }
+
+
+def activity_report(using, since=None):
+    queryset = _since(Subscription.objects.using(using), 'subscribed_at', since)
+    for row in queryset.annotate(bucket=TruncDate('subscribed_at')).values(
+        'bucket', 'student__faculty',
+    ).annotate(
+        subscriptions=Count('id'),
+        students=Count('student', distinct=True),
+    ).order_by('bucket', 'student__faculty'):
+        yield row['bucket'], {
+            'faculty': FACULTY_LABELS.get(row['student__faculty'], row['student__faculty'] or ''),
+            'subscriptions': row['subscriptions'],
+            'students': row['students'],
+        }
+
+
+def roles_report(using, since=None):
+    queryset = _since(User.objects.using(using), 'date_joined', since)
+    role = Case(
+        When(is_superuser=True, then=Value('admin')),
+        When(is_staff=True, then=Value('staff')),
+        When(studentprofile__is_monitor=True, then=Value('monitor')),
+        default=Value('student'),
+        output_field=CharField(),
+    )
+    for row in queryset.annotate(bucket=TruncDate('date_joined'), role=role).values(
+        'bucket', 'role',
+    ).annotate(users=Count('id')).order_by('bucket', 'role'):
+        yield row['bucket'], {'role': ROLE_LABELS[row['role']], 'users': row['users']}
+
+
+# Тип отчета: (колонки [(ключ, заголовок)], функция расчета)
+REPORTS = {
+    'subscriptions': ([
+        ('category', 'Категория'), ('website', 'Сайт'),
+        ('subscriptions', 'Новых подписок'), ('active', 'Из них активных'),
+    ], subscriptions_report),
+    'students': ([
+        ('faculty', 'Факультет'), ('course', 'Курс'), ('students', 'Студентов'),
+        ('complete', 'Профиль заполнен'), ('subscribed', 'С подписками'),
+    ], students_report),
+    'activity': ([
+        ('faculty', 'Факультет'), ('subscriptions', 'Новых подписок'), ('students', 'Студентов'),
+    ], activity_report),
+    'roles': ([
+        ('role', 'Роль'), ('users', 'Пользователей'),
+    ], roles_report),
+}
+
+
+def _rows(snapshot, version, rows):
+    return [ReportRow(snapshot=snapshot, version=version, bucket=bucket, data=data) for bucket, data in rows]
+
+
+@serialized_write('report_rows')
+def _insert_rows(snapshot, version, rows):
+    ReportRow.objects.bulk_create(_rows(snapshot, version, rows))
+
+
+@serialized_write('report_rows')
+def _delete_rows(row_ids):
+    ReportRow.objects.filter(pk__in=row_ids).delete()
+
+
+def _discard_rows(queryset, chunk_size):
+    """Удаляет строки пачками - не держит запись в базу на все время удаления"""
+    while True:
+        row_ids = list(queryset.values_list('pk', flat=True)[:chunk_size])
+        if not row_ids:
+            return
+        _delete_rows(row_ids)
+
+
+@serialized_write('report_switch')
+def _switch_version(snapshot, version, open_from):
+    now = timezone.now()
+    ReportSnapshot.objects.filter(pk=snapshot.pk).update(
+        version=version, open_from=open_from, built_at=now, refreshed_at=now,
+        row_count=ReportRow.objects.filter(snapshot=snapshot, version=version).count(),
+    )
+
+
+@serialized_write('report_refresh')
+def _replace_open_days(snapshot, since, rows, open_from):
+    current = ReportRow.objects.filter(snapshot=snapshot, version=snapshot.version)
+    current.filter(bucket__gte=since).delete()
+    ReportRow.objects.bulk_create(_rows(snapshot, snapshot.version, rows))
+    ReportSnapshot.objects.filter(pk=snapshot.pk).update(
+        open_from=open_from, refreshed_at=timezone.now(), row_count=current.count(),
+    )
+
+
+def build_report(report_type, full=False, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Пересобирает (full) или обновляет снимок отчета; возвращает статистику"""
+    started = time.perf_counter()
+    _, compute = REPORTS[report_type]
+    snapshot, _ = ReportSnapshot.objects.get_or_create(report_type=report_type)
+    using = export_database()
+    # Сегодняшний день еще не закончился - он остается открытым
+    open_from = timezone.localdate()
+    rows_written = 0
+
+    if full or snapshot.open_from is None:
+        mode = 'full'
+        version = snapshot.version + 1
+        # Остатки прерванной сборки той же версии
+        _discard_rows(ReportRow.objects.filter(snapshot=snapshot, version=version), chunk_size)
+        for chunk in chunked(compute(using), chunk_size):
+            _insert_rows(snapshot, version, chunk)
+            rows_written += len(chunk)
+        _switch_version(snapshot, version, open_from)
+        _discard_rows(ReportRow.objects.filter(snapshot=snapshot).exclude(version=version), chunk_size)
+    else:
+        mode = 'incremental'
+        rows = list(compute(using, snapshot.open_from))
+        _replace_open_days(snapshot, snapshot.open_from, rows, open_from)
+        rows_written = len(rows)
+
+    duration = time.perf_counter() - started
+    registry.observe('identica_report_build_duration_seconds', {'report': report_type, 'mode': mode}, duration)
+    registry.flush()
+    snapshot.refresh_from_db()
+    return {
+        'report': report_type,
+        'mode': mode,
+        'version': snapshot.version,
+        'rows_written': rows_written,
+        'rows': snapshot.row_count,
+        'seconds': round(duration, 3),
+    }
+
+
+def report_rows(snapshot, start_date=None, end_date=None):
+    """Строки текущей версии снимка за период, по дням"""
+    rows = ReportRow.objects.filter(snapshot=snapshot, version=snapshot.version)
+    if start_date:
+        rows = rows.filter(bucket__gte=start_date)
+    if end_date:
+        rows = rows.filter(bucket__lte=end_date)
+    return rows.order_by('bucket', 'pk')
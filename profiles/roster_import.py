@@ -0,0 +1,202 @@
+"""
+Импорт списков студентов (CSV или JSONL) любого размера.
+
+Файл читается построчно, строки проверяются по одной и копятся в пачку;
+пачка записывается одной транзакцией через очередь записей: одно чтение
+профилей по student_id, одно чтение пользователей по логину, массовая
+вставка новых пользователей и insert-or-update профилей. Памяти нужно на
+одну пачку, а не на весь файл.
+
+Ключ - студенческий билет: строка с известным билетом обновляет его
+профиль, с новым - привязывает билет к пользователю по логину, создавая
+пользователя при необходимости. Пароль у созданных пользователей
+непригоден: входят они через каталог.
+"""
+import csv
+import json
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+
+from .models import StudentProfile
+from .versioning import bump_version_on_commit, user_version_key
+from .write_queue import serialized_write
+
+DEFAULT_CHUNK_SIZE = 1000
+USER_FIELDS = ['email', 'first_name', 'last_name']
+PROFILE_FIELDS = ['student_id', 'faculty', 'course', 'group', 'phone']
+# Факультет можно указать кодом или названием
+FACULTIES = {
+    key: code for code, label in StudentProfile.FACULTY_CHOICES for key in (code, label.lower())
+}
+COURSES = {value for value, _ in StudentProfile._meta.get_field('course').choices}
+
+
+def _max_length(model, field):
+    return model._meta.get_field(field).max_length
+
+
+def read_rows(stream, fmt):
+    """(номер строки, словарь) по одной строке файла; fmt - csv или jsonl"""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for line_number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as exc:
+            yield line_number, {'__error__': f'некорректный JSON: {exc}'}
+            continue
+        yield line_number, row if isinstance(row, dict) else {'__error__': 'строка не является объектом'}
+
+
+def clean_row(row):
+    """Проверенные значения строки или ValidationError с причинами"""
+    if '__error__' in row:
+        raise ValidationError(row['__error__'])
+    text = {key: str(value).strip() for key, value in row.items() if key and value is not None}
+    errors = []
+    values = {}
+
+    values['student_id'] = text.get('student_id', '')
+    if not values['student_id']:
+        errors.append('не указан student_id')
+    elif len(values['student_id']) > _max_length(StudentProfile, 'student_id'):
+        errors.append('слишком длинный student_id')
+
+    values['faculty'] = FACULTIES.get(text.get('faculty', '').lower())
+    if values['faculty'] is None:
+        errors.append(f"неизвестный факультет {text.get('faculty', '')!r}")
+
+    try:
+        values['course'] = int(text.get('course', ''))
+    except ValueError:
+        values['course'] = None
+    if values['course'] not in COURSES:
+        errors.append(f"недопустимый курс {text.get('course', '')!r}")
+
+    for field, model in [('group', StudentProfile), ('phone', StudentProfile), ('username', User),
+                         ('first_name', User), ('last_name', User)]:
+        values[field] = text.get(field, '')
+        if len(values[field]) > _max_length(model, field):
+            errors.append(f'слишком длинное поле {field}')
+    if not values['group']:
+        errors.append('не указана группа')
+
+    values['email'] = text.get('email', '')
+    if values['email']:
+        try:
+            validate_email(values['email'])
+        except ValidationError:
+            errors.append(f"некорректный email {values['email']!r}")
+
+    if errors:
+        raise ValidationError(errors)
+    return values
+
+
+@serialized_write('roster_import')
+def apply_chunk(rows, stats, reject):
+    """Записывает пачку [(номер строки, значения)] с уникальными student_id"""
+    profiles = {profile.student_id: profile for profile in StudentProfile.objects.filter(
+        student_id__in=[values['student_id'] for _, values in rows]).select_related('user')}
+    users = {user.username: user for user in User.objects.filter(username__in=[
+        values['username'] for _, values in rows
+        if values['student_id'] not in profiles and values['username']
+    ]).select_related('studentprofile')}
+
+    created, updated, upserts, claimed = [], [], [], set()
+    for line_number, values in rows:
+        profile = profiles.get(values['student_id'])
+        if profile is not None:
+            user = profile.user
+        elif not values['username']:
+            reject(line_number, 'новый студент без username')
+            continue
+        elif values['username'] in claimed:
+            reject(line_number, f"username {values['username']} уже занят другой строкой пачки")
+            continue
+        elif values['username'] in users:
+            user = users[values['username']]
+            profile = getattr(user, 'studentprofile', None)
+            if profile is not None and profile.student_id:
+                reject(line_number, f"username {user.username} привязан к билету {profile.student_id}")
+                continue
+        else:
+            user = User(username=values['username'], password=make_password(None))
+            created.append(user)
+        claimed.add(user.username)
+
+        changed_user = [field for field in USER_FIELDS if values[field] and getattr(user, field) != values[field]]
+        for field in changed_user:
+            setattr(user, field, values[field])
+        if changed_user and user.pk is not None:
+            updated.append(user)
+
+        profile = profile or StudentProfile(user=user)
+        profile_values = {field: values[field] for field in PROFILE_FIELDS}
+        if not profile_values['phone']:
+            # Телефон в списках необязателен - пустой не затирает указанный студентом
+            del profile_values['phone']
+        if profile.pk is None or any(getattr(profile, field) != value for field, value in profile_values.items()):
+            for field, value in profile_values.items():
+                setattr(profile, field, value)
+            upserts.append(profile)
+
+    # post_save не срабатывает: профили новых пользователей пишутся вместе с остальными
+    User.objects.bulk_create(created)
+    User.objects.bulk_update(updated, USER_FIELDS)
+    StudentProfile.objects.bulk_create(
+        upserts, update_conflicts=True, unique_fields=['user'], update_fields=PROFILE_FIELDS)
+
+    # Новым пользователям менять версию незачем - их страниц еще никто не видел
+    new_ids = {user.pk for user in created}
+    for user_id in {user.pk for user in updated} | {profile.user_id for profile in upserts} - new_ids:
+        bump_version_on_commit(user_version_key(user_id))
+    stats['users_created'] += len(created)
+    stats['users_updated'] += len(updated)
+    stats['profiles_written'] += len(upserts)
+
+
+def import_roster(rows, chunk_size=DEFAULT_CHUNK_SIZE, on_reject=None):
+    """
+    Импортирует строки из read_rows. on_reject(номер строки, причина)
+    получает отклоненные строки по мере обработки. Возвращает статистику
+    """
+    started = time.perf_counter()
+    stats = {'rows': 0, 'rejected': 0, 'duplicates': 0,
+             'users_created': 0, 'users_updated': 0, 'profiles_written': 0}
+
+    def reject(line_number, reason):
+        stats['rejected'] += 1
+        if on_reject is not None:
+            on_reject(line_number, reason)
+
+    chunk = {}
+    for line_number, row in rows:
+        stats['rows'] += 1
+        try:
+            values = clean_row(row)
+        except ValidationError as exc:
+            reject(line_number, '; '.join(exc.messages))
+            continue
+        if values['student_id'] in chunk:
+            # Повтор билета - побеждает последняя строка, как и между пачками
+            stats['duplicates'] += 1
+        chunk[values['student_id']] = (line_number, values)
+        if len(chunk) >= chunk_size:
+            apply_chunk(list(chunk.values()), stats, reject)
+            chunk = {}
+    if chunk:
+        apply_chunk(list(chunk.values()), stats, reject)
+
+    stats['seconds'] = round(time.perf_counter() - started, 3)
+    stats['rows_per_second'] = round(stats['rows'] / stats['seconds']) if stats['seconds'] else stats['rows']
+    return stats
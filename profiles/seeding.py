@@ -0,0 +1,97 @@
+"""
+Генерация синтетических данных для нагрузочного тестирования.
+
+Модуль не импортирует модели Django, поэтому функции генерации можно
+запускать в отдельных процессах без настройки приложения.
+"""
+import random
+
+FACULTY_PREFIXES = {
+    'computer_science': 'CS',
+    'engineering': 'ENG',
+    'business': 'BUS',
+    'arts': 'ART',
+    'science': 'SCI',
+    'medicine': 'MED',
+}
+
+FIRST_NAMES = [
+    'Александр', 'Мария', 'Дмитрий', 'Анна', 'Иван', 'Екатерина', 'Максим',
+    'Ольга', 'Сергей', 'Наталья', 'Андрей', 'Татьяна', 'Алексей', 'Елена',
+    'Никита', 'Дарья', 'Артем', 'Полина', 'Михаил', 'Виктория',
+]
+
+LAST_NAMES = [
+    'Иванов', 'Смирнов', 'Кузнецов', 'Попов', 'Васильев', 'Петров', 'Соколов',
+    'Михайлов', 'Новиков', 'Федоров', 'Морозов', 'Волков', 'Алексеев', 'Лебедев',
+    'Семенов', 'Егоров', 'Павлов', 'Козлов', 'Степанов', 'Николаев',
+]
+
+GROUP_SIZE = 25
+
+
+def student_group(number, faculties):
+    """Факультет, курс и группа студента: по GROUP_SIZE человек в группе"""
+    group_number = number // GROUP_SIZE
+    faculty = faculties[group_number % len(faculties)]
+    course = group_number // len(faculties) % 6 + 1
+    group_index = group_number // (len(faculties) * 6) + 1
+    prefix = FACULTY_PREFIXES.get(faculty, faculty[:3].upper())
+    return faculty, course, f'{prefix}-{course}{group_index:02d}'
+
+
+def generate_students(start, size, prefix, faculties, website_ids, max_subscriptions, seed):
+    """
+    Генерирует студентов с номерами [start, start + size).
+    Возвращает список кортежей (данные пользователя, данные профиля, id сайтов).
+    """
+    rng = random.Random(seed + start)
+    students = []
+    for number in range(start, start + size):
+        first_name = rng.choice(FIRST_NAMES)
+        last_name = rng.choice(LAST_NAMES)
+        if first_name.endswith('а') or first_name.endswith('я'):
+            last_name += 'а'
+        username = f'{prefix}{number:06d}'
+        faculty, course, group = student_group(number, faculties)
+        subscriptions = rng.sample(
+            website_ids, rng.randint(0, min(max_subscriptions, len(website_ids)))
+        )
+        students.append((
+            {
+                'username': username,
+                'email': f'{username}@university.local',
+                'first_name': first_name,
+                'last_name': last_name,
+            },
+            {
+                'student_id': f'S{number:07d}',
+                'faculty': faculty,
+                'course': course,
+                'group': group,
+                'phone': f'+7900{rng.randint(0, 9999999):07d}',
+                'is_monitor': number % GROUP_SIZE == 0,
+            },
+            subscriptions,
+        ))
+    return students
+
+
+def generate_students_chunk(args):
+    """Обертка для Pool.imap: принимает аргументы generate_students кортежем"""
+    return generate_students(*args)
+
+
+def generate_websites(start, size, categories, seed):
+    """Генерирует сайты с номерами [start, start + size) по заданным категориям"""
+    rng = random.Random(seed + start)
+    return [
+        {
+            'name': f'Сервис {number:05d}',
+            'url': f'https://service{number:05d}.example.com',
+            'description': f'Синтетический сервис №{number} для нагрузочного тестирования',
+            'category_id': rng.choice(categories),
+            'is_active': rng.random() > 0.1,
+        }
+        for number in range(start, start + size)
+    ]
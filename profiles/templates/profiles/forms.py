@@ -1,29 +1,3 @@
-class ReportForm(forms.Form):
-    REPORT_TYPES = [
-        ('subscriptions', 'Отчет по подпискам'),
-        ('students', 'Отчет по студентам'),
-        ('activity', 'Отчет по активности'),
-        ('roles', 'Отчет по распределению ролей'),
-    ]
-    
-    report_type = forms.ChoiceField(
-        choices=REPORT_TYPES,
-        label='Тип отчета',
-        widget=forms.Select(attrs={'class': 'form-control'})
-    )
-    
-    start_date = forms.DateField(
-        label='Начальная дата',
-        required=False,
-        widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control'})
-    )
-    
-    end_date = forms.DateField(
-        label='Конечная дата', 
-        required=False,
-        widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control'})
-    )
-
 class RoleManagementForm(forms.Form):
     user = forms.ModelChoiceField(
         queryset=User.objects.all(),
@@ -0,0 +1,17 @@
+"""
+URL тестов для асинхронных представлений: как profiles.urls при
+DIRECTORY_VIEWS_ASYNC, остальные адреса - из identica.urls.
+"""
+from django.urls import include, path
+
+from . import async_views
+
+urlpatterns = [
+    path('access-check/', async_views.website_access_check, name='website_access_check'),
+    path('ldap-test/', async_views.ldap_test_tool, name='ldap_test_tool'),
+    path('test/library/', async_views.test_page, {'page': 'library'}, name='test_library'),
+    path('test/research/', async_views.test_page, {'page': 'research'}, name='test_research'),
+    path('test/admin/', async_views.test_page, {'page': 'admin'}, name='test_admin'),
+    path('test/courses/', async_views.test_page, {'page': 'courses'}, name='test_courses'),
+    path('', include('identica.urls')),
+]
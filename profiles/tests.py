@@ -1,6 +1,49 @@
-from django.test import TestCase
-from django.contrib.auth.models import User
-from .models import StudentProfile, WebsiteCategory, Website, Subscription
+import asyncio
+import datetime
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import closing
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import caches
+from django.core.management import call_command
+from django.core.paginator import Paginator
+from django.db import connection, transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.contrib.auth.models import Group, User
+from identica import ldap_test_server
+from identica.ldap_test_server import SEED_TIMESTAMP, InProcessLDAPServer
+from .access_policy import AccessPolicy
+from .admin_paging import LargeTablePaginator
+from .catalogue import catalogue_version, get_catalogue
+from .db_router import PIN_COOKIE, ReplicaPinMiddleware, ReplicaRouter, replica_reads
+from .directory_cache import TTLCache, directory_cache
+from .file_cache import IntervalCullFileBasedCache
+from .forms import SubscriptionForm
+from .group_sync import sync_groups
+from .user_sync import sync_users
+from .ldap_backend import CustomLDAPBackend, RealmRouterBackend
+from .ldap_client import AsyncDirectoryClient, CircuitBreaker, DirectoryClient, DirectoryUnavailable
+from .metrics import registry, render_metrics
+from .ratelimit import LoginRateLimiter, login_limiter
+from .write_queue import WriteQueue
+from .ldap_utils import (
+    TEST_WEBSITES, check_website_access, get_user_groups, get_user_ldap_info,
+    get_website_required_groups, refresh_directory_entry,
+)
+from .management.commands import snapshot_replica
+from .models import PROFILE_COMPLETE_Q, ReportRow, ReportSnapshot, StudentProfile, WebsiteCategory, Website, Subscription
+from .reports import build_report
 
 class StudentProfileModelTest(TestCase):
     def setUp(self):
@@ -28,4 +71,1137 @@ class WebsiteModelTest(TestCase):
     
     def test_website_creation(self):
         self.assertEqual(self.website.name, 'Тестовый сайт')
-        self.assertEqual(self.website.category.name, 'Образовательные')
\ No newline at end of file
+        self.assertEqual(self.website.category.name, 'Образовательные')
+
+class AccessPolicyTest(SimpleTestCase):
+    def setUp(self):
+        self.policy = AccessPolicy([
+            ('https://library.identica.local', ['students', 'staff']),
+            ('https://portal.identica.local/staff', ['staff']),
+            ('https://portal.identica.local', ['students', 'staff']),
+        ])
+
+    def test_url_normalization(self):
+        students = self.policy.groups_mask(['students'])
+        for url in ['https://library.identica.local', 'http://www.library.identica.local/',
+                    'library.identica.local', 'HTTPS://Library.Identica.Local/books']:
+            self.assertTrue(self.policy.allows(students, url), url)
+
+    def test_longest_path_prefix_wins(self):
+        students = self.policy.groups_mask(['students'])
+        self.assertTrue(self.policy.allows(students, 'https://portal.identica.local/news'))
+        self.assertFalse(self.policy.allows(students, 'https://portal.identica.local/staff/salary'))
+        self.assertTrue(self.policy.allows(students, 'https://portal.identica.local/staffroom'))
+
+    def test_unknown_site_and_groups_denied(self):
+        self.assertFalse(self.policy.allows(self.policy.groups_mask(['staff']), 'https://github.com'))
+        self.assertFalse(self.policy.allows(self.policy.groups_mask(['guests']), 'library.identica.local'))
+
+    def test_malformed_url_denied(self):
+        staff = self.policy.groups_mask(['students', 'staff'])
+        for url in ['http://[abc', 'https://[library.identica.local/']:
+            self.assertFalse(self.policy.allows(staff, url), url)
+        self.assertFalse(check_website_access('student1', 'http://[abc'))
+
+    def test_check_website_access_uses_directory_groups(self):
+        self.assertTrue(check_website_access('student1', 'https://library.identica.local'))
+        self.assertFalse(check_website_access('student1', 'https://research.identica.local'))
+        self.assertTrue(check_website_access('monitor1', 'https://research.identica.local'))
+        self.assertEqual(get_website_required_groups('https://admin.identica.local'), ['staff', 'admins'])
+
+
+class DirectoryCacheTest(SimpleTestCase):
+    def setUp(self):
+        self.now = 0
+        self.cache = TTLCache(maxsize=2, ttl=10, timer=lambda: self.now)
+
+    def test_ttl_expiry(self):
+        self.cache.set('student1', ['students'])
+        self.now = 9
+        self.assertEqual(self.cache.get('student1'), ['students'])
+        self.now = 10
+        self.assertIsNone(self.cache.get('student1'))
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+    def test_lru_eviction(self):
+        self.cache.set('a', 1)
+        self.cache.set('b', 2)
+        self.cache.get('a')
+        self.cache.set('c', 3)
+        self.assertIsNone(self.cache.get('b'))
+        self.assertEqual(self.cache.get('a'), 1)
+        self.assertEqual(self.cache.stats()['evictions'], 1)
+
+    def test_directory_lookups_are_cached(self):
+        directory_cache.clear()
+        get_user_groups('student1')
+        get_user_ldap_info('student1')
+        get_user_groups('nobody')
+        get_user_groups('nobody')
+        stats = directory_cache.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (2, 2))
+        refresh_directory_entry('student1', {'groups': ['staff'], 'password': 'secret'})
+        self.assertEqual(get_user_groups('student1'), ['staff'])
+        self.assertNotIn('password', directory_cache.get('student1'))
+        directory_cache.clear()
+
+
+class FileCacheTest(SimpleTestCase):
+    def test_cache_dir_is_listed_once_per_interval(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = IntervalCullFileBasedCache(directory, {
+                'OPTIONS': {'MAX_ENTRIES': 5, 'CULL_FREQUENCY': 5, 'CULL_INTERVAL': 60},
+            })
+            with mock.patch.object(cache, '_list_cache_files', wraps=cache._list_cache_files) as listing:
+                for number in range(10):
+                    cache.set(f'key{number}', number)
+            self.assertEqual(listing.call_count, 1)
+
+            cache._next_cull = 0.0
+            cache.set('key10', 10)
+            self.assertEqual(len(cache._list_cache_files()), 9)
+
+    def test_tests_use_their_own_cache_dir(self):
+        self.assertNotEqual(caches['default']._dir, os.path.join(tempfile.gettempdir(), 'identica-cache'))
+
+
+class DirectoryClientTest(SimpleTestCase):
+    def setUp(self):
+        self.server = InProcessLDAPServer()
+        self.now = 0
+        self.client = DirectoryClient(
+            lambda: self.server.connect(read_timeout=0.05),
+            ldap_test_server.LDAP_TEST_SERVICE_DN,
+            ldap_test_server.LDAP_TEST_SERVICE_PASSWORD,
+            ldap_test_server.USER_BASE_DN,
+            ldap_test_server.GROUP_BASE_DN,
+            pool_size=2,
+            breaker=CircuitBreaker(failure_threshold=2, reset_timeout=10, timer=lambda: self.now),
+        )
+
+    def test_authenticate_and_lookup(self):
+        user_data = self.client.authenticate('monitor1', 'password123')
+        self.assertEqual(user_data['groups'], ['students', 'identica-users', 'monitors'])
+        self.assertIsNone(self.client.authenticate('monitor1', 'wrong'))
+        self.assertIsNone(self.client.authenticate('nobody', 'password123'))
+        self.assertIsNone(self.client.get_user('stu*'))
+        self.assertEqual(self.client.get_user('admin')['email'], 'admin@university.local')
+
+    def test_connections_are_reused(self):
+        for _ in range(5):
+            self.client.authenticate('student1', 'password123')
+        self.assertEqual(self.server.connections_opened, 1)
+        self.assertEqual(self.client.pool.stats()['reused'], 4)
+
+    def test_circuit_breaker_fails_fast(self):
+        self.server.latency = 0.1
+        with self.assertLogs('profiles.ldap_client', 'WARNING'):
+            for _ in range(2):
+                with self.assertRaises(DirectoryUnavailable):
+                    self.client.get_user('student1')
+        searches = self.server.searches
+        with self.assertRaises(DirectoryUnavailable):
+            self.client.get_user('student1')
+        self.assertEqual(self.server.searches, searches)
+        self.assertEqual(self.client.breaker.state, CircuitBreaker.OPEN)
+
+        self.server.latency = 0
+        self.now = 10
+        self.assertIsNotNone(self.client.get_user('student1'))
+        self.assertEqual(self.client.breaker.state, CircuitBreaker.CLOSED)
+
+
+class CustomLDAPBackendTest(TestCase):
+    def test_directory_login_creates_user(self):
+        user = CustomLDAPBackend().authenticate(None, username='admin', password='admin123')
+        self.assertTrue(user.is_staff)
+        self.assertTrue(user.is_superuser)
+        self.assertIsNone(CustomLDAPBackend().authenticate(None, username='admin', password='nope'))
+
+    def test_repeat_login_writes_nothing(self):
+        backend = CustomLDAPBackend()
+        backend.authenticate(None, username='student1', password='password123')
+        with CaptureQueriesContext(connection) as queries:
+            backend.authenticate(None, username='student1', password='password123')
+        self.assertFalse([q for q in queries if not q['sql'].startswith('SELECT')])
+
+    def test_changed_directory_fields_only(self):
+        user = CustomLDAPBackend().authenticate(None, username='student1', password='password123')
+        User.objects.filter(pk=user.pk).update(first_name='Старое имя')
+        with CaptureQueriesContext(connection) as queries:
+            user = CustomLDAPBackend().authenticate(None, username='student1', password='password123')
+        updates = [q['sql'] for q in queries if q['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 1)
+        self.assertIn('"first_name"', updates[0])
+        self.assertNotIn('"email"', updates[0])
+        self.assertNotIn('profiles_studentprofile', updates[0])
+        self.assertEqual(user.first_name, 'Иван')
+
+
+class SubscriptionSyncTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='student', password='testpass123')
+        self.profile = self.user.studentprofile
+        self.profile.student_id = 'ST100'
+        self.profile.faculty = 'science'
+        self.profile.course = 1
+        self.profile.group = 'SC-101'
+        self.profile.save()
+        category = WebsiteCategory.objects.create(name='Наука')
+        self.sites = [
+            Website.objects.create(name=f'Сайт {i}', url=f'https://site{i}.example.com', category=category)
+            for i in range(4)
+        ]
+        self.client.force_login(self.user)
+
+    def active_ids(self):
+        return set(Subscription.objects.filter(student=self.profile, is_active=True)
+                   .values_list('website_id', flat=True))
+
+    def test_sync_diffs_sets(self):
+        a, b, c, d = [site.id for site in self.sites]
+        self.profile.sync_subscriptions([a, b])
+        Subscription.objects.filter(website_id=c).delete()
+        self.assertEqual(self.profile.sync_subscriptions([b, c]),
+                         {'created': 1, 'activated': 0, 'deactivated': 1})
+        self.assertEqual(self.profile.sync_subscriptions([a, b, c]),
+                         {'created': 0, 'activated': 1, 'deactivated': 0})
+        self.assertEqual(self.active_ids(), {a, b, c})
+
+    def test_post_uses_constant_number_of_queries(self):
+        ids = [str(site.id) for site in self.sites]
+        self.client.post('/subscriptions/', {'websites': ids[:1]})
+        with CaptureQueriesContext(connection) as few:
+            self.client.post('/subscriptions/', {'websites': ids[1:2]})
+        with CaptureQueriesContext(connection) as many:
+            self.client.post('/subscriptions/', {'websites': ids})
+        self.assertEqual(len(few), len(many))
+        self.assertEqual(self.active_ids(), {site.id for site in self.sites})
+
+    def test_unknown_or_inactive_websites_rejected(self):
+        self.sites[0].is_active = False
+        self.sites[0].save()
+        for payload in [[str(self.sites[0].id)], ['999999'], ['abc']]:
+            response = self.client.post('/subscriptions/', {'websites': payload})
+            self.assertRedirects(response, '/subscriptions/', fetch_redirect_response=False)
+        self.assertEqual(self.active_ids(), set())
+
+    def test_catalogue_grid_is_cached_until_subscriptions_change(self):
+        site = self.sites[0]
+        checked = f'id="website{site.id}"\n                                                           checked'
+        self.client.get('/subscriptions/')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/subscriptions/')
+        self.assertFalse(any('profiles_subscription' in query['sql'] for query in queries.captured_queries))
+        self.assertNotContains(response, checked)
+
+        self.client.post('/subscriptions/', {'websites': [str(site.id)]})
+        self.assertContains(self.client.get('/subscriptions/'), checked)
+
+        Subscription.objects.get(student=self.profile, website=site).delete()
+        self.assertNotContains(self.client.get('/subscriptions/'), checked)
+
+    def test_dashboard_subscriptions_fragment_follows_catalogue(self):
+        self.profile.sync_subscriptions([self.sites[0].id])
+        self.assertContains(self.client.get('/dashboard/'), 'Сайт 0')
+        self.sites[0].name = 'Переименованный сайт'
+        self.sites[0].save()
+        self.assertContains(self.client.get('/dashboard/'), 'Переименованный сайт')
+
+
+class MonitorDashboardTest(TestCase):
+    def setUp(self):
+        self.category = WebsiteCategory.objects.create(name='Наука')
+        self.website = Website.objects.create(name='Сайт', url='https://site.example.com', category=self.category)
+        self.monitor = self.make_student('monitor', complete=True, is_monitor=True)
+        self.client.force_login(self.monitor.user)
+
+    def make_student(self, username, complete=False, is_monitor=False, subscribed=False):
+        profile = User.objects.create_user(username=username).studentprofile
+        profile.group = 'CS-101'
+        profile.is_monitor = is_monitor
+        if complete:
+            profile.student_id, profile.faculty, profile.course = username, 'science', 1
+        profile.save()
+        if subscribed:
+            Subscription.objects.create(student=profile, website=self.website)
+        return profile
+
+    def test_group_statistics(self):
+        self.make_student('s1', complete=True, subscribed=True)
+        self.make_student('s2')
+        rows = {row.user.username: row for row in self.monitor.get_group_students()}
+        self.assertEqual(rows['s1'].subscriptions_count, 1)
+        self.assertTrue(rows['s1'].profile_complete)
+        self.assertFalse(rows['s2'].profile_complete)
+        self.assertEqual(self.monitor.get_students_in_group(), 3)
+        self.assertEqual(self.monitor.get_filled_profiles(), 2)
+        self.assertEqual(self.monitor.get_completion_percentage(), 67)
+        self.assertEqual(self.monitor.get_group_activity()['active_students'], 1)
+
+    def test_query_count_does_not_grow_with_group(self):
+        self.make_student('s1', subscribed=True)
+        with CaptureQueriesContext(connection) as small:
+            self.assertEqual(self.client.get('/monitor/').status_code, 200)
+        for i in range(10):
+            self.make_student(f'extra{i}', complete=bool(i % 2), subscribed=True)
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.get('/monitor/')
+        self.assertEqual(len(small), len(large))
+        self.assertEqual(response.context['students_in_group'], 12)
+        self.assertContains(response, f'Панель старосты группы {self.monitor.group}')
+
+
+class StudentProfileLoaderTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='student', password='testpass123')
+        self.client.force_login(self.user)
+
+    def profile_queries(self, queries):
+        return [q['sql'] for q in queries if 'FROM "profiles_studentprofile"' in q['sql']]
+
+    def test_profile_loaded_once_per_request(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get('/dashboard/').status_code, 200)
+        profile_queries = self.profile_queries(queries)
+        self.assertEqual(len(profile_queries), 1)
+        self.assertIn('INNER JOIN "auth_user"', profile_queries[0])
+
+    def test_missing_profile_created(self):
+        StudentProfile.objects.filter(user=self.user).delete()
+        self.assertEqual(self.client.get('/profile/').status_code, 200)
+        self.assertTrue(StudentProfile.objects.filter(user=self.user).exists())
+
+
+class SeedingCommandTest(TestCase):
+    def test_scale_mode_bulk_creates_students(self):
+        category = WebsiteCategory.objects.create(name='Наука')
+        Website.objects.create(name='Сайт', url='https://site.example.com', category=category)
+        call_command('create_test_users', count=60, batch_size=25, max_subscriptions=1, stdout=StringIO())
+        call_command('create_test_users', count=60, batch_size=25, stdout=StringIO())
+        profiles = StudentProfile.objects.filter(user__username__startswith='loadtest')
+        self.assertEqual(profiles.count(), 60)
+        self.assertEqual(profiles.filter(is_monitor=True).count(), 3)
+        self.assertEqual(profiles.exclude(PROFILE_COMPLETE_Q).count(), 0)
+        user = User.objects.get(username='loadtest000007')
+        self.assertTrue(user.check_password('password123'))
+
+
+class RosterImportCommandTest(TestCase):
+    def import_file(self, name, content, **options):
+        path = os.path.join(tempfile.mkdtemp(), name)
+        self.addCleanup(os.remove, path)
+        with open(path, 'w', encoding='utf-8') as handle:
+            handle.write(content)
+        stdout, stderr = StringIO(), StringIO()
+        call_command('import_roster', path, json=True, stdout=stdout, stderr=stderr, **options)
+        return json.loads(stdout.getvalue()), stderr.getvalue()
+
+    def test_csv_rows_are_upserted_by_student_id(self):
+        existing = User.objects.create_user(username='petrov', first_name='Иван')
+        stats, rejects = self.import_file('roster.csv', '\n'.join([
+            'student_id,username,first_name,last_name,faculty,course,group',
+            'ST100,petrov,Иван,Петров,computer_science,2,CS-201',
+            'ST101,sidorova,Мария,Сидорова,Инженерия,3,ENG-301',
+            'ST102,kotov,Олег,Котов,astrology,2,AS-1',
+            'ST103,orlov,Павел,Орлов,business,9,BA-1',
+            'ST104,petrov,Иван,Петров,arts,1,AR-1',
+        ]), chunk_size=2)
+        self.assertEqual((stats['rows'], stats['rejected'], stats['users_created']), (5, 3, 1))
+        self.assertIn('Строка 4: неизвестный факультет', rejects)
+        self.assertIn('Строка 5: недопустимый курс', rejects)
+        self.assertIn('Строка 6: username petrov привязан к билету ST100', rejects)
+        self.assertEqual(StudentProfile.objects.get(user=existing).student_id, 'ST100')
+        created = StudentProfile.objects.select_related('user').get(student_id='ST101')
+        self.assertEqual((created.user.username, created.faculty, created.course), ('sidorova', 'engineering', 3))
+        self.assertFalse(created.user.has_usable_password())
+
+        # Повторный импорт по тем же билетам обновляет профили, не создавая пользователей
+        with CaptureQueriesContext(connection) as queries:
+            stats, _ = self.import_file('roster.jsonl', '\n'.join(json.dumps(row, ensure_ascii=False) for row in [
+                {'student_id': 'ST100', 'faculty': 'arts', 'course': 3, 'group': 'AR-301'},
+                {'student_id': 'ST101', 'faculty': 'engineering', 'course': 4, 'group': 'ENG-401'},
+            ]))
+        self.assertEqual((stats['users_created'], stats['profiles_written']), (0, 2))
+        self.assertEqual(StudentProfile.objects.get(student_id='ST100').group, 'AR-301')
+        self.assertEqual(StudentProfile.objects.get(student_id='ST101').course, 4)
+        self.assertEqual(StudentProfile.objects.count(), 2)
+        writes = [query for query in queries if query['sql'].startswith(('INSERT', 'UPDATE'))]
+        self.assertEqual(len(writes), 1)
+
+
+class ExportTest(TestCase):
+    def setUp(self):
+        category = WebsiteCategory.objects.create(name='Наука')
+        website = Website.objects.create(name='Архив', url='https://archive.example.com', category=category)
+        staff = Group.objects.create(name='staff')
+        for number in range(5):
+            user = User.objects.create_user(username=f'export{number}')
+            StudentProfile.objects.filter(user=user).update(student_id=f'EX{number}', faculty='arts', course=1)
+            Subscription.objects.create(student=user.studentprofile, website=website)
+        user.groups.add(staff)
+
+    def test_command_reads_keyset_chunks(self):
+        stdout = StringIO()
+        with CaptureQueriesContext(connection) as queries:
+            call_command('export_data', 'subscriptions', format='jsonl', chunk_size=2, stdout=stdout)
+        rows = [json.loads(line) for line in stdout.getvalue().splitlines()]
+        self.assertEqual([row['student_id'] for row in rows], [f'EX{number}' for number in range(5)])
+        self.assertEqual((rows[0]['website'], rows[0]['category']), ('Архив', 'Наука'))
+        self.assertEqual(len(queries), 3)
+        self.assertIn('"profiles_subscription"."id" > ', queries[1]['sql'])
+        self.assertNotIn('OFFSET', queries[2]['sql'])
+
+    def test_admin_actions_stream_selected_rows(self):
+        self.client.force_login(User.objects.create_superuser(username='root'))
+        profiles = StudentProfile.objects.filter(student_id__in=['EX3', 'EX4'])
+        response = self.client.post('/admin/profiles/studentprofile/', {
+            'action': 'export_access_csv',
+            '_selected_action': [str(pk) for pk in profiles.values_list('pk', flat=True)],
+        })
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="access.csv"')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'username,website,url,access_granted,required_groups')
+        self.assertIn('export4,Админ панель,https://admin.identica.local,True,staff admins', lines)
+        self.assertIn('export3,Админ панель,https://admin.identica.local,False,staff admins', lines)
+        self.assertEqual(len(lines), 1 + 2 * len(TEST_WEBSITES))
+
+
+class ReportSnapshotTest(TestCase):
+    def setUp(self):
+        category = WebsiteCategory.objects.create(name='Наука')
+        self.website = Website.objects.create(name='Архив', url='https://archive.example.com', category=category)
+        self.today = timezone.localdate()
+        for days_ago in (3, 3, 1):
+            self.subscribe(days_ago)
+
+    def subscribe(self, days_ago):
+        user = User.objects.create_user(username=f'report{User.objects.count()}')
+        subscription = Subscription.objects.create(student=user.studentprofile, website=self.website)
+        Subscription.objects.filter(pk=subscription.pk).update(
+            subscribed_at=timezone.now() - datetime.timedelta(days=days_ago))
+
+    def counts(self):
+        snapshot = ReportSnapshot.objects.get(report_type='subscriptions')
+        return {(self.today - row.bucket).days: row.data['subscriptions']
+                for row in ReportRow.objects.filter(snapshot=snapshot, version=snapshot.version)}
+
+    def test_refresh_recomputes_only_open_days(self):
+        stats = build_report('subscriptions')
+        self.assertEqual((stats['mode'], stats['version'], stats['rows']), ('full', 1, 2))
+        self.assertEqual(self.counts(), {3: 2, 1: 1})
+
+        # Задним числом - в закрытый день; сегодня - в открытый
+        self.subscribe(1)
+        self.subscribe(0)
+        stats = build_report('subscriptions')
+        self.assertEqual((stats['mode'], stats['version'], stats['rows_written']), ('incremental', 1, 1))
+        self.assertEqual(self.counts(), {3: 2, 1: 1, 0: 1})
+
+        stats = build_report('subscriptions', full=True)
+        self.assertEqual((stats['mode'], stats['version']), ('full', 2))
+        self.assertEqual(self.counts(), {3: 2, 1: 2, 0: 1})
+        self.assertFalse(ReportRow.objects.exclude(version=2).exists())
+
+    def test_page_reads_snapshot_rows(self):
+        self.client.force_login(User.objects.create_user(username='staff', is_staff=True))
+        response = self.client.get('/reports/', {'report_type': 'subscriptions'})
+        self.assertContains(response, 'build_reports')
+
+        call_command('build_reports', 'subscriptions', stdout=StringIO())
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/reports/', {'report_type': 'subscriptions'})
+        self.assertEqual(len(response.context['table']), 2)
+        self.assertFalse([query for query in queries if 'profiles_subscription' in query['sql']])
+
+        response = self.client.get('/reports/', {'report_type': 'subscriptions', 'format': 'csv'})
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'day,category,website,subscriptions,active')
+        self.assertEqual(lines[1], f'{self.today - datetime.timedelta(days=3)},Наука,Архив,2,2')
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class LargeTableAdminTest(TestCase):
+    def setUp(self):
+        category = WebsiteCategory.objects.create(name='Наука')
+        website = Website.objects.create(name='Архив', url='https://archive.example.com', category=category)
+        for number in range(30):
+            user = User.objects.create_user(username=f'student{number:02d}', first_name='Имя', last_name='Фамилия')
+            StudentProfile.objects.filter(user=user).update(student_id=f'ST{number:03d}')
+            Subscription.objects.create(student=user.studentprofile, website=website)
+        self.client.force_login(User.objects.create_superuser(username='root'))
+
+    def test_subscription_search_by_login_ticket_and_website(self):
+        Subscription.objects.create(
+            student=StudentProfile.objects.get(student_id='ST001'),
+            website=Website.objects.create(name='Библиотека', url='https://library.example.com',
+                                           category=WebsiteCategory.objects.get(name='Наука')),
+        )
+        for term, expected in [('student01', 2), ('ST00', 11), ('архив', 30), ('БИБЛИО', 1),
+                               ('Student01', 0), ('нет-такого', 0)]:
+            response = self.client.get('/admin/profiles/subscription/', {'q': term})
+            self.assertEqual(response.context['cl'].result_count, expected, term)
+
+    def test_changelists_do_not_query_per_row_or_recount(self):
+        for path in ['/admin/profiles/studentprofile/', '/admin/profiles/subscription/']:
+            with CaptureQueriesContext(connection) as first:
+                self.assertEqual(self.client.get(path).status_code, 200)
+            # Пользователь по id читается только один раз - request.user
+            user_lookups = [query for query in first if '"auth_user"."id" = ' in query['sql']]
+            self.assertLessEqual(len(user_lookups), 1)
+            with CaptureQueriesContext(connection) as second:
+                self.client.get(path)
+            self.assertFalse([query for query in second if 'COUNT(' in query['sql']])
+            self.assertLess(len(second), len(first))
+
+    def test_search_uses_prefix_ranges(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/admin/profiles/studentprofile/', {'q': 'ST01'})
+        self.assertEqual(len(response.context['cl'].result_list), 10)
+        self.assertFalse([query for query in queries if 'LIKE' in query['sql']])
+
+    def test_deep_pages_are_read_by_key(self):
+        queryset = StudentProfile.objects.select_related('user').order_by('-pk')
+        expected = [list(page.object_list) for page in map(Paginator(queryset, 5).page, [3, 4])]
+        paginator = LargeTablePaginator(queryset, 5)
+        paginator.keyset_threshold = 10
+        self.assertEqual(list(paginator.page(3).object_list), expected[0])
+        paginator = LargeTablePaginator(queryset, 5)
+        paginator.keyset_threshold = 10
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(list(paginator.page(4).object_list), expected[1])
+        self.assertEqual(len(queries), 1)
+        self.assertIn('"profiles_studentprofile"."id" < ', queries[0]['sql'])
+        self.assertNotIn('OFFSET', queries[0]['sql'])
+
+
+class QueryPlanTest(TestCase):
+    """Горячие запросы не должны скатываться к полному просмотру таблиц"""
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command('create_test_websites', count=40, stdout=StringIO())
+        call_command('create_test_users', count=300, batch_size=100, stdout=StringIO())
+        # Со статистикой планировщик выбирает планы как на реальных объемах
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        cls.profile = StudentProfile.objects.filter(user__username='loadtest000007').get()
+
+    def query_plan(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            return [row[3] for row in cursor.fetchall()]
+
+    def assertUsesIndex(self, queryset, index_name, small_tables=()):
+        plan = self.query_plan(queryset)
+        self.assertTrue(any(index_name in step for step in plan), plan)
+        full_scans = [
+            step for step in plan
+            if step.startswith('SCAN ') and ' INDEX ' not in step and step.split()[1] not in small_tables
+        ]
+        self.assertEqual(full_scans, [], plan)
+
+    def test_active_subscriptions_of_student(self):
+        subscriptions = Subscription.objects.filter(student=self.profile, is_active=True)
+        self.assertUsesIndex(subscriptions.select_related('website'), 'subscr_active_student_idx')
+        self.assertUsesIndex(subscriptions.values_list('website_id', flat=True), 'subscr_active_student_idx')
+
+    def test_active_subscribers_of_website(self):
+        website = Website.objects.first()
+        self.assertUsesIndex(Subscription.objects.filter(website=website, is_active=True), 'subscr_active_website_idx')
+
+    def test_group_pages(self):
+        self.assertUsesIndex(self.profile.get_group_students(), 'studentprofile_group_idx')
+        self.assertUsesIndex(StudentProfile.objects.filter(group=self.profile.group), 'studentprofile_group_idx')
+
+    def test_faculty_and_course_filter(self):
+        self.assertUsesIndex(StudentProfile.objects.filter(faculty='arts', course=2), 'studentprofile_fac_course_idx')
+
+    def test_catalogue_snapshot(self):
+        self.assertUsesIndex(
+            Website.objects.filter(is_active=True).select_related('category'), 'website_active_category_idx',
+            # Категорий единицы - планировщик перебирает их и ищет сайты каждой по индексу
+            small_tables=['profiles_websitecategory'])
+
+
+class BenchReplayCommandTest(TestCase):
+    def test_report_per_endpoint(self):
+        User.objects.create_user(username='student', password='testpass123')
+        with tempfile.TemporaryDirectory() as directory:
+            log = os.path.join(directory, 'requests.jsonl')
+            with open(log, 'w', encoding='utf-8') as handle:
+                handle.write('{"method": "GET", "path": "/dashboard/", "user": "student"}\n')
+                handle.write('{"request_id": "user-001", "title": "не HTTP-запрос"}\n')
+            output = os.path.join(directory, 'report.json')
+            call_command('bench_replay', log, repeat=2, output=output, stdout=StringIO())
+            with open(output, encoding='utf-8') as handle:
+                report = json.load(handle)
+        self.assertEqual(report['skipped_lines'], 1)
+        dashboard = report['endpoints']['GET dashboard']
+        self.assertEqual(dashboard['requests'], 2)
+        self.assertEqual(dashboard['statuses'], {'200': 2})
+        self.assertGreater(dashboard['sql_queries_per_request'], 0)
+
+
+class MetricsTest(TestCase):
+    def setUp(self):
+        registry.reset()
+        self.addCleanup(registry.reset)
+
+    def test_request_metrics_exposed(self):
+        user = User.objects.create_user(username='student', password='testpass123')
+        self.client.force_login(user)
+        self.client.get('/access-check/', {'url': 'https://library.identica.local'})
+        body = self.client.get('/metrics').content.decode()
+        self.assertIn('# TYPE identica_http_request_duration_seconds histogram', body)
+        self.assertIn('identica_http_request_duration_seconds_count{method="GET",view="website_access_check"} 1', body)
+        self.assertIn('identica_http_requests_total{method="GET",status="200",view="website_access_check"} 1', body)
+        self.assertRegex(body, r'identica_http_sql_queries_total\{method="GET",view="website_access_check"\} [1-9]')
+        self.assertIn('identica_directory_call_duration_seconds_count{call="check_website_access"} 1', body)
+
+    async def test_sync_view_sql_counted_under_asgi(self):
+        # Синхронное представление под ASGI идет в потоке sync_to_async со своими соединениями
+        await self.async_client.aforce_login(await User.objects.acreate(username='student'))
+        response = await self.async_client.get('/dashboard/')
+        self.assertEqual(response.status_code, 200)
+        self.assertRegex(render_metrics(), r'identica_http_sql_queries_total\{method="GET",view="dashboard"\} [1-9]')
+
+    def test_metrics_limited_to_staff_and_allowed_ips(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 200)
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='10.0.0.5').status_code, 403)
+        self.client.force_login(User.objects.create_user(username='student'))
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='10.0.0.5').status_code, 403)
+        self.client.force_login(User.objects.create_user(username='staff', is_staff=True))
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='10.0.0.5').status_code, 200)
+        with self.settings(METRICS_ALLOWED_IPS=['10.0.0.5']):
+            self.client.logout()
+            self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='10.0.0.5').status_code, 200)
+
+    def test_snapshots_from_workers_are_summed(self):
+        registry.inc('identica_http_requests_total', {'view': 'home', 'method': 'GET', 'status': '200'}, 2)
+        registry.observe('identica_http_request_duration_seconds', {'view': 'home', 'method': 'GET'}, 0.02)
+        with tempfile.TemporaryDirectory() as directory, self.settings(METRICS_DIR=directory):
+            with open(os.path.join(directory, 'metrics-1.json'), 'w') as handle:
+                json.dump(registry.snapshot(), handle)
+            body = render_metrics()
+        self.assertIn('identica_http_requests_total{method="GET",status="200",view="home"} 4', body)
+        self.assertIn('identica_http_request_duration_seconds_bucket{method="GET",view="home",le="0.01"} 0', body)
+        self.assertIn('identica_http_request_duration_seconds_bucket{method="GET",view="home",le="0.025"} 2', body)
+        self.assertIn('identica_http_request_duration_seconds_bucket{method="GET",view="home",le="+Inf"} 2', body)
+
+
+class RealmRouterBackendTest(TestCase):
+    def setUp(self):
+        directory_cache.clear()
+        self.backend = RealmRouterBackend()
+
+    def test_directory_user_never_reaches_model_backend(self):
+        User.objects.create_user(username='student1', password='password123')
+        with mock.patch.object(ModelBackend, 'authenticate') as model_authenticate:
+            self.assertIsNotNone(self.backend.authenticate(None, username='student1', password='password123'))
+            self.assertIsNone(self.backend.authenticate(None, username='student1', password='wrong'))
+        model_authenticate.assert_not_called()
+        self.assertFalse(User.objects.get(username='student1').check_password('wrong'))
+
+    def test_unknown_user_skips_password_hashing(self):
+        with mock.patch('django.contrib.auth.base_user.make_password') as hasher:
+            self.assertIsNone(self.backend.authenticate(None, username='intruder', password='guess'))
+        hasher.assert_not_called()
+
+    def test_local_account_uses_model_backend(self):
+        User.objects.create_user(username='localadmin', password='local-secret')
+        self.assertIsNotNone(self.backend.authenticate(None, username='localadmin', password='local-secret'))
+        self.assertIsNone(self.backend.authenticate(None, username='localadmin', password='wrong'))
+
+    def test_local_accounts_log_in_during_directory_outage(self):
+        User.objects.create_superuser(username='breakglass', password='local-secret')
+        User.objects.create_user(username='student1', password='password123')
+        outage = mock.patch('profiles.ldap_backend.directory_user_exists', side_effect=DirectoryUnavailable('down'))
+        with outage, mock.patch.object(CustomLDAPBackend, 'authenticate', return_value=None) as ldap_authenticate:
+            self.assertIsNotNone(self.backend.authenticate(None, username='breakglass', password='local-secret'))
+            self.assertIsNone(self.backend.authenticate(None, username='breakglass', password='wrong'))
+            ldap_authenticate.assert_not_called()
+            self.assertEqual(self.backend.get_realm('student1'), RealmRouterBackend.LOCAL)
+            self.assertEqual(self.backend.get_realm('student3'), RealmRouterBackend.DIRECTORY)
+        # Решение на время сбоя не запомнено
+        self.assertEqual(self.backend.get_realm('student1'), RealmRouterBackend.DIRECTORY)
+
+    def test_directory_created_user_has_unusable_local_password(self):
+        user = self.backend.authenticate(None, username='student2', password='password123')
+        self.assertFalse(user.has_usable_password())
+        self.assertEqual(self.backend.get_realm('student2'), RealmRouterBackend.DIRECTORY)
+
+
+class GroupSyncTest(TestCase):
+    def setUp(self):
+        directory_cache.clear()
+        self.server = InProcessLDAPServer(users={})
+        for username, groups in [('alice', ['students', 'identica-users']),
+                                 ('bob', ['staff', 'identica-users']),
+                                 ('carol', ['students'])]:
+            self.server.add_user(username, {'groups': groups})
+            User.objects.create_user(username=username)
+        self.client = DirectoryClient(
+            lambda: self.server.connect(),
+            ldap_test_server.LDAP_TEST_SERVICE_DN,
+            ldap_test_server.LDAP_TEST_SERVICE_PASSWORD,
+            ldap_test_server.USER_BASE_DN,
+            ldap_test_server.GROUP_BASE_DN,
+        )
+        self.addCleanup(self.client.close)
+
+    def memberships(self):
+        return set(User.groups.through.objects.values_list('user__username', 'group__name'))
+
+    def test_sync_writes_only_the_difference(self):
+        local = Group.objects.create(name='local-editors')
+        User.objects.get(username='carol').groups.add(local)
+        stats = sync_groups(self.client, chunk_size=2, page_size=1)
+        self.assertEqual(stats['groups_created'], 3)
+        self.assertEqual(stats['memberships_added'], 5)
+        self.assertIn(('carol', 'local-editors'), self.memberships())
+
+        self.server.add_user('carol', {'groups': ['staff']})
+        with CaptureQueriesContext(connection) as queries:
+            stats = sync_groups(self.client, chunk_size=2)
+        self.assertEqual((stats['memberships_added'], stats['memberships_removed']), (1, 1))
+        writes = [query['sql'] for query in queries if query['sql'].startswith(('INSERT', 'DELETE'))]
+        self.assertEqual(len(writes), 2)
+        self.assertIn(('carol', 'staff'), self.memberships())
+        self.assertNotIn(('carol', 'students'), self.memberships())
+        # Локальные группы Django синхронизация не трогает
+        self.assertIn(('carol', 'local-editors'), self.memberships())
+
+    def test_access_checks_answer_from_database(self):
+        sync_groups(self.client)
+        with override_settings(DIRECTORY_GROUPS_FROM_DB=True), \
+                mock.patch.object(DirectoryClient, 'get_user') as get_user:
+            self.assertEqual(get_user_groups('bob'), ['identica-users', 'staff'])
+            self.assertTrue(check_website_access('bob', 'https://admin.identica.local'))
+        get_user.assert_not_called()
+
+
+class UserSyncTest(TestCase):
+    def setUp(self):
+        directory_cache.clear()
+        # Стандартные тестовые пользователи с отметкой SEED_TIMESTAMP
+        self.server = InProcessLDAPServer()
+        self.server.add_user('student3', {
+            'groups': ['students', 'identica-users'], 'first_name': 'Ольга', 'last_name': 'Котова',
+            'employeeNumber': 'ST-3', 'departmentNumber': 'engineering', 'ou': 'ENG-21',
+        }, modify_timestamp='20240902000000Z')
+        self.server.add_user('guest', {'groups': ['students']}, modify_timestamp=SEED_TIMESTAMP)
+        self.client = DirectoryClient(
+            lambda: self.server.connect(),
+            ldap_test_server.LDAP_TEST_SERVICE_DN,
+            ldap_test_server.LDAP_TEST_SERVICE_PASSWORD,
+            ldap_test_server.USER_BASE_DN,
+            ldap_test_server.GROUP_BASE_DN,
+        )
+        self.addCleanup(self.client.close)
+
+    def test_first_pass_streams_pages_and_upserts_in_bulk(self):
+        with CaptureQueriesContext(connection) as queries:
+            stats = sync_users(self.client, page_size=2)
+        self.assertEqual((stats['pages'], stats['entries']), (3, 6))
+        self.assertEqual((stats['users_created'], stats['skipped']), (5, 1))
+        self.assertEqual(stats['high_water_mark'], '20240902000000Z')
+        self.assertFalse(User.objects.filter(username='guest').exists())
+        profile = StudentProfile.objects.select_related('user').get(student_id='ST-3')
+        self.assertEqual((profile.user.username, profile.faculty, profile.group), ('student3', 'engineering', 'ENG-21'))
+        self.assertFalse(profile.user.has_usable_password())
+        self.assertEqual(StudentProfile.objects.count(), 5)
+        # Запросы на страницу не зависят от числа записей в ней
+        inserts = [query for query in queries if query['sql'].startswith('INSERT INTO "auth_user"')]
+        self.assertEqual(len(inserts), 3)
+
+    def test_next_pass_reads_only_changed_entries(self):
+        sync_users(self.client)
+        User.objects.filter(username='student1').update(first_name='Локально')
+        self.server.add_user('student2', {
+            'groups': ['students', 'identica-users'], 'first_name': 'Мария', 'last_name': 'Новикова',
+        }, modify_timestamp='20240903000000Z')
+        stats = sync_users(self.client)
+        self.assertEqual(stats['since'], '20240902000000Z')
+        # student3 - на границе отметки, читается повторно, но ничего не пишет
+        self.assertEqual((stats['entries'], stats['users_updated'], stats['profiles_written']), (2, 1, 0))
+        self.assertEqual(User.objects.get(username='student2').last_name, 'Новикова')
+        self.assertEqual(User.objects.get(username='student1').first_name, 'Локально')
+
+        stats = sync_users(self.client, full=True)
+        self.assertEqual(stats['users_updated'], 1)
+        self.assertEqual(User.objects.get(username='student1').first_name, 'Иван')
+
+
+class LoginRateLimitTest(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.settings_override = override_settings(
+            LOGIN_RATELIMIT_DB=os.path.join(self.tmpdir.name, 'ratelimit.sqlite3'),
+            LOGIN_RATELIMIT_USERNAME=(3, 60),
+            LOGIN_RATELIMIT_IP=(5, 60),
+        )
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+
+    def test_username_bucket_rejects_before_backend(self):
+        for _ in range(3):
+            response = self.client.post('/accounts/login/', {'username': 'student1', 'password': 'wrong'})
+            self.assertEqual(response.status_code, 200)
+        with mock.patch.object(RealmRouterBackend, 'authenticate') as authenticate:
+            response = self.client.post('/accounts/login/', {'username': 'Student1', 'password': 'password123'})
+        authenticate.assert_not_called()
+        self.assertEqual(response.status_code, 429)
+        self.assertGreaterEqual(int(response['Retry-After']), 1)
+
+    def test_admin_login_shares_the_limit(self):
+        for _ in range(3):
+            response = self.client.post('/accounts/login/', {'username': 'student1', 'password': 'wrong'})
+        with mock.patch.object(RealmRouterBackend, 'authenticate') as authenticate:
+            response = self.client.post('/admin/login/', {'username': 'student1', 'password': 'password123'})
+        authenticate.assert_not_called()
+        self.assertContains(response, 'Слишком много попыток входа', status_code=429)
+        self.assertGreaterEqual(int(response['Retry-After']), 1)
+
+        # Попытки через админку тоже расходуют корзину
+        for number in range(3):
+            self.client.post('/admin/login/', {'username': 'admin', 'password': f'guess{number}'})
+        response = self.client.post('/admin/login/', {'username': 'admin', 'password': 'guess3'})
+        self.assertEqual(response.status_code, 429)
+
+    def test_ip_bucket_spans_usernames(self):
+        for number in range(5):
+            login_limiter.hit(f'user{number}', '10.0.0.1')
+        self.assertGreater(login_limiter.hit('user9', '10.0.0.1'), 0)
+        self.assertEqual(login_limiter.hit('user9', '10.0.0.2'), 0)
+
+    def test_buckets_refill_and_are_shared_between_limiters(self):
+        clock = [1000.0]
+        first = LoginRateLimiter(timer=lambda: clock[0])
+        second = LoginRateLimiter(timer=lambda: clock[0])
+        for _ in range(3):
+            self.assertEqual(first.hit('student1', ''), 0)
+        self.assertAlmostEqual(second.hit('student1', ''), 20.0)
+        clock[0] += 20
+        self.assertEqual(second.hit('student1', ''), 0)
+        clock[0] += 120
+        for _ in range(3):
+            self.assertEqual(first.hit('student1', ''), 0)
+
+
+class WriteQueueTest(SimpleTestCase):
+    def test_writes_run_one_at_a_time_in_arrival_order(self):
+        queue = WriteQueue()
+        order, active, overlaps = [], [0], []
+        gate = threading.Event()
+
+        def write(number):
+            active[0] += 1
+            overlaps.append(active[0])
+            if number == 0:
+                gate.wait(1)
+            order.append(number)
+            active[0] -= 1
+
+        threads = [threading.Thread(target=queue.run, args=(write, number)) for number in range(5)]
+        threads[0].start()
+        while queue._owner is None:
+            time.sleep(0.001)
+        for number, thread in enumerate(threads[1:], 1):
+            thread.start()
+            while queue.pending() < number:
+                time.sleep(0.001)
+        gate.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(order, [0, 1, 2, 3, 4])
+        self.assertEqual(max(overlaps), 1)
+
+    def test_nested_write_does_not_deadlock(self):
+        queue = WriteQueue()
+        self.assertEqual(queue.run(queue.run, lambda: 'done'), 'done')
+        self.assertIsNone(queue._owner)
+
+    def test_sqlite_write_benchmark(self):
+        out = StringIO()
+        call_command('bench_sqlite_writes', '--threads', '2', '--operations', '5', '--students', '10',
+                     '--mode', 'tuned+queue', '--json', stdout=out)
+        result = json.loads(out.getvalue())['tuned+queue']
+        self.assertEqual(result['operations'], 10)
+        self.assertEqual(result['locked_errors'], 0)
+
+
+@mock.patch('profiles.db_router.replica_configured', return_value=True)
+class ReplicaRouterTest(SimpleTestCase):
+    def setUp(self):
+        self.router = ReplicaRouter()
+        self.factory = RequestFactory()
+
+    def route(self, request, view):
+        return ReplicaPinMiddleware(replica_reads(view))(request)
+
+    def test_read_only_view_reads_profiles_from_replica(self, configured):
+        seen = {}
+
+        def view(request):
+            seen['profile'] = self.router.db_for_read(StudentProfile)
+            seen['user'] = self.router.db_for_read(User)
+            return HttpResponse()
+
+        response = self.route(self.factory.get('/dashboard/'), view)
+        self.assertEqual(seen, {'profile': 'replica', 'user': None})
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+        self.assertIsNone(self.router.db_for_read(StudentProfile))
+
+    def test_reads_after_write_stay_on_primary(self, configured):
+        seen = []
+
+        def view(request):
+            seen.append(self.router.db_for_read(Website))
+            self.router.db_for_write(Subscription)
+            seen.append(self.router.db_for_read(Website))
+            return HttpResponse()
+
+        response = self.route(self.factory.get('/dashboard/'), view)
+        self.assertEqual(seen, ['replica', None])
+        self.assertIn(PIN_COOKIE, response.cookies)
+
+        request = self.factory.get('/dashboard/')
+        request.COOKIES[PIN_COOKIE] = '1'
+        self.route(request, lambda request: seen.append(self.router.db_for_read(Website)) or HttpResponse())
+        self.assertEqual(seen[-1], None)
+
+    def test_post_and_undecorated_views_use_primary(self, configured):
+        seen = []
+        self.route(self.factory.post('/profile/'), lambda request: seen.append(
+            self.router.db_for_read(StudentProfile)) or HttpResponse())
+        ReplicaPinMiddleware(lambda request: seen.append(
+            self.router.db_for_read(StudentProfile)) or HttpResponse())(self.factory.get('/'))
+        self.assertEqual(seen, [None, None])
+        self.assertFalse(self.router.allow_migrate('replica', 'profiles'))
+
+    def test_snapshot_copies_database(self, configured):
+        with tempfile.TemporaryDirectory() as directory:
+            source = os.path.join(directory, 'db.sqlite3')
+            target = os.path.join(directory, 'replica.sqlite3')
+            with sqlite3.connect(source) as db:
+                db.execute('CREATE TABLE t (x)')
+                db.execute('INSERT INTO t VALUES (1)')
+            snapshot_replica.Command().snapshot(source, target)
+            with closing(sqlite3.connect(target)) as db:
+                self.assertEqual(db.execute('SELECT x FROM t').fetchall(), [(1,)])
+
+
+class CatalogueCacheTest(TestCase):
+    def setUp(self):
+        self.category = WebsiteCategory.objects.create(name='Библиотеки')
+        self.site = Website.objects.create(name='Каталог', url='https://lib.example.com', category=self.category)
+
+    def test_snapshot_is_built_once_per_version(self):
+        with CaptureQueriesContext(connection) as first:
+            catalogue = get_catalogue()
+        with CaptureQueriesContext(connection) as second:
+            self.assertIs(get_catalogue(), catalogue)
+        self.assertEqual(len(first), 1)
+        self.assertEqual(len(second), 0)
+        self.assertEqual(catalogue.by_category, {'Библиотеки': [self.site]})
+
+    def test_website_and_category_changes_bump_version(self):
+        catalogue = get_catalogue()
+        self.site.is_active = False
+        self.site.save()
+        self.assertNotEqual(catalogue_version(), catalogue.version)
+        self.assertNotIn(self.site.id, get_catalogue().ids)
+
+        version = catalogue_version()
+        self.category.delete()
+        self.assertNotEqual(catalogue_version(), version)
+
+    def test_form_choices_come_from_snapshot(self):
+        get_catalogue()
+        with CaptureQueriesContext(connection) as queries:
+            form = SubscriptionForm({'websites': [str(self.site.id)]})
+            self.assertTrue(form.is_valid())
+        self.assertEqual(form.cleaned_data['websites'], [self.site.id])
+        self.assertEqual(len(queries), 0)
+        self.assertFalse(SubscriptionForm({'websites': ['0']}).is_valid())
+
+
+class ConditionalPageTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='student')
+        self.profile = self.user.studentprofile
+        self.profile.student_id, self.profile.faculty = 'ST1', 'science'
+        self.profile.course, self.profile.group = 1, 'SC-101'
+        self.profile.save()
+        self.site = Website.objects.create(
+            name='Сайт', url='https://site.example.com',
+            category=WebsiteCategory.objects.create(name='Наука'),
+        )
+        self.client.force_login(self.user)
+
+    def revalidate(self, path):
+        etag = self.client.get(path)['ETag']
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+        return etag, response, queries
+
+    def test_unchanged_pages_answer_304_without_view_queries(self):
+        for path in ['/profile/', '/dashboard/', '/subscriptions/']:
+            etag, response, queries = self.revalidate(path)
+            self.assertEqual(response.status_code, 304, path)
+            self.assertFalse(etag.startswith('W/'))
+            self.assertFalse([query for query in queries.captured_queries if 'profiles_' in query['sql']])
+            self.assertIn('no-cache', response['Cache-Control'])
+
+    def test_profile_subscription_and_catalogue_changes_change_etag(self):
+        changes = [
+            lambda: self.profile.sync_subscriptions([self.site.id]),
+            lambda: StudentProfile.objects.get(pk=self.profile.pk).save(),
+            lambda: Website.objects.filter(pk=self.site.pk).get().save(),
+        ]
+        for change in changes:
+            etag = self.client.get('/dashboard/')['ETag']
+            change()
+            response = self.client.get('/dashboard/', HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response['ETag'], etag)
+
+    def test_subscription_changes_do_not_load_profiles_per_row(self):
+        for number in range(3):
+            user = User.objects.create_user(username=f'cascade{number}')
+            Subscription.objects.create(student=user.studentprofile, website=self.site)
+        Subscription.objects.create(student=self.profile, website=self.site)
+
+        # Каскад от сайта: страницы сбрасывает версия каталога
+        with CaptureQueriesContext(connection) as queries:
+            Website.objects.get(pk=self.site.pk).delete()
+        self.assertFalse([query for query in queries
+                          if 'FROM "profiles_studentprofile"' in query['sql']])
+
+        # Подписки без загруженного профиля - один запрос при фиксации
+        for number in range(2):
+            site = Website.objects.create(name=f'Сайт {number}', url=f'https://site{number}.example.com',
+                                          category=self.site.category)
+            Subscription.objects.create(student=self.profile, website=site)
+        etag = self.client.get('/dashboard/')['ETag']
+        with CaptureQueriesContext(connection) as queries:
+            with self.captureOnCommitCallbacks(execute=True) as callbacks:
+                Subscription.objects.filter(student=self.profile).delete()
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(len([query for query in queries
+                              if 'FROM "profiles_studentprofile"' in query['sql']]), 1)
+        self.assertNotEqual(self.client.get('/dashboard/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_recent_changes_keep_page_reads_on_primary(self):
+        with mock.patch('profiles.decorators.pin_to_primary') as pin:
+            self.client.get('/dashboard/')
+        pin.assert_called_once()
+
+        # Реплика старше DATABASE_REPLICA_LAG содержит все изменения - ее тело совпадет с ETag
+        later = time.time() + settings.DATABASE_REPLICA_LAG + 1
+        with mock.patch('profiles.decorators.pin_to_primary') as pin, \
+                mock.patch('profiles.decorators.time.time', return_value=later):
+            self.client.get('/dashboard/')
+        pin.assert_not_called()
+
+    def test_bulk_delete_after_rollback_still_bumps_on_commit(self):
+        Subscription.objects.create(student=self.profile, website=self.site)
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            Subscription.objects.filter(student=self.profile).delete()
+            raise RuntimeError
+        etag = self.client.get('/dashboard/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            Subscription.objects.filter(student=self.profile).delete()
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(self.client.get('/dashboard/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_pending_messages_force_full_page(self):
+        etag = self.client.get('/profile/')['ETag']
+        self.client.post('/subscriptions/', {'websites': ['999999']})
+        response = self.client.get('/profile/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Выбраны несуществующие')
+
+
+class MalformedUrlViewsTest(TestCase):
+    def setUp(self):
+        directory_cache.clear()
+        self.user = User.objects.create_user(username='student1')
+
+    def assert_denied(self, response):
+        self.assertEqual(response.status_code, 200)
+        self.assertIs(response.context['specific_access'], False)
+
+    def assert_test_denied(self, response):
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.context['test_result']['access_granted'])
+
+    def test_sync_views(self):
+        self.client.force_login(self.user)
+        self.assert_denied(self.client.get('/access-check/', {'url': 'http://[abc'}))
+        self.assert_test_denied(self.client.get('/ldap-test/', {'test_url': 'http://[abc'}))
+
+    @override_settings(ROOT_URLCONF='profiles.test_urls')
+    async def test_async_views(self):
+        await self.async_client.aforce_login(self.user)
+        self.assert_denied(await self.async_client.get('/access-check/', {'url': 'http://[abc'}))
+        self.assert_test_denied(await self.async_client.get('/ldap-test/', {'test_url': 'http://[abc'}))
+
+
+@override_settings(ROOT_URLCONF='profiles.test_urls')
+class AsyncDirectoryViewsTest(TestCase):
+    def setUp(self):
+        directory_cache.clear()
+        self.user = User.objects.create_user(username='student1')
+
+    async def test_async_pages_render_directory_access(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get('/ldap-test/', {'test_url': 'https://library.identica.local'})
+        self.assertContains(response, 'students')
+        self.assertTrue(response.context['test_result']['access_granted'])
+
+        response = await self.async_client.get('/access-check/')
+        access = {site['name']: site['access_granted'] for site in response.context['accessible_websites']}
+        self.assertTrue(access['Библиотека университета'])
+        self.assertFalse(access['Админ панель'])
+
+        self.assertTemplateUsed(await self.async_client.get('/test/library/'), 'profiles/test_pages/library.html')
+        self.assertTemplateUsed(await self.async_client.get('/test/admin/'), 'profiles/access_denied.html')
+
+    async def test_anonymous_test_page_redirects(self):
+        response = await self.async_client.get('/test/library/')
+        self.assertRedirects(response, '/accounts/login/', fetch_redirect_response=False)
+
+
+class AsyncDirectoryClientTest(SimpleTestCase):
+    def test_concurrent_lookups_share_one_directory_call(self):
+        calls = []
+
+        class SlowClient:
+            def get_user(self, username):
+                calls.append(username)
+                time.sleep(0.05)
+                return {'username': username}
+
+        client = AsyncDirectoryClient(SlowClient(), max_threads=2)
+        self.addCleanup(client.close)
+
+        async def lookups():
+            return await asyncio.gather(*[client.get_user(name) for name in ['a', 'a', 'a', 'b']])
+
+        results = asyncio.run(lookups())
+        self.assertEqual([result['username'] for result in results], ['a', 'a', 'a', 'b'])
+        self.assertEqual(sorted(calls), ['a', 'b'])
+
+    def test_async_directory_benchmark(self):
+        out = StringIO()
+        call_command('bench_async_directory', '--users', '4', '--requests', '2', '--latency', '0',
+                     '--json', stdout=out)
+        result = json.loads(out.getvalue())
+        for mode in ['sync', 'async']:
+            self.assertEqual(result[mode]['directory_requests']['requests']
+                             + result[mode]['other_requests']['requests'], 8)
@@ -1,5 +1,6 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import async_views, views
 
 urlpatterns = [
     path('', views.home, name='home'),
@@ -7,11 +8,27 @@ urlpatterns = [
     path('subscriptions/', views.manage_subscriptions, name='manage_subscriptions'),
     path('dashboard/', views.dashboard, name='dashboard'),
     path('monitor/', views.monitor_dashboard, name='monitor_dashboard'),
-    path('access-check/', views.website_access_check, name='website_access_check'),
-    path('ldap-test/', views.ldap_test_tool, name='ldap_test_tool'),
-    # Тестовые страницы
-    path('test/library/', views.test_library_page, name='test_library'),
-    path('test/research/', views.test_research_page, name='test_research'),
-    path('test/admin/', views.test_admin_page, name='test_admin'),
-    path('test/courses/', views.test_courses_page, name='test_courses'),
-]
\ No newline at end of file
+    path('reports/', views.generate_report, name='generate_report'),
+    path('metrics', views.metrics, name='metrics'),
+]
+
+if settings.DIRECTORY_VIEWS_ASYNC:
+    # Под ASGI страницы, которые ждут каталог, не занимают поток воркера
+    urlpatterns += [
+        path('access-check/', async_views.website_access_check, name='website_access_check'),
+        path('ldap-test/', async_views.ldap_test_tool, name='ldap_test_tool'),
+        path('test/library/', async_views.test_page, {'page': 'library'}, name='test_library'),
+        path('test/research/', async_views.test_page, {'page': 'research'}, name='test_research'),
+        path('test/admin/', async_views.test_page, {'page': 'admin'}, name='test_admin'),
+        path('test/courses/', async_views.test_page, {'page': 'courses'}, name='test_courses'),
+    ]
+else:
+    urlpatterns += [
+        path('access-check/', views.website_access_check, name='website_access_check'),
+        path('ldap-test/', views.ldap_test_tool, name='ldap_test_tool'),
+        # Тестовые страницы
+        path('test/library/', views.test_library_page, name='test_library'),
+        path('test/research/', views.test_research_page, name='test_research'),
+        path('test/admin/', views.test_admin_page, name='test_admin'),
+        path('test/courses/', views.test_courses_page, name='test_courses'),
+    ]
\ No newline at end of file
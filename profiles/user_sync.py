@@ -0,0 +1,141 @@
+"""
+Инкрементальная синхронизация пользователей каталога.
+
+Проход запрашивает только записи с modifyTimestamp не раньше отметки
+прошлого прохода (DirectorySyncState) и обрабатывает постраничный ответ
+потоком: страница читается, записывается и отбрасывается, поэтому в
+памяти не больше одной страницы. Каждая страница - одна транзакция через
+очередь записей: User и StudentProfile записываются массово, по одному
+запросу на чтение и запись каждой таблицы.
+
+Отметка сохраняется только после успешного прохода, и сравнение
+нестрогое (>=): записи с пограничным временем обрабатываются повторно,
+но изменения за ту же секунду не теряются. Повторная обработка ничего
+не пишет, если данные не изменились.
+"""
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.utils import timezone
+
+from .directory_cache import directory_cache
+from .ldap_backend import directory_user_fields
+from .ldap_utils import local_entry_key
+from .metrics import registry
+from .models import DirectorySyncState, StudentProfile
+from .versioning import bump_version_on_commit, user_version_key
+from .write_queue import serialized_write
+
+SYNC_NAME = 'users'
+USER_FIELDS = ['email', 'first_name', 'last_name', 'is_staff', 'is_superuser', 'is_active']
+PROFILE_FIELDS = ['student_id', 'faculty', 'group']
+FACULTIES = {value for value, _ in StudentProfile.FACULTY_CHOICES}
+GROUP_MAX_LENGTH = StudentProfile._meta.get_field('group').max_length
+
+
+def _profile_values(user_data, profile):
+    """Поля профиля из каталога; пустые и недопустимые значения не затирают локальные"""
+    values = {field: getattr(profile, field) for field in PROFILE_FIELDS}
+    if user_data['student_id']:
+        values['student_id'] = user_data['student_id']
+    if user_data['faculty'] in FACULTIES:
+        values['faculty'] = user_data['faculty']
+    if user_data['group'] and len(user_data['group']) <= GROUP_MAX_LENGTH:
+        values['group'] = user_data['group']
+    return values
+
+
+@serialized_write('directory_page_sync')
+def apply_page(page, stats):
+    """Записывает страницу пользователей каталога; счетчики добавляет в stats"""
+    existing = {user.username: user for user in User.objects.filter(
+        username__in=[user_data['username'] for user_data in page])}
+    created, updated, synced = [], [], []
+    for user_data in page:
+        fields = directory_user_fields(user_data)
+        user = existing.get(user_data['username'])
+        if user is None:
+            if not fields['is_active']:
+                # Без доступа к приложению пользователь не создается - как и при входе
+                stats['skipped'] += 1
+                continue
+            user = User(username=user_data['username'], password=make_password(None), **fields)
+            created.append(user)
+        elif any(getattr(user, field) != value for field, value in fields.items()):
+            for field, value in fields.items():
+                setattr(user, field, value)
+            updated.append(user)
+        synced.append((user, user_data))
+
+    # post_save не срабатывает: профили новых пользователей создаются ниже
+    User.objects.bulk_create(created)
+    User.objects.bulk_update(updated, USER_FIELDS)
+
+    profiles = StudentProfile.objects.in_bulk(
+        [user.pk for user, _ in synced], field_name='user_id')
+    wanted_ids = [user_data['student_id'] for _, user_data in synced if user_data['student_id']]
+    owners = dict(StudentProfile.objects.filter(
+        student_id__in=wanted_ids).values_list('student_id', 'user_id'))
+    upserts = []
+    for user, user_data in synced:
+        profile = profiles.get(user.pk) or StudentProfile(user_id=user.pk)
+        values = _profile_values(user_data, profile)
+        owner = owners.get(values['student_id'])
+        if values['student_id'] and owner not in (None, user.pk):
+            # Билет уже записан за другим профилем - оставляем прежнее значение
+            stats['conflicts'] += 1
+            values['student_id'] = profile.student_id
+        if values['student_id']:
+            owners[values['student_id']] = user.pk
+        if profile.pk is None or any(getattr(profile, field) != value for field, value in values.items()):
+            for field, value in values.items():
+                setattr(profile, field, value)
+            upserts.append(profile)
+    StudentProfile.objects.bulk_create(
+        upserts, update_conflicts=True, unique_fields=['user'], update_fields=PROFILE_FIELDS)
+
+    # Массовые записи обходят сигналы - версии страниц меняем сами
+    changed = ({user.pk for user in updated} | {profile.user_id for profile in upserts}) - {
+        user.pk for user in created}
+    for user_id in changed:
+        bump_version_on_commit(user_version_key(user_id))
+    for user, _ in synced:
+        directory_cache.invalidate(user.username)
+        directory_cache.invalidate(local_entry_key(user.username))
+
+    stats['users_created'] += len(created)
+    stats['users_updated'] += len(updated)
+    stats['profiles_written'] += len(upserts)
+
+
+def sync_users(client, page_size=500, full=False):
+    """Проход синхронизации пользователей; возвращает статистику"""
+    started = time.perf_counter()
+    state, _ = DirectorySyncState.objects.get_or_create(name=SYNC_NAME)
+    since = None if full else state.high_water_mark or None
+    stats = {
+        'since': since, 'pages': 0, 'entries': 0, 'skipped': 0, 'conflicts': 0,
+        'users_created': 0, 'users_updated': 0, 'profiles_written': 0,
+    }
+    mark = state.high_water_mark
+    for page in client.iter_user_pages(since=since, page_size=page_size):
+        stats['pages'] += 1
+        stats['entries'] += len(page)
+        if page:
+            apply_page(page, stats)
+            mark = max([mark] + [user_data['modify_timestamp'] for user_data in page])
+
+    state.high_water_mark = mark
+    state.last_run = timezone.now()
+    state.last_entries = stats['entries']
+    state.save()
+
+    duration = time.perf_counter() - started
+    stats['high_water_mark'] = mark
+    stats['seconds'] = round(duration, 3)
+    registry.observe('identica_directory_sync_duration_seconds', {'job': SYNC_NAME}, duration)
+    for action in ('users_created', 'users_updated', 'profiles_written'):
+        registry.inc('identica_directory_sync_rows_total', {'job': SYNC_NAME, 'action': action}, stats[action])
+    registry.flush()
+    return stats
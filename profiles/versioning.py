@@ -0,0 +1,63 @@
+"""
+Метки версий данных в общем кэше.
+
+По метке версии процессы узнают, что их снимок или закэшированный фрагмент
+устарел. Метка - время изменения и случайный суффикс, а не счетчик: после
+очистки кэша старые записи с совпавшим номером не оживут.
+"""
+import time
+import uuid
+
+from django.core.cache import cache
+from django.db import transaction
+
+
+def _new_version():
+    return f'{int(time.time())}.{uuid.uuid4().hex[:12]}'
+
+
+def version_timestamp(version):
+    """Время изменения (Unix time), записанное в метке, или None"""
+    try:
+        return int(version.split('.', 1)[0])
+    except ValueError:
+        return None
+
+
+def get_version(key):
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _new_version(), None)
+        version = cache.get(key)
+    return version
+
+
+def get_versions(*keys):
+    """Несколько меток одним обращением к кэшу"""
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            versions[key] = get_version(key)
+    return [versions[key] for key in keys]
+
+
+def bump_version(key):
+    cache.set(key, _new_version(), None)
+
+
+def bump_version_on_commit(key, using=None):
+    """
+    Меняет метку сразу - чтобы этот процесс увидел изменение, и еще раз после
+    фиксации - чтобы снимок, собранный другим процессом до фиксации, устарел.
+    """
+    bump_version(key)
+    transaction.on_commit(lambda: bump_version(key), using=using)
+
+
+def subscriptions_version_key(user_id):
+    return f'subscriptions:version:{user_id}'
+
+
+def user_version_key(user_id):
+    """Пользователь и его профиль"""
+    return f'user:version:{user_id}'
@@ -1,20 +1,52 @@
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
 from django.shortcuts import render, redirect, get_object_or_404
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
+from django.core.paginator import Paginator
+from django.contrib.auth.views import LoginView
 from django.contrib import messages
-from django.db import transaction
-from .models import StudentProfile, Subscription, Website
-from .forms import StudentProfileForm, SubscriptionForm
+from django.utils.functional import SimpleLazyObject
+from .models import ReportSnapshot, Subscription
+from .forms import ReportForm, StudentProfileForm, SubscriptionForm
+from .metrics import render_metrics
+from .catalogue import CATALOGUE_VERSION_KEY, get_catalogue
+from .db_router import replica_reads
+from .decorators import user_page
+from .exports import format_lines, iter_keyset, streaming_file_response
+from .middleware import get_student_profile
+from .ratelimit import check_login_attempt, client_ip
+from .reports import REPORTS, report_rows
+from .versioning import get_version, get_versions, subscriptions_version_key
 from .ldap_utils import get_user_accessible_websites, check_website_access
 
 def home(request):
     return render(request, 'profiles/home.html')
 
+def metrics(request):
+    """Метрики приложения в формате Prometheus: сотрудникам и адресам METRICS_ALLOWED_IPS"""
+    if not request.user.is_staff and client_ip(request) not in settings.METRICS_ALLOWED_IPS:
+        return HttpResponseForbidden()
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+class RateLimitedLoginView(LoginView):
+    """Вход с ограничением частоты попыток: лишние попытки не доходят до бэкендов"""
+    template_name = 'profiles/login.html'
+
+    def post(self, request, *args, **kwargs):
+        retry_after = check_login_attempt(request)
+        if retry_after:
+            context = self.get_context_data(form=self.get_form_class()(request), ratelimited=True)
+            response = self.render_to_response(context, status=429)
+            response['Retry-After'] = str(int(retry_after) + 1)
+            return response
+        return super().post(request, *args, **kwargs)
+
 @login_required
+@user_page
+@replica_reads
 def profile_view(request):
-    try:
-        student_profile = StudentProfile.objects.get(user=request.user)
-    except StudentProfile.DoesNotExist:
-        student_profile = StudentProfile.objects.create(user=request.user)
+    student_profile = get_student_profile(request)
     
     subscriptions = Subscription.objects.filter(
         student=student_profile, 
@@ -50,62 +82,55 @@ def profile_view(request):
     })
 
 @login_required
+@user_page
 def manage_subscriptions(request):
-    try:
-        student_profile = StudentProfile.objects.get(user=request.user)
-    except StudentProfile.DoesNotExist:
-        student_profile = StudentProfile.objects.create(user=request.user)
+    student_profile = get_student_profile(request)
     
     if not all([student_profile.student_id, student_profile.faculty, student_profile.course, student_profile.group]):
         messages.warning(request, 'Пожалуйста, заполните ваш профиль перед управлением подписками.')
         return redirect('profile')
     
-    current_subscriptions = Subscription.objects.filter(
-        student=student_profile, 
-        is_active=True
-    ).values_list('website_id', flat=True)
-    
     if request.method == 'POST':
-        selected_websites = request.POST.getlist('websites')
+        form = SubscriptionForm(request.POST)
+        # Неизвестные и отключенные сайты отклоняем до каких-либо изменений
+        if not form.is_valid():
+            messages.error(request, 'Выбраны несуществующие или отключенные сайты.')
+            return redirect('manage_subscriptions')
         
-        with transaction.atomic():
-            Subscription.objects.filter(student=student_profile).update(is_active=False)
-            
-            for website_id in selected_websites:
-                website = Website.objects.get(id=website_id)
-                subscription, created = Subscription.objects.get_or_create(
-                    student=student_profile,
-                    website=website,
-                    defaults={'is_active': True}
-                )
-                if not created:
-                    subscription.is_active = True
-                    subscription.save()
+        student_profile.sync_subscriptions(form.cleaned_data['websites'])
         
         messages.success(request, 'Подписки успешно обновлены!')
         return redirect('profile')
     
-    websites_by_category = {}
-    for website in Website.objects.filter(is_active=True).select_related('category'):
-        category_name = website.category.name
-        if category_name not in websites_by_category:
-            websites_by_category[category_name] = []
-        websites_by_category[category_name].append(website)
+    catalogue = get_catalogue()
+    # Сетка сайтов кэшируется по версиям каталога и подписок - подписки
+    # читаются только при ее перерисовке, проверка членства по множеству
+    current_subscriptions = SimpleLazyObject(lambda: set(
+        Subscription.objects.filter(
+            student=student_profile,
+            is_active=True
+        ).values_list('website_id', flat=True)
+    ))
     
     return render(request, 'profiles/subscriptions.html', {
-        'websites_by_category': websites_by_category,
-        'current_subscriptions': list(current_subscriptions),
+        'websites_by_category': catalogue.by_category,
+        'current_subscriptions': current_subscriptions,
+        'student_id': student_profile.id,
+        'catalogue_version': catalogue.version,
+        'subscriptions_version': get_version(subscriptions_version_key(request.user.pk)),
         'active_tab': 'subscriptions'
     })
 
 @login_required
+@user_page
+@replica_reads
 def dashboard(request):
-    try:
-        student_profile = StudentProfile.objects.get(user=request.user)
-    except StudentProfile.DoesNotExist:
-        student_profile = StudentProfile.objects.create(user=request.user)
+    student_profile = get_student_profile(request)
     
-    subscriptions = Subscription.objects.filter(
+    # Список попадает во фрагмент, закэшированный по версии подписок, - всегда
+    # из основной базы: реплика может отставать от версии, и отстающий список
+    # остался бы в кэше до следующего изменения
+    subscriptions = Subscription.objects.using('default').filter(
         student=student_profile, 
         is_active=True
     ).select_related('website')
@@ -117,9 +142,15 @@ def dashboard(request):
         student_profile.group
     ])
     
+    catalogue_version, subscriptions_version = get_versions(
+        CATALOGUE_VERSION_KEY, subscriptions_version_key(request.user.pk)
+    )
+    
     return render(request, 'profiles/dashboard.html', {
         'profile': student_profile,
         'subscriptions': subscriptions,
+        'catalogue_version': catalogue_version,
+        'subscriptions_version': subscriptions_version,
         'active_tab': 'dashboard',
         'profile_complete': profile_complete
     })
@@ -127,11 +158,7 @@ def dashboard(request):
 @login_required
 def monitor_dashboard(request):
     """Панель управления для старосты"""
-    try:
-        student_profile = StudentProfile.objects.get(user=request.user)
-    except StudentProfile.DoesNotExist:
-        messages.error(request, 'Профиль студента не найден.')
-        return redirect('dashboard')
+    student_profile = get_student_profile(request)
     
     # Проверяем, является ли пользователь старостой
     if not student_profile.is_monitor:
@@ -143,28 +170,14 @@ def monitor_dashboard(request):
         messages.error(request, 'Для доступа к панели старосты необходимо указать группу в вашем профиле.')
         return redirect('profile')
     
-    # Получаем статистику
+    # Получаем статистику (один агрегирующий запрос)
     students_in_group = student_profile.get_students_in_group()
     filled_profiles = student_profile.get_filled_profiles()
     completion_percentage = student_profile.get_completion_percentage()
     group_activity = student_profile.get_group_activity()
-    group_students = student_profile.get_group_students()
-    
-    # Статистика по подпискам для каждого студента
-    subscription_stats = []
-    for student in group_students:
-        subscriptions_count = Subscription.objects.filter(student=student, is_active=True).count()
-        profile_complete = all([
-            student.student_id is not None and student.student_id != '',
-            student.faculty is not None and student.faculty != '',
-            student.course is not None,
-            student.group is not None and student.group != ''
-        ])
-        subscription_stats.append({
-            'student': student,
-            'subscriptions_count': subscriptions_count,
-            'profile_complete': profile_complete
-        })
+    
+    # Состав группы с подписками и заполненностью профилей (один запрос)
+    group_students = list(student_profile.get_group_students())
     
     context = {
         'student_profile': student_profile,
@@ -173,13 +186,13 @@ def monitor_dashboard(request):
         'completion_percentage': completion_percentage,
         'group_activity': group_activity,
         'group_students': group_students,
-        'subscription_stats': subscription_stats,
         'active_tab': 'monitor'
     }
     
     return render(request, 'profiles/monitor_dashboard.html', context)
 
 @login_required
+@replica_reads
 def website_access_check(request):
     """Страница проверки доступа к сайтам"""
     accessible_websites = get_user_accessible_websites(request.user.username)
@@ -199,6 +212,17 @@ def website_access_check(request):
     
     return render(request, 'profiles/website_access.html', context)
 
+# Популярные сайты для быстрого тестирования
+POPULAR_SITES = [
+    {'name': 'Библиотека', 'url': 'https://library.university.local'},
+    {'name': 'Научный портал', 'url': 'https://research.university.local'},
+    {'name': 'Админка', 'url': 'https://admin.university.local'},
+    {'name': 'Курсы', 'url': 'https://courses.university.local'},
+    {'name': 'Яндекс', 'url': 'https://yandex.ru'},
+    {'name': 'Google', 'url': 'https://google.com'},
+    {'name': 'GitHub', 'url': 'https://github.com'},
+]
+
 @login_required
 def ldap_test_tool(request):
     """Инструмент для тестирования LDAP доступа"""
@@ -206,7 +230,8 @@ def ldap_test_tool(request):
         check_website_access, 
         get_user_accessible_websites, 
         get_user_ldap_info,
-        get_user_groups
+        get_user_groups,
+        get_website_required_groups
     )
     
     username = request.user.username
@@ -221,26 +246,15 @@ def ldap_test_tool(request):
         test_result = {
             'url': test_url,
             'access_granted': check_website_access(username, test_url),
-            'required_groups': [],  # Можно добавить логику для определения требуемых групп
+            'required_groups': get_website_required_groups(test_url),
         }
     
-    # Популярные сайты для быстрого тестирования
-    popular_sites = [
-        {'name': 'Библиотека', 'url': 'https://library.university.local'},
-        {'name': 'Научный портал', 'url': 'https://research.university.local'},
-        {'name': 'Админка', 'url': 'https://admin.university.local'},
-        {'name': 'Курсы', 'url': 'https://courses.university.local'},
-        {'name': 'Яндекс', 'url': 'https://yandex.ru'},
-        {'name': 'Google', 'url': 'https://google.com'},
-        {'name': 'GitHub', 'url': 'https://github.com'},
-    ]
-    
     context = {
         'user_ldap_info': user_ldap_info,
         'user_groups': user_groups,
         'accessible_websites': accessible_websites,
         'test_result': test_result,
-        'popular_sites': popular_sites,
+        'popular_sites': POPULAR_SITES,
         'active_tab': 'ldap_test'
     }
     
@@ -313,4 +327,32 @@ def test_courses_page(request):
             'required_groups': ['students', 'staff', 'admins', 'monitors']
         })
     
-    return render(request, 'profiles/test_pages/courses.html')
\ No newline at end of file
+    return render(request, 'profiles/test_pages/courses.html')
+
+REPORT_PAGE_SIZE = 50
+
+@staff_member_required
+@replica_reads
+def generate_report(request):
+    """Отчеты из готовых снимков (build_reports): страница читает строки, а не считает их"""
+    form = ReportForm(request.GET or None)
+    context = {'form': form, 'active_tab': 'reports'}
+    if form.is_valid():
+        report_type = form.cleaned_data['report_type']
+        columns, _ = REPORTS[report_type]
+        snapshot = ReportSnapshot.objects.filter(report_type=report_type, version__gt=0).first()
+        context.update(columns=columns, snapshot=snapshot)
+        if snapshot is not None:
+            rows = report_rows(snapshot, form.cleaned_data['start_date'], form.cleaned_data['end_date'])
+            keys = [key for key, _ in columns]
+            if request.GET.get('format') == 'csv':
+                lines = format_lines(['day'] + keys, (
+                    [bucket.isoformat()] + [data.get(key) for key in keys]
+                    for _, bucket, data in iter_keyset(rows, ['pk', 'bucket', 'data'])
+                ), 'csv')
+                return streaming_file_response(lines, f'{report_type}-v{snapshot.version}.csv', 'csv')
+            page = Paginator(rows, REPORT_PAGE_SIZE).get_page(request.GET.get('page'))
+            context.update(page=page, table=[
+                (row.bucket, [row.data.get(key) for key in keys]) for row in page
+            ])
+    return render(request, 'profiles/generate_report.html', context)
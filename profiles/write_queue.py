@@ -0,0 +1,96 @@
+"""
+Очередь коротких записей в SQLite.
+
+SQLite допускает одного писателя на файл. Когда несколько потоков воркера
+одновременно открывают транзакции записи, проигравшие крутятся в
+busy-обработчике и под нагрузкой получают "database is locked".
+Короткие записи (синхронизация подписок, обновления при входе) встают в
+очередь процесса и выполняются по одной в порядке поступления, каждая в
+своей транзакции; между процессами их разводит busy_timeout.
+"""
+import functools
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+from django.db import transaction
+
+from .metrics import registry
+
+
+class WriteQueue:
+    """FIFO-очередь: вызовы выполняются по одному, в потоке вызывающего"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._waiters = deque()
+        self._owner = None
+        self._depth = 0
+
+    def _acquire(self):
+        me = threading.get_ident()
+        with self._lock:
+            if self._owner == me:
+                # Вложенный вызов из той же записи
+                self._depth += 1
+                return
+            if self._owner is None:
+                self._owner, self._depth = me, 1
+                return
+            turn = threading.Event()
+            self._waiters.append((me, turn))
+        # Очередь передается напрямую следующему ожидающему
+        turn.wait()
+
+    def _release(self):
+        with self._lock:
+            self._depth -= 1
+            if self._depth:
+                return
+            if self._waiters:
+                self._owner, turn = self._waiters.popleft()
+                self._depth = 1
+                turn.set()
+            else:
+                self._owner = None
+
+    def run(self, func, *args, **kwargs):
+        self._acquire()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self._release()
+
+    def pending(self):
+        with self._lock:
+            return len(self._waiters)
+
+
+write_queue = WriteQueue()
+
+
+def serialized_write(operation):
+    """
+    Декоратор: выполняет функцию через очередь записей в отдельной транзакции.
+    При SQLITE_WRITE_QUEUE = False остается только транзакция.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            def write():
+                with transaction.atomic():
+                    return func(*args, **kwargs)
+
+            if not getattr(settings, 'SQLITE_WRITE_QUEUE', True):
+                return write()
+            queued = time.perf_counter()
+
+            def timed_write():
+                registry.observe('identica_write_queue_wait_seconds', {'operation': operation},
+                                 time.perf_counter() - queued)
+                return write()
+
+            return write_queue.run(timed_write)
+        return wrapper
+    return decorator